@@ -14,3 +14,17 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'classcritic.settings')
 
 application = get_asgi_application()
+
+# Faculty and course pages stream live review updates only when served here
+# (see reviews/live.py). Load departments, questions and courses before the first request.
+from django.db import DatabaseError  # noqa: E402
+from reviews import prerender, refdata  # noqa: E402
+
+# Anonymous reads of pre-rendered pages never reach Django (see reviews/prerender.py)
+application = prerender.AsyncStaticPages(application)
+
+try:
+    refdata.warm()
+except DatabaseError:
+    # Not migrated yet; the first request loads it instead
+    pass
@@ -1,6 +1,6 @@
 from pathlib import Path
 from dotenv import load_dotenv
-from decouple import config
+from decouple import Csv, config
 import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,20 +36,29 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'reviews.middleware.MetricsMiddleware',
+    'reviews.middleware.TracingMiddleware',
+    'reviews.middleware.TenantMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'reviews.middleware.StaticFilesMiddleware',
+    'reviews.middleware.CompressionMiddleware',
+    'reviews.middleware.SurrogateKeyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'reviews.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'reviews.middleware.TracingViewMiddleware',
 ]
 
 ROOT_URLCONF = 'classcritic.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with a tracing span around each render
+        'BACKEND': 'reviews.tracing.TracingTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -58,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'reviews.tenants.context',
             ],
         },
     },
@@ -76,6 +86,65 @@ DATABASES = {
     }
 }
 
+# Review Archive
+# manage.py archive_reviews moves reviews older than ARCHIVE_AFTER_DAYS into
+# archive tables. Set ARCHIVE_DATABASE_NAME to keep them in a separate SQLite
+# file (then run: python manage.py migrate --database archive).
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=3 * 365, cast=int)
+ARCHIVE_PAGE_SIZE = config('ARCHIVE_PAGE_SIZE', default=20, cast=int)
+ARCHIVE_DATABASE_NAME = config('ARCHIVE_DATABASE_NAME', default='')
+if ARCHIVE_DATABASE_NAME:
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ARCHIVE_DATABASE_NAME,
+    }
+ARCHIVE_DATABASE = 'archive' if ARCHIVE_DATABASE_NAME else 'default'
+
+# Tenants
+# Each university is a tenant with its own database, chosen by host name.
+# TENANTS lists name:hosts:email domains entries separated by ';', several
+# hosts or domains separated by '|', e.g.
+#   ewu:ewu.classcritic.com|localhost:std.ewubd.edu;nsu:nsu.classcritic.com:northsouth.edu
+# The first tenant uses the 'default' database; the others get
+# db_<name>.sqlite3 in TENANT_DATABASE_DIR. A '*' host answers unknown hosts.
+# Management commands act on TENANT (default: the first tenant); run one for
+# every tenant with: python manage.py tenant_command <command>
+TENANT_DATABASE_DIR = config('TENANT_DATABASE_DIR', default=str(BASE_DIR))
+TENANTS = {}
+for tenant_index, tenant_entry in enumerate(config('TENANTS', default='ewu:*:std.ewubd.edu').split(';')):
+    tenant_name, tenant_hosts, tenant_domains = (part.strip() for part in tenant_entry.split(':'))
+    tenant_database = 'default' if tenant_index == 0 else f'tenant_{tenant_name}'
+    if tenant_database != 'default':
+        DATABASES[tenant_database] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': Path(TENANT_DATABASE_DIR) / f'db_{tenant_name}.sqlite3',
+        }
+    TENANTS[tenant_name] = {
+        'HOSTS': tenant_hosts.split('|'),
+        'EMAIL_DOMAINS': tenant_domains.split('|'),
+        'DATABASE': tenant_database,
+    }
+TENANT = config('TENANT', default='')
+# Archived reviews first, then everything else to the active tenant's database
+DATABASE_ROUTERS = ['reviews.routers.ArchiveRouter', 'reviews.routers.TenantRouter']
+
+
+# Cache
+# The wrapper reports hit/miss counts to /metrics; OPTIONS['BACKEND'] is the real cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'reviews.metrics.InstrumentedCache',
+        'LOCATION': config('CACHE_LOCATION', default='classcritic'),
+        'ALIAS': 'default',
+        # Keys include the active tenant's name
+        'KEY_FUNCTION': 'reviews.tenants.make_key',
+        'OPTIONS': {
+            'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -112,6 +181,21 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic fingerprints, minifies and precompresses (gzip/brotli) assets;
+# StaticFilesMiddleware then serves them with far-future immutable caching.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'reviews.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Cache lifetime (seconds) for static files that aren't fingerprinted
+STATIC_MAX_AGE = config('STATIC_MAX_AGE', default=60, cast=int)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -122,6 +206,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Configure via .env file
 # Set EMAIL_BACKEND=smtp in .env to use Gmail SMTP
 # Set EMAIL_BACKEND=console in .env to print emails in console (for testing)
+# Set EMAIL_BACKEND=file in .env to write emails to EMAIL_FILE_PATH (for load tests)
 
 email_backend_type = config('EMAIL_BACKEND', default='console').strip()
 
@@ -142,6 +227,10 @@ if email_backend_type == 'smtp':
             'Falling back to console backend. Please configure SMTP settings in .env file.'
         )
         EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+elif email_backend_type == 'file':
+    # Write emails to files, e.g. so the load test can read OTPs
+    EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+    EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
 else:
     # Console backend for development/testing
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -149,7 +238,166 @@ else:
 DEFAULT_FROM_EMAIL = config(
     'DEFAULT_FROM_EMAIL', default='noreply@classcritic.com')
 
+# Response Compression
+# Dynamic responses are compressed with brotli (if installed) or gzip
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=200, cast=int)
+COMPRESSION_LEVEL = config('COMPRESSION_LEVEL', default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+# Strip comments and indentation from rendered HTML before compressing
+HTML_MINIFY = config('HTML_MINIFY', default=False, cast=bool)
+
+# Shared Reverse-Proxy Cache
+# Pages carry surrogate keys (faculty-<id>, course-<id>, department-<id>,
+# departments) and anonymous responses may be cached by the proxy. Affected
+# keys are purged on review submission and admin edits.
+SURROGATE_KEY_HEADER = config('SURROGATE_KEY_HEADER', default='Surrogate-Key')
+SURROGATE_CACHE_MAX_AGE = config('SURROGATE_CACHE_MAX_AGE', default=3600, cast=int)
+CACHE_PURGE = {
+    # reviews.purge.NullPurgeBackend, RecordingPurgeBackend or HTTPPurgeBackend
+    'BACKEND': config('CACHE_PURGE_BACKEND', default='reviews.purge.NullPurgeBackend'),
+    'OPTIONS': {
+        'url': config('CACHE_PURGE_URL', default=''),
+    },
+}
+
+# On-demand Profiling
+# Staff can add ?__profile=cprofile (or =sample) to a URL, or send an
+# X-Profile header, to capture that request. Captures are kept in a ring of
+# PROFILE_RING_SIZE entries and browsed at /staff/profiles/.
+PROFILE_DIR = config('PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILE_RING_SIZE = config('PROFILE_RING_SIZE', default=50, cast=int)
+PROFILE_SAMPLE_INTERVAL = config('PROFILE_SAMPLE_INTERVAL', default=0.001, cast=float)
+PROFILE_TRACEMALLOC_FRAMES = config('PROFILE_TRACEMALLOC_FRAMES', default=10, cast=int)
+
+# Metrics
+# Prometheus exposition at /metrics. Set the PROMETHEUS_MULTIPROC_DIR environment
+# variable when running several worker processes (see reviews/metrics.py).
+# Comma-separated client IPs allowed to scrape; empty allows everyone.
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+
+# Stale-While-Revalidate
+# While the database is overloaded (query latency EWMA above the threshold, or
+# within STALE_LOCK_COOLDOWN seconds of a "database is locked" error) the home
+# and faculty pages are served from their last good render, at most
+# STALE_PAGE_MAX_AGE seconds old, and refreshed by one background render.
+# Normal renders update the kept copy at most every STALE_PAGE_REFRESH_INTERVAL
+# seconds. Copies are per worker process unless CACHE_BACKEND is shared.
+STALE_DB_LATENCY_THRESHOLD = config('STALE_DB_LATENCY_THRESHOLD', default=0.25, cast=float)
+STALE_LOCK_COOLDOWN = config('STALE_LOCK_COOLDOWN', default=15, cast=float)
+STALE_PAGE_MAX_AGE = config('STALE_PAGE_MAX_AGE', default=3600, cast=int)
+STALE_REFRESH_TIMEOUT = config('STALE_REFRESH_TIMEOUT', default=30, cast=int)
+STALE_PAGE_REFRESH_INTERVAL = config('STALE_PAGE_REFRESH_INTERVAL', default=60, cast=int)
+
+# Tracing
+# A SAMPLE_RATE fraction of requests (and any request arriving with a sampled
+# W3C traceparent header) is traced: view, DB query, template and email spans
+# are exported by EXPORTER in the background.
+TRACING = {
+    'SAMPLE_RATE': config('TRACE_SAMPLE_RATE', default=0.0, cast=float),
+    # reviews.tracing.JSONLExporter (local file) or reviews.tracing.OTLPExporter (collector)
+    'EXPORTER': config('TRACE_EXPORTER', default='reviews.tracing.JSONLExporter'),
+    'OPTIONS': {
+        'path': config('TRACE_FILE', default=str(BASE_DIR / 'traces' / 'spans.jsonl')),
+        'url': config('TRACE_OTLP_URL', default='http://127.0.0.1:4318/v1/traces'),
+    },
+}
+
+# Reference Data
+# Departments, questions and courses are cached in each worker process. Admin
+# edits rewrite REFDATA_VERSION_FILE, which every process checks at most once
+# per REFDATA_CHECK_INTERVAL seconds; it must be shared by all workers.
+REFDATA_VERSION_FILE = config('REFDATA_VERSION_FILE', default=str(BASE_DIR / '.refdata-version'))
+REFDATA_CHECK_INTERVAL = config('REFDATA_CHECK_INTERVAL', default=1.0, cast=float)
+
+# Review Search
+SEARCH_PAGE_SIZE = config('SEARCH_PAGE_SIZE', default=50, cast=int)
+# Facet counts are cached per filter combination (and dropped when reviews change)
+SEARCH_FACET_CACHE_TIMEOUT = config('SEARCH_FACET_CACHE_TIMEOUT', default=300, cast=int)
+
+# Write-behind Review Submissions
+# With WRITE_BEHIND on, submitted reviews are appended to a journal in
+# WRITE_BEHIND_DIR and acknowledged at once, then saved by a background
+# thread every WRITE_BEHIND_INTERVAL seconds in batches of up to
+# WRITE_BEHIND_BATCH_SIZE (one transaction each). Journals of crashed
+# processes are replayed on the next start or with manage.py replay_review_journal.
+WRITE_BEHIND = config('WRITE_BEHIND', default=False, cast=bool)
+WRITE_BEHIND_DIR = config('WRITE_BEHIND_DIR', default=str(BASE_DIR / 'journal'))
+WRITE_BEHIND_INTERVAL = config('WRITE_BEHIND_INTERVAL', default=0.005, cast=float)
+WRITE_BEHIND_BATCH_SIZE = config('WRITE_BEHIND_BATCH_SIZE', default=500, cast=int)
+# fsync each journal append; turning it off risks losing the last reviews on power loss
+WRITE_BEHIND_FSYNC = config('WRITE_BEHIND_FSYNC', default=True, cast=bool)
+# Failed saves of an entry (other than a locked database) before it moves to dead-letter.jsonl
+WRITE_BEHIND_MAX_ATTEMPTS = config('WRITE_BEHIND_MAX_ATTEMPTS', default=5, cast=int)
+
+# Pre-rendered Pages
+# With PRERENDER on, anonymous views of the home, course list, faculty and
+# course pages are answered from HTML files in PRERENDER_DIR before Django
+# runs. Build them with manage.py prerender --all (e.g. on deploy) and keep
+# manage.py prerender --watch running to regenerate pages as reviews arrive.
+PRERENDER = config('PRERENDER', default=False, cast=bool)
+PRERENDER_DIR = config('PRERENDER_DIR', default=str(BASE_DIR / 'prerendered'))
+
+# Live Review Updates
+# With LIVE_UPDATES on and the site served over ASGI (e.g. uvicorn
+# classcritic.asgi:application), faculty and course pages receive new reviews
+# and averages as Server-Sent Events. Streams send a comment every HEARTBEAT
+# seconds and end after about MAX_AGE seconds, when the browser reconnects.
+LIVE_UPDATES = config('LIVE_UPDATES', default=False, cast=bool)
+LIVE_UPDATES_BROKER = {
+    # reviews.live.LocalBroker (one worker process) or reviews.live.SocketBroker
+    # (several workers; run manage.py live_broker at ADDRESS)
+    'BACKEND': config('LIVE_UPDATES_BROKER', default='reviews.live.LocalBroker'),
+    'OPTIONS': {
+        'address': config('LIVE_UPDATES_BROKER_ADDRESS', default='127.0.0.1:7071'),
+    },
+}
+LIVE_UPDATES_HEARTBEAT = config('LIVE_UPDATES_HEARTBEAT', default=15, cast=int)
+LIVE_UPDATES_MAX_AGE = config('LIVE_UPDATES_MAX_AGE', default=300, cast=int)
+
+# Analytics Snapshots
+# Written by manage.py export_snapshot (Parquet or Arrow IPC, needs pyarrow)
+SNAPSHOT_DIR = config('SNAPSHOT_DIR', default=str(BASE_DIR / 'snapshots'))
+
+# Analytics Dashboard
+# 'auto' reads the latest snapshot in SNAPSHOT_DIR and falls back to the
+# database; 'snapshot' or 'live' force one source (needs numpy and pyarrow)
+ANALYTICS_SOURCE = config('ANALYTICS_SOURCE', default='auto')
+ANALYTICS_CACHE_TTL = config('ANALYTICS_CACHE_TTL', default=60, cast=int)
+
+# Keyword Summaries
+# Number of "what students mention most" terms kept per faculty/course
+KEYWORD_SUMMARY_SIZE = config('KEYWORD_SUMMARY_SIZE', default=10, cast=int)
+
+# Similar Faculty
+# Recommendations kept per faculty member by manage.py refresh_similar_faculty
+SIMILAR_FACULTY_COUNT = config('SIMILAR_FACULTY_COUNT', default=5, cast=int)
+
+# Academic Terms
+# Term start dates (Name:MM-DD, in TIME_ZONE) used to bucket reviews for the
+# rating trend charts. Run manage.py backfill_term_scores after changing them.
+ACADEMIC_TERMS = config('ACADEMIC_TERMS', default='Spring:01-01,Summer:05-01,Fall:09-01')
+
+# Faculty Comparison
+COMPARE_MAX_FACULTY = config('COMPARE_MAX_FACULTY', default=5, cast=int)
+COMPARE_RECENT_REVIEWS = config('COMPARE_RECENT_REVIEWS', default=3, cast=int)
+# Comparisons are cached per faculty set (and dropped when their reviews change)
+COMPARE_CACHE_TIMEOUT = config('COMPARE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Ratings Lookup API
+# /api/ratings/?faculty=<name or email>&course=<code>&... answers many lookups
+# in one JSON response (used by the course-registration browser extension)
+LOOKUP_MAX_ITEMS = config('LOOKUP_MAX_ITEMS', default=300, cast=int)
+LOOKUP_TOP_TAGS = config('LOOKUP_TOP_TAGS', default=3, cast=int)
+
 # Logging Configuration
+# Records go through a bounded in-memory queue to a background writer thread,
+# so a slow log sink never blocks requests; when the queue is full records are
+# dropped and counted. Repeated identical warnings/errors are rate limited.
+LOG_FORMAT = config('LOG_FORMAT', default='json')  # 'json' or 'verbose'
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+LOG_RATE_LIMIT_BURST = config('LOG_RATE_LIMIT_BURST', default=5, cast=int)
+LOG_RATE_LIMIT_PERIOD = config('LOG_RATE_LIMIT_PERIOD', default=60, cast=float)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -158,11 +406,23 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'reviews.log.JSONFormatter',
+        },
+    },
+    'filters': {
+        'rate_limit': {
+            '()': 'reviews.log.RateLimitFilter',
+            'burst': LOG_RATE_LIMIT_BURST,
+            'period': LOG_RATE_LIMIT_PERIOD,
+        },
     },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'class': 'reviews.log.BoundedQueueHandler',
+            'maxsize': LOG_QUEUE_SIZE,
+            'formatter': LOG_FORMAT,
+            'filters': ['rate_limit'],
         },
     },
     'root': {
@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'classcritic.settings')
 
 application = get_wsgi_application()
+
+# Load departments, questions and courses before the first request
+from django.db import DatabaseError  # noqa: E402
+from reviews import prerender, refdata  # noqa: E402
+
+# Anonymous reads of pre-rendered pages never reach Django (see reviews/prerender.py)
+application = prerender.StaticPages(application)
+
+try:
+    refdata.warm()
+except DatabaseError:
+    # Not migrated yet; the first request loads it instead
+    pass
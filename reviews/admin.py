@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import Department, Course, Faculty, Student, Question, Review, CourseReview
+from .models import (
+    Department, Course, Faculty, Student, Question, Review, CourseReview,
+    FacultyKeywordSummary, CourseKeywordSummary, FacultyNeighbors,
+    FacultyQuestionScore, CourseQuestionScore, FacultyTermScore, CourseTermScore,
+    ArchivedReview, ArchivedCourseReview,
+)
 
 
 @admin.register(Department)
@@ -13,6 +18,7 @@ class CourseAdmin(admin.ModelAdmin):
     list_display = ['code', 'name', 'department']
     list_filter = ['department']
     search_fields = ['code', 'name']
+    readonly_fields = ['archived_review_count', 'archived_points']
 
 
 @admin.register(Faculty)
@@ -21,6 +27,7 @@ class FacultyAdmin(admin.ModelAdmin):
     list_filter = ['department', 'designation']
     search_fields = ['name', 'email']
     filter_horizontal = ['courses']
+    readonly_fields = ['archived_review_count', 'archived_points']
 
 
 @admin.register(Student)
@@ -88,3 +95,114 @@ class CourseReviewAdmin(admin.ModelAdmin):
         # Reviews should not be edited
         return False
 
+
+@admin.register(FacultyKeywordSummary)
+class FacultyKeywordSummaryAdmin(admin.ModelAdmin):
+    list_display = ['faculty', 'review_count', 'updated_at']
+    search_fields = ['faculty__name']
+    readonly_fields = ['faculty', 'term_counts', 'top_terms', 'review_count', 'updated_at']
+    
+    def has_add_permission(self, request):
+        # Summaries are maintained from review submissions
+        return False
+
+
+@admin.register(CourseKeywordSummary)
+class CourseKeywordSummaryAdmin(admin.ModelAdmin):
+    list_display = ['course', 'review_count', 'updated_at']
+    search_fields = ['course__code', 'course__name']
+    readonly_fields = ['course', 'term_counts', 'top_terms', 'review_count', 'updated_at']
+    
+    def has_add_permission(self, request):
+        # Summaries are maintained from review submissions
+        return False
+
+
+@admin.register(FacultyNeighbors)
+class FacultyNeighborsAdmin(admin.ModelAdmin):
+    list_display = ['faculty', 'dirty', 'updated_at']
+    list_filter = ['dirty']
+    search_fields = ['faculty__name']
+    readonly_fields = ['faculty', 'tag_counts', 'rating_counts', 'neighbors', 'dirty', 'updated_at']
+    
+    def has_add_permission(self, request):
+        # Maintained from review submissions and refresh_similar_faculty
+        return False
+
+
+@admin.register(FacultyQuestionScore)
+class FacultyQuestionScoreAdmin(admin.ModelAdmin):
+    list_display = ['faculty', 'question', 'count', 'mean']
+    list_filter = ['faculty__department']
+    search_fields = ['faculty__name']
+    readonly_fields = ['faculty', 'question', 'count', 'total']
+    
+    def has_add_permission(self, request):
+        # Rollups are maintained from review submissions
+        return False
+
+
+@admin.register(CourseQuestionScore)
+class CourseQuestionScoreAdmin(admin.ModelAdmin):
+    list_display = ['course', 'question', 'count', 'mean']
+    list_filter = ['course__department']
+    search_fields = ['course__code', 'course__name']
+    readonly_fields = ['course', 'question', 'count', 'total']
+    
+    def has_add_permission(self, request):
+        # Rollups are maintained from review submissions
+        return False
+
+
+@admin.register(FacultyTermScore)
+class FacultyTermScoreAdmin(admin.ModelAdmin):
+    list_display = ['faculty', 'term', 'count', 'total']
+    search_fields = ['faculty__name']
+    readonly_fields = ['faculty', 'term_start', 'term', 'count', 'total']
+    
+    def has_add_permission(self, request):
+        # Rollups are maintained from review submissions
+        return False
+
+
+@admin.register(CourseTermScore)
+class CourseTermScoreAdmin(admin.ModelAdmin):
+    list_display = ['course', 'term', 'count', 'total']
+    search_fields = ['course__code', 'course__name']
+    readonly_fields = ['course', 'term_start', 'term', 'count', 'total']
+    
+    def has_add_permission(self, request):
+        # Rollups are maintained from review submissions
+        return False
+
+
+@admin.register(ArchivedReview)
+class ArchivedReviewAdmin(admin.ModelAdmin):
+    list_display = ['faculty', 'points', 'is_anonymous', 'created_at', 'archived_at']
+    list_filter = ['is_anonymous', 'points']
+    search_fields = ['description']
+    raw_id_fields = ['faculty', 'student', 'question']
+    
+    def has_add_permission(self, request):
+        # Filled by archive_reviews
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        # Archived reviews should not be edited
+        return False
+
+
+@admin.register(ArchivedCourseReview)
+class ArchivedCourseReviewAdmin(admin.ModelAdmin):
+    list_display = ['course', 'points', 'is_anonymous', 'created_at', 'archived_at']
+    list_filter = ['is_anonymous', 'points']
+    search_fields = ['description']
+    raw_id_fields = ['course', 'student', 'question']
+    
+    def has_add_permission(self, request):
+        # Filled by archive_reviews
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        # Archived reviews should not be edited
+        return False
@@ -0,0 +1,176 @@
+"""
+Vectorized rating analytics for the staff dashboard.
+
+Review points, groups, tags and timestamps are loaded as columnar arrays
+(from the latest ``export_snapshot`` snapshot, or straight from the
+database) and every statistic is computed with numpy over whole arrays:
+points are integers 0-10, so per-group means, medians and percentiles all
+come from one ``bincount`` histogram per grouping, and monthly volumes
+and tag frequencies from 2-D ``bincount``s. Results are cached for
+ANALYTICS_CACHE_TTL seconds.
+"""
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import refdata, snapshot, tenants
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+MAX_POINTS = 10
+PERCENTILES = (10, 25, 50, 75, 90)
+TREND_MONTHS = 12
+KINDS = {'faculty': 'reviews', 'course': 'course_reviews'}
+
+
+def load_table(kind):
+    """(review table, description of where it came from)"""
+    name = KINDS[kind]
+    source = getattr(settings, 'ANALYTICS_SOURCE', 'auto')
+    directory = tenants.scoped(getattr(settings, 'SNAPSHOT_DIR', ''))
+    manifest = snapshot.read_manifest(directory) if source != 'live' and os.path.isdir(directory) else None
+    if manifest is not None:
+        table = snapshot.read_table(directory, name, columns=['department_id', 'designation', 'points', 'tags', 'created_at'])
+        return table, f"snapshot as of {manifest['watermark'][:19].replace('T', ' ')} UTC"
+    if source == 'snapshot':
+        raise FileNotFoundError(f'No snapshot in {directory}; run manage.py export_snapshot')
+    return snapshot.live_table(name), 'live database'
+
+
+def _combined(column):
+    return column.combine_chunks() if hasattr(column, 'combine_chunks') else column
+
+
+def _codes(column):
+    """Group codes (0 for rows without a group, labels[i - 1] for code i) and labels"""
+    column = _combined(column)
+    if not hasattr(column.type, 'value_type'):
+        # Hash-encode plain id columns instead of sorting them with np.unique
+        column = column.dictionary_encode()
+    codes = column.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int32) + 1
+    return codes, column.dictionary.to_pylist()
+
+
+def _month_bins(created_at, first_month):
+    """Trend column of each timestamp: 1..TREND_MONTHS inside the window, 0 before it"""
+    edges = np.arange(first_month, first_month + TREND_MONTHS + 1).astype('datetime64[M]').astype('datetime64[us]')
+    values = _combined(created_at).cast(pa.int64()).fill_null(0).to_numpy(zero_copy_only=False)
+    # Thirteen month boundaries; a binary search is far cheaper than
+    # converting every timestamp to a calendar month
+    bins = np.searchsorted(edges.astype(np.int64), values, side='right').astype(np.int32)
+    bins[bins > TREND_MONTHS] = 0
+    return bins
+
+
+def grouped_stats(codes, points, groups):
+    """Count, mean and percentiles of points per group code, from one 2-D histogram"""
+    bins = MAX_POINTS + 1
+    histogram = np.bincount(codes * bins + points, minlength=groups * bins).reshape(groups, bins)
+    counts = histogram.sum(axis=1)
+    sums = histogram @ np.arange(bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    cumulative = histogram.cumsum(axis=1)
+    percentiles = {}
+    for q in PERCENTILES:
+        # Nearest-rank percentile: first point value whose cumulative count reaches q%
+        rank = np.ceil(counts * q / 100).clip(min=1)[:, None]
+        percentiles[q] = np.argmax(cumulative >= rank, axis=1)
+    return counts, means, percentiles
+
+
+def monthly_counts(codes, months, groups):
+    """Reviews per group code per trend month (column 0 collects older reviews)"""
+    columns = TREND_MONTHS + 1
+    return np.bincount(codes * columns + months, minlength=groups * columns).reshape(groups, columns)
+
+
+def tag_monthly_counts(tags, months):
+    """(tag labels, occurrences per tag per trend month)"""
+    tags = _combined(tags)
+    flat = tags.flatten()
+    if not hasattr(flat.type, 'value_type') or not len(flat.dictionary):
+        return [], np.zeros((0, TREND_MONTHS), dtype=np.int64)
+    codes = flat.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int32) + 1
+    rows = pc.list_parent_indices(tags).to_numpy(zero_copy_only=False)
+    labels = flat.dictionary.to_pylist()
+    return labels, monthly_counts(codes, months[rows], len(labels) + 1)[1:, 1:]
+
+
+def _month_label(month_number):
+    return str(np.datetime64(int(month_number), 'M'))
+
+
+def sparkline(values, width=120, height=24):
+    """SVG polyline points for a small trend chart"""
+    peak = max(max(values), 1)
+    step = width / max(len(values) - 1, 1)
+    return ' '.join(f'{i * step:.1f},{height - v / peak * height:.1f}' for i, v in enumerate(values))
+
+
+def compute(table, department_names):
+    points = _combined(table.column('points')).fill_null(0).to_numpy(zero_copy_only=False).astype(np.int32)
+    latest = pc.max(table.column('created_at')).value
+    if latest is None:
+        last_month = int(np.datetime64('now', 'M').astype(np.int64))
+    else:
+        last_month = int(np.datetime64(latest, 'us').astype('datetime64[M]').astype(np.int64))
+    first_month = last_month - TREND_MONTHS + 1
+    months = _month_bins(table.column('created_at'), first_month)
+
+    result = {
+        'total': int(len(points)),
+        'mean': round(float(points.mean()), 2) if len(points) else None,
+        'months': [_month_label(first_month + i) for i in range(TREND_MONTHS)],
+    }
+
+    for name, column in (('departments', 'department_id'), ('designations', 'designation')):
+        codes, labels = _codes(table.column(column))
+        if name == 'departments':
+            labels = [department_names.get(label, f'Department {label}') for label in labels]
+        groups = len(labels) + 1
+        counts, means, percentiles = grouped_stats(codes, points, groups)
+        trend = monthly_counts(codes, months, groups)[:, 1:]
+        rows = []
+        # Code 0 holds rows without a department or designation
+        for i in np.argsort(-counts[1:], kind='stable') + 1:
+            if not counts[i]:
+                continue
+            monthly = trend[i].tolist()
+            rows.append({
+                'name': labels[i - 1],
+                'count': int(counts[i]),
+                'mean': round(float(means[i]), 2),
+                'percentiles': {f'p{q}': int(percentiles[q][i]) for q in PERCENTILES},
+                'monthly': monthly,
+                'sparkline': sparkline(monthly),
+            })
+        result[name] = rows
+
+    labels, trend = tag_monthly_counts(table.column('tags'), months)
+    result['tags'] = sorted((
+        {'name': label, 'total': int(trend[i].sum()), 'monthly': trend[i].tolist(), 'sparkline': sparkline(trend[i].tolist())}
+        for i, label in enumerate(labels)
+    ), key=lambda row: -row['total'])
+    return result
+
+
+def dashboard(kind='faculty'):
+    """Dashboard statistics for faculty or course reviews, cached briefly"""
+    if np is None:
+        raise RuntimeError('numpy and pyarrow are required for analytics')
+    key = f'analytics-dashboard:{kind}'
+    result = cache.get(key)
+    if result is None:
+        table, source = load_table(kind)
+        result = compute(table, {d.id: d.name for d in refdata.departments()})
+        result['source'] = source
+        result['kind'] = kind
+        cache.set(key, result, getattr(settings, 'ANALYTICS_CACHE_TTL', 60))
+    return result
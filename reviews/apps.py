@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ReviewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reviews'
+    
+    def ready(self):
+        # Register signal handlers that maintain precomputed review data
+        from . import signals  # noqa: F401
+        # Watch database latency and lock errors for stale page serving
+        from . import stale  # noqa: F401
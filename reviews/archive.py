@@ -0,0 +1,133 @@
+"""
+Archival of old reviews.
+
+``archive_reviews`` moves reviews older than ARCHIVE_AFTER_DAYS out of the
+hot Review/CourseReview tables into ArchivedReview/ArchivedCourseReview (in
+ARCHIVE_DATABASE), oldest first, in batches. Each batch copies the rows to
+the archive, then in one transaction on the hot database adds them to the
+faculty's or course's archived_review_count/archived_points and deletes the
+originals. A batch interrupted after the copy is simply redone: the copy
+skips rows already archived. The rollups (keywords, question and term
+scores, similar faculty profiles) keep counting archived reviews, because
+the review signals ignore deletions made while ``is_archiving()`` and their
+rebuilds read both tables.
+
+Pages read only the hot tables; archived reviews are queried when someone
+opens the "older reviews" pages.
+"""
+import heapq
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import F
+from django.utils import timezone
+
+from . import refdata, tenants
+from .models import ArchivedCourseReview, ArchivedReview, Course, CourseReview, Faculty, Review, Student
+
+COPIED_FIELDS = ('id', 'student_id', 'question_id', 'description', 'points', 'tags', 'is_anonymous', 'created_at')
+
+_archiving = ContextVar('archiving', default=False)
+
+
+def is_archiving():
+    """True while archive_batch deletes the reviews it has archived"""
+    return _archiving.get()
+
+
+@contextmanager
+def archiving():
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def sources():
+    """(name, hot model, archive model, owner field, owner model) of each review table"""
+    return [
+        ('reviews', Review, ArchivedReview, 'faculty_id', Faculty),
+        ('course reviews', CourseReview, ArchivedCourseReview, 'course_id', Course),
+    ]
+
+
+def archive_of(review_model):
+    """The table review_model's reviews are archived to (ArchivedReview or ArchivedCourseReview)"""
+    return next(archived for _, hot, archived, _, _ in sources() if hot is review_model)
+
+
+def owner_rows(review_model, owner_field, *fields, chunk_size=2000):
+    """
+    (owner id, *fields) of every review, hot and archived, streamed in owner order.
+
+    Rebuilt rollups must count archived reviews too, as the signals do. The
+    two tables may be in different databases, so each is read on its own and
+    the sorted streams are merged.
+    """
+    return heapq.merge(*(
+        model.objects.order_by(owner_field).values_list(owner_field, *fields).iterator(chunk_size=chunk_size)
+        for model in (review_model, archive_of(review_model))
+    ), key=itemgetter(0))
+
+
+def cutoff(days=None):
+    """Reviews created before this moment are archived"""
+    days = days if days is not None else getattr(settings, 'ARCHIVE_AFTER_DAYS', 3 * 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(review_model, archive_model, owner_field, owner_model, before, batch_size=1000):
+    """
+    Archive up to batch_size reviews created before ``before``.
+
+    Returns (reviews moved, faculty or course ids affected), or None when
+    there is nothing left to archive.
+    """
+    rows = list(review_model.objects.filter(created_at__lt=before)
+                .order_by('created_at', 'id')
+                .values(owner_field, *COPIED_FIELDS)[:batch_size])
+    if not rows:
+        return None
+    archive_model.objects.bulk_create([archive_model(**row) for row in rows], ignore_conflicts=True)
+
+    ids = [row['id'] for row in rows]
+    totals = defaultdict(lambda: [0, 0])
+    with archiving(), tenants.atomic():
+        # Re-read under lock: only reviews still present are counted and deleted
+        present = list(review_model.objects.select_for_update().filter(id__in=ids)
+                       .values_list('id', owner_field, 'points'))
+        for _, owner_id, points in present:
+            totals[owner_id][0] += 1
+            totals[owner_id][1] += points
+        for owner_id, (count, points) in totals.items():
+            owner_model.objects.filter(id=owner_id).update(
+                archived_review_count=F('archived_review_count') + count,
+                archived_points=F('archived_points') + points,
+            )
+        review_model.objects.filter(id__in=[row[0] for row in present]).delete()
+
+    # Reviews deleted by someone else between the copy and the lock
+    gone = set(ids) - {row[0] for row in present}
+    if gone:
+        archive_model.objects.filter(id__in=gone).delete()
+    return len(present), set(totals)
+
+
+def archived_page(archive_model, page_number, **owner):
+    """A page of one faculty member's or course's archived reviews, newest first"""
+    reviews = archive_model.objects.filter(**owner).order_by('-created_at', '-id')
+    page = Paginator(reviews, getattr(settings, 'ARCHIVE_PAGE_SIZE', 20)).get_page(page_number)
+    # Students live in the main database; look the page's authors up in one query
+    student_ids = {review.student_id for review in page if review.student_id and not review.is_anonymous}
+    names = dict(Student.objects.filter(id__in=student_ids).values_list('id', 'name'))
+    for review in page:
+        review.author = None if review.is_anonymous else names.get(review.student_id, 'Unknown')
+        question = refdata.get('question', review.question_id)
+        review.question_text = question.text if question else ''
+    return page
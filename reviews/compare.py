@@ -0,0 +1,135 @@
+"""
+Side-by-side faculty comparison.
+
+Everything the comparison page shows for up to COMPARE_MAX_FACULTY faculty
+members comes from five queries however many are compared: the faculty
+rows, their courses, review counts/averages/tag counts in one grouped
+query, the rating distribution in another, and the latest reviews of each
+via a window function. Archived reviews count towards the totals, the
+distribution and the tags, at two more grouped queries on the archive when
+anyone compared has some. The result is cached per sorted id set and keyed on
+the department change stamps, which every review write bumps.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Sum, Window
+from django.db.models.functions import RowNumber
+
+from . import refdata
+from .models import ArchivedReview, Faculty, Review
+from .search import tag_q
+
+MAX_POINTS = 10
+
+
+def max_faculty():
+    return getattr(settings, 'COMPARE_MAX_FACULTY', 5)
+
+
+def parse_ids(value):
+    """The first COMPARE_MAX_FACULTY unique faculty ids of a "1,2,3" parameter, sorted"""
+    ids = dict.fromkeys(int(part) for part in value.replace(' ', '').split(',') if part.isdigit())
+    return sorted(list(ids)[:max_faculty()])
+
+
+def _version(ids):
+    """Changes when a review or faculty member in any of these departments changes"""
+    rows = Faculty.objects.filter(id__in=ids).order_by('id').values_list('id', 'department__change_stamp__version')
+    return '.'.join(f'{faculty_id}-{version or 0}' for faculty_id, version in rows)
+
+
+def compute(ids):
+    faculty = list(Faculty.objects.filter(id__in=ids).select_related('department').order_by('id'))
+    if not faculty:
+        return []
+    found = [f.id for f in faculty]
+
+    courses = {}
+    for faculty_id, code, name in (Faculty.courses.through.objects.filter(faculty_id__in=found)
+                                   .order_by('course__code')
+                                   .values_list('faculty_id', 'course__code', 'course__name')):
+        courses.setdefault(faculty_id, []).append({'code': code, 'name': name})
+
+    tags = refdata.tag_names(Review)
+    stats = {f: {'count': 0, 'total': 0, 'tags': [0] * len(tags)} for f in found}
+    distributions = {f: [0] * (MAX_POINTS + 1) for f in found}
+    # Archived reviews count too, as on the faculty page; the archive may be another database
+    archived = [f.id for f in faculty if f.archived_review_count]
+    for model, owner_ids in ((Review, found), (ArchivedReview, archived)):
+        if not owner_ids:
+            continue
+        for row in (model.objects.filter(faculty_id__in=owner_ids)
+                    .values('faculty_id')
+                    .annotate(
+                        count=Count('id'),
+                        total=Sum('points'),
+                        **{f'tag_{i}': Count('id', filter=tag_q(tag)) for i, tag in enumerate(tags)},
+                    )
+                    .order_by()):
+            entry = stats[row['faculty_id']]
+            entry['count'] += row['count']
+            entry['total'] += row['total'] or 0
+            entry['tags'] = [n + row[f'tag_{i}'] for i, n in enumerate(entry['tags'])]
+        for faculty_id, points, count in (model.objects.filter(faculty_id__in=owner_ids)
+                                          .values('faculty_id', 'points')
+                                          .annotate(count=Count('id'))
+                                          .order_by()
+                                          .values_list('faculty_id', 'points', 'count')):
+            if 0 <= points <= MAX_POINTS:
+                distributions[faculty_id][points] += count
+
+    recent = {}
+    latest = (Review.objects.filter(faculty_id__in=found)
+              .annotate(rank=Window(RowNumber(), partition_by=F('faculty_id'), order_by=F('created_at').desc()))
+              .filter(rank__lte=getattr(settings, 'COMPARE_RECENT_REVIEWS', 3))
+              .order_by('faculty_id', 'rank')
+              .values('faculty_id', 'points', 'description', 'tags', 'is_anonymous', 'created_at',
+                      'question_id', 'student__name'))
+    for row in latest:
+        question = refdata.get('question', row['question_id'])
+        recent.setdefault(row['faculty_id'], []).append({
+            'author': None if row['is_anonymous'] else row['student__name'],
+            'points': row['points'],
+            'description': row['description'],
+            'tags': row['tags'],
+            'question': question.text if question else '',
+            'created_at': row['created_at'],
+        })
+
+    # Courses everyone compared teaches
+    shared = set.intersection(*(set(c['code'] for c in courses.get(f, [])) for f in found)) if len(found) > 1 else set()
+    columns = []
+    for f in faculty:
+        count, total = stats[f.id]['count'], stats[f.id]['total']
+        distribution = distributions[f.id]
+        peak = max(max(distribution), 1)
+        columns.append({
+            'id': f.id,
+            'name': f.name,
+            'designation': f.designation,
+            'department': f.department.name,
+            'department_id': f.department_id,
+            'count': count,
+            'average': round(total / count, 2) if count else None,
+            'distribution': [
+                {'points': points, 'count': n, 'percent': round(100 * n / peak)}
+                for points, n in enumerate(distribution)
+            ],
+            'tags': sorted(
+                ([tag, n] for tag, n in zip(tags, stats[f.id]['tags']) if n),
+                key=lambda item: (-item[1], item[0]),
+            ),
+            'courses': [dict(course, shared=course['code'] in shared) for course in courses.get(f.id, [])],
+            'recent': recent.get(f.id, []),
+        })
+    return columns
+
+
+def get_comparison(ids):
+    """Comparison columns for these faculty ids, cached until their reviews change"""
+    key = 'compare:{}:{}'.format(','.join(map(str, ids)), _version(ids))
+    columns = cache.get(key)
+    if columns is None:
+        columns = compute(ids)
+        cache.set(key, columns, getattr(settings, 'COMPARE_CACHE_TIMEOUT', 300))
+    return columns
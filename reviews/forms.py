@@ -1,8 +1,63 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from . import refdata, tenants
 from .models import Student, Review, CourseReview, validate_student_email
 
 
+class ReferenceChoiceIterator:
+    """Choices read from the reference data each time the field is rendered"""
+    
+    def __init__(self, field):
+        self.field = field
+    
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.objects():
+            yield (obj.pk, self.field.label_from_instance(obj))
+    
+    def __len__(self):
+        return len(self.field.objects()) + (self.field.empty_label is not None)
+    
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.objects())
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField whose choices come from the in-memory reference data"""
+    kind = None
+    
+    def objects(self):
+        return getattr(refdata, self.kind + 's')()
+    
+    def _get_choices(self):
+        # Lazy, like ModelChoiceIterator: forms are built at import time,
+        # before the database may even exist
+        return ReferenceChoiceIterator(self)
+    
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = refdata.get(self.kind, value.pk if hasattr(value, 'pk') else value)
+        if obj is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return obj
+
+
+class QuestionChoiceField(ReferenceChoiceField):
+    kind = 'question'
+
+
+class CourseChoiceField(ReferenceChoiceField):
+    kind = 'course'
+
+
 class StudentRegistrationForm(forms.Form):
     """Form for student registration with email validation"""
     name = forms.CharField(
@@ -16,15 +71,21 @@ class StudentRegistrationForm(forms.Form):
         validators=[validate_student_email],
         widget=forms.EmailInput(attrs={
             'class': 'form-input',
-            'placeholder': 'your.name@std.ewubd.edu'
         }),
-        help_text='Must be a valid @std.ewubd.edu email address'
     )
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Domains of the university whose site this is
+        tenant = tenants.current()
+        self.fields['email'].widget.attrs['placeholder'] = f'your.name@{tenant.email_domains[0]}'
+        self.fields['email'].help_text = f'Must be a valid {tenant.email_hint} email address'
+    
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if email and not email.endswith('@std.ewubd.edu'):
-            raise ValidationError('Only @std.ewubd.edu email addresses are allowed.')
+        tenant = tenants.current()
+        if email and not tenant.allows_email(email):
+            raise ValidationError(f'Only {tenant.email_hint} email addresses are allowed.')
         return email
 
 
@@ -48,6 +109,7 @@ class ReviewForm(forms.ModelForm):
     class Meta:
         model = Review
         fields = ['faculty', 'question', 'description', 'points', 'tags', 'is_anonymous']
+        field_classes = {'question': QuestionChoiceField}
         widgets = {
             'faculty': forms.Select(attrs={'class': 'form-select'}),
             'question': forms.Select(attrs={'class': 'form-select'}),
@@ -74,9 +136,8 @@ class ReviewForm(forms.ModelForm):
         self.fields['tags'].required = False
         
         # Convert tags to choices for checkbox
-        tag_choices = [(tag[0], tag[0]) for tag in Review.TAG_CHOICES]
         self.fields['tags'] = forms.MultipleChoiceField(
-            choices=tag_choices,
+            choices=refdata.tag_choices(Review),
             widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-checkbox-group'}),
             required=False
         )
@@ -99,6 +160,7 @@ class CourseReviewForm(forms.ModelForm):
     class Meta:
         model = CourseReview
         fields = ['course', 'question', 'description', 'points', 'tags', 'is_anonymous']
+        field_classes = {'course': CourseChoiceField, 'question': QuestionChoiceField}
         widgets = {
             'course': forms.Select(attrs={'class': 'form-select'}),
             'question': forms.Select(attrs={'class': 'form-select'}),
@@ -125,9 +187,8 @@ class CourseReviewForm(forms.ModelForm):
         self.fields['tags'].required = False
         
         # Convert tags to choices for checkbox
-        tag_choices = [(tag[0], tag[0]) for tag in CourseReview.TAG_CHOICES]
         self.fields['tags'] = forms.MultipleChoiceField(
-            choices=tag_choices,
+            choices=refdata.tag_choices(CourseReview),
             widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-checkbox-group'}),
             required=False
         )
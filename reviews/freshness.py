@@ -0,0 +1,193 @@
+"""
+Cheap change detection for conditional GET (ETag / Last-Modified).
+
+Detail pages are validated from the entity's review count and latest review
+timestamp, listing pages from per-department change stamps. Both are read in
+a single small query so a ``304 Not Modified`` can be answered without
+running the page's own queries or rendering the template.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from .models import Course, DepartmentChangeStamp, Faculty
+
+
+def bump_departments(department_ids):
+    """Mark everything shown for these departments as changed"""
+    department_ids = {d for d in department_ids if d}
+    if department_ids:
+        DepartmentChangeStamp.objects.filter(department_id__in=department_ids).update(
+            version=F('version') + 1, changed_at=timezone.now()
+        )
+
+
+def ensure_stamp(department):
+    """Create the change stamp of a new department"""
+    DepartmentChangeStamp.objects.get_or_create(department=department)
+
+
+def bump_all_departments():
+    """Mark every department as changed (e.g. a shared question was edited)"""
+    DepartmentChangeStamp.objects.update(version=F('version') + 1, changed_at=timezone.now())
+
+
+_template_token = None
+
+
+def template_token():
+    """Changes whenever the templates are redeployed, so old ETags stop matching"""
+    global _template_token
+    if _template_token is None:
+        digest = hashlib.md5(usedforsecurity=False)
+        template_dir = os.path.join(os.path.dirname(__file__), 'templates')
+        for directory, _, filenames in sorted(os.walk(template_dir)):
+            for filename in sorted(filenames):
+                stat = os.stat(os.path.join(directory, filename))
+                digest.update(f'{filename}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+        _template_token = digest.hexdigest()[:12]
+    return _template_token
+
+
+def _session_variant(request):
+    """Parts of the page that depend on who is looking at it"""
+    if not request.COOKIES.get(settings.SESSION_COOKIE_NAME):
+        return ''
+    return f"{request.session.get('verified_student_id', '')}:{request.session.get('student_name', '')}"
+
+
+def _has_pending_messages(request):
+    # len() looks at stored messages without marking them as read
+    return bool(len(get_messages(request)))
+
+
+def _validators(request, key, load_state):
+    """
+    Return (etag, last_modified) for a page, computed once per request.
+
+    ``load_state`` returns ``(parts, changed_at)`` describing the data shown,
+    or None when the page doesn't exist. condition() asks for the ETag and
+    Last-Modified separately, so the result is cached on the request.
+    """
+    cache = request.__dict__.setdefault('_freshness', {})
+    if key in cache:
+        return cache[key]
+
+    # Flash messages must be rendered, never answered with a 304
+    state = None if _has_pending_messages(request) else load_state()
+    if state is None:
+        cache[key] = (None, None)
+        return cache[key]
+
+    parts, changed_at = state
+    variant = _session_variant(request)
+    raw = '|'.join(str(p) for p in (key, template_token(), variant, request.GET.urlencode(), *parts))
+    etag = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    # Last-Modified can't express per-student variants, so rely on the ETag then
+    cache[key] = (etag, None if variant else changed_at)
+    return cache[key]
+
+
+def _latest(*timestamps):
+    timestamps = [t for t in timestamps if t]
+    return max(timestamps) if timestamps else None
+
+
+def _detail_validators(request, model, object_id, reviews_relation):
+    def load_state():
+        row = (model.objects.filter(id=object_id)
+               .values('department_id')
+               .annotate(
+                   review_count=Count(reviews_relation),
+                   latest_review=Max(f'{reviews_relation}__created_at'),
+                   stamp_version=Max('department__change_stamp__version'),
+                   stamp_changed_at=Max('department__change_stamp__changed_at'),
+               )
+               .order_by('department_id')
+               .first())
+        if row is None:
+            # Let the view raise its usual 404
+            return None
+        parts = (row['review_count'], row['latest_review'], row['stamp_version'])
+        return parts, _latest(row['latest_review'], row['stamp_changed_at'])
+
+    return _validators(request, f'{model._meta.model_name}:{object_id}', load_state)
+
+
+def _listing_validators(request, name):
+    def load_state():
+        stamps = DepartmentChangeStamp.objects.all()
+        department_id = request.GET.get('department', '')
+        if department_id:
+            if not department_id.isdigit():
+                return None
+            stamps = stamps.filter(department_id=department_id)
+        row = stamps.aggregate(count=Count('pk'), version=Sum('version'), changed_at=Max('changed_at'))
+        return (row['count'], row['version']), row['changed_at']
+
+    return _validators(request, name, load_state)
+
+
+def _department_validators(request, department_id):
+    def load_state():
+        row = (DepartmentChangeStamp.objects.filter(department_id=department_id)
+               .values('version', 'changed_at').first())
+        if row is None:
+            return None
+        return (row['version'],), row['changed_at']
+
+    return _validators(request, f'department:{department_id}', load_state)
+
+
+# Validator functions for django.views.decorators.http.condition
+
+def faculty_etag(request, faculty_id):
+    return _detail_validators(request, Faculty, faculty_id, 'reviews')[0]
+
+
+def faculty_last_modified(request, faculty_id):
+    return _detail_validators(request, Faculty, faculty_id, 'reviews')[1]
+
+
+def course_etag(request, course_id):
+    return _detail_validators(request, Course, course_id, 'course_reviews')[0]
+
+
+def course_last_modified(request, course_id):
+    return _detail_validators(request, Course, course_id, 'course_reviews')[1]
+
+
+def home_etag(request):
+    return _listing_validators(request, 'home')[0]
+
+
+def home_last_modified(request):
+    return _listing_validators(request, 'home')[1]
+
+
+def course_list_etag(request):
+    return _listing_validators(request, 'course_list')[0]
+
+
+def course_list_last_modified(request):
+    return _listing_validators(request, 'course_list')[1]
+
+
+def department_etag(request, department_id):
+    return _department_validators(request, department_id)[0]
+
+
+def department_last_modified(request, department_id):
+    return _department_validators(request, department_id)[1]
+
+
+def ratings_lookup_etag(request):
+    return _listing_validators(request, 'ratings_lookup')[0]
+
+
+def ratings_lookup_last_modified(request):
+    return _listing_validators(request, 'ratings_lookup')[1]
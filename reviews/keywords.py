@@ -0,0 +1,115 @@
+"""
+Keyword summaries - "what students mention most" for faculty and courses.
+
+Term counts are kept per faculty/course and updated as reviews arrive, while
+only a short top-k list is read when rendering the detail pages. The
+tokenizing helpers at the top of this module don't touch the database so
+they can run inside worker processes during a full rebuild.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+
+from . import tenants
+
+TOKEN_RE = re.compile(r"[a-z][a-z']+")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because
+been before being below between both but by can could course did do does doing
+done down during each even every few for from get gets got had has have having
+he her here hers him his how i if in into is it its itself just let like made
+make makes many me more most much my no nor not now of off on once only or
+other our out over own really same she should so some such than that the their
+them then there these they this those through to too under until up us very
+was we well were what when where which while who whom why will with would you
+your faculty sir madam mam teacher class classes semester student students
+""".split())
+
+# Upper bound on the number of distinct terms tracked per faculty/course.
+MAX_TRACKED_TERMS = 2000
+
+
+def summary_size():
+    """Number of terms stored in each top-k list"""
+    return getattr(settings, 'KEYWORD_SUMMARY_SIZE', 10)
+
+
+def extract_terms(text):
+    """Return a Counter of unigrams and bigrams found in a review description"""
+    words = [w.strip("'") for w in TOKEN_RE.findall((text or '').lower())]
+    words = [w for w in words if len(w) > 2]
+    terms = Counter(w for w in words if w not in STOPWORDS)
+    for first, second in zip(words, words[1:]):
+        if first not in STOPWORDS and second not in STOPWORDS:
+            terms[f'{first} {second}'] += 1
+    return terms
+
+
+def count_terms(texts):
+    """Sum the term counts of several descriptions"""
+    total = Counter()
+    for text in texts:
+        total.update(extract_terms(text))
+    return total
+
+
+def count_terms_batch(batch):
+    """Worker entry point for rebuilds: [(owner_id, [texts])] -> [(owner_id, counts, n)]"""
+    return [(owner_id, dict(count_terms(texts)), len(texts)) for owner_id, texts in batch]
+
+
+def top_terms(term_counts, k=None):
+    """Compact top-k list of [term, count] pairs, most mentioned first"""
+    k = k or summary_size()
+    ranked = sorted(term_counts.items(), key=lambda item: (-item[1], item[0]))
+    return [[term, count] for term, count in ranked[:k]]
+
+
+def prune_terms(term_counts):
+    """Keep the tracked vocabulary bounded by dropping the rarest terms"""
+    if len(term_counts) <= MAX_TRACKED_TERMS:
+        return term_counts
+    ranked = sorted(term_counts.items(), key=lambda item: (-item[1], item[0]))
+    return dict(ranked[:MAX_TRACKED_TERMS])
+
+
+def _summary_model_for(review):
+    from .models import CourseReview, CourseKeywordSummary, FacultyKeywordSummary
+
+    if isinstance(review, CourseReview):
+        return CourseKeywordSummary, 'course_id', review.course_id
+    return FacultyKeywordSummary, 'faculty_id', review.faculty_id
+
+
+def apply_review(review, sign=1):
+    """Add (sign=1) or remove (sign=-1) a review's terms from its summary row"""
+    model, owner_field, owner_id = _summary_model_for(review)
+    terms = extract_terms(review.description)
+
+    with tenants.atomic():
+        rows = model.objects.select_for_update()
+        if sign > 0:
+            summary, _ = rows.get_or_create(**{owner_field: owner_id})
+        else:
+            # Nothing to subtract from (e.g. the owner itself is being deleted)
+            summary = rows.filter(**{owner_field: owner_id}).first()
+            if summary is None:
+                return
+        counts = summary.term_counts or {}
+        for term, count in terms.items():
+            new_count = counts.get(term, 0) + sign * count
+            if new_count > 0:
+                counts[term] = new_count
+            else:
+                counts.pop(term, None)
+        summary.term_counts = prune_terms(counts)
+        summary.top_terms = top_terms(summary.term_counts)
+        summary.review_count = max(summary.review_count + sign, 0)
+        summary.save()
+
+
+def get_top_terms(model, **owner):
+    """Read only the precomputed top-k list for one faculty/course"""
+    return model.objects.filter(**owner).values_list('top_terms', flat=True).first() or []
@@ -0,0 +1,321 @@
+"""
+Live review updates over Server-Sent Events.
+
+With LIVE_UPDATES on and the site served by an ASGI server (classcritic.asgi,
+e.g. ``uvicorn classcritic.asgi:application``), faculty and course pages
+open an EventSource on their ``events/`` URL. Once a new review's transaction
+commits, the event (the rendered review plus the page's new average and
+count) is built once and published on the page's channel, its surrogate key
+such as ``faculty-3``.
+
+Each process keeps the open streams in a Hub: one small asyncio queue per
+stream, grouped by channel, so an idle stream costs a queue and a timer
+rather than a thread, and publishing costs one hand-off per event loop. The
+broker (LIVE_UPDATES_BROKER) carries events between processes: LocalBroker
+only reaches the publishing process (a single ASGI worker); SocketBroker
+relays them through ``manage.py live_broker``, a local stand-in for a pub/sub
+server such as Redis, to every worker.
+
+Streams end after LIVE_UPDATES_MAX_AGE seconds, or when the browser falls too
+far behind, and EventSource reconnects with the last event id it got; the
+events it missed are replayed from a short per-channel history. Under WSGI
+the event URLs answer 204, which tells EventSource not to reconnect.
+"""
+import asyncio
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+from . import metrics, purge, tenants
+from .models import CourseReview
+
+logger = logging.getLogger(__name__)
+
+# Events a stream may fall behind by before it is closed (the browser reconnects and catches up)
+QUEUE_SIZE = 100
+# Recent events kept per channel for reconnecting browsers, for this many channels
+HISTORY_LENGTH = 20
+HISTORY_CHANNELS = 2000
+# Milliseconds EventSource waits before reconnecting
+RECONNECT_MS = 2000
+# Seconds between attempts to reach the live_broker relay
+BROKER_RETRY_DELAY = 1.0
+
+
+def enabled():
+    return getattr(settings, 'LIVE_UPDATES', False)
+
+
+def since():
+    """Event id position of a page rendered now; its stream replays what arrives later"""
+    return time.time_ns()
+
+
+def encode(event_id, event, data):
+    """One SSE message (JSON keeps the data on a single line)"""
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+class Subscription:
+    """One open stream: a bounded queue owned by the event loop serving it"""
+
+    def __init__(self, channel, loop):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        # Called in self.loop
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+def _deliver(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.put(message)
+
+
+class Hub:
+    """Open streams of this process by channel, and the recent events of each channel"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+        self.history = OrderedDict()
+
+    def subscribe(self, channel, last_event_id=None):
+        """Subscribe the running event loop to a channel, queueing the events after last_event_id"""
+        subscription = Subscription(channel, asyncio.get_running_loop())
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(subscription)
+            missed = [] if last_event_id is None else [
+                message for event_id, message in self.history.get(channel, ()) if event_id > last_event_id
+            ]
+        for message in missed:
+            subscription.put(message)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.channels.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.channels[subscription.channel]
+
+    def dispatch(self, channel, event_id, message):
+        """Fan an encoded event out to the channel's streams; safe to call from any thread"""
+        by_loop = {}
+        with self.lock:
+            recent = self.history.pop(channel, None) or deque(maxlen=HISTORY_LENGTH)
+            recent.append((event_id, message))
+            self.history[channel] = recent
+            while len(self.history) > HISTORY_CHANNELS:
+                self.history.popitem(last=False)
+            for subscription in self.channels.get(channel, ()):
+                by_loop.setdefault(subscription.loop, []).append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriptions, message)
+            except RuntimeError:
+                pass  # the loop was closed (server shutting down)
+
+
+HUB = Hub()
+
+
+class LocalBroker:
+    """Deliver events to the streams of the publishing process only (one ASGI worker)"""
+
+    def __init__(self, **options):
+        pass
+
+    def listen(self):
+        """Make sure events published elsewhere reach this process's hub"""
+
+    def publish(self, channel, event_id, message):
+        HUB.dispatch(channel, event_id, message)
+
+
+class SocketBroker(LocalBroker):
+    """
+    Relay events through ``manage.py live_broker`` so every worker process gets them.
+
+    Each process keeps one connection to the relay: events are published on
+    it, and a background thread reads everything published by any process
+    (its own events included) into the local hub.
+    """
+
+    def __init__(self, address='127.0.0.1:7071', timeout=2, **options):
+        host, _, port = address.rpartition(':')
+        self.address = (host or '127.0.0.1', int(port))
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.socket = None
+        self.last_attempt = 0.0
+
+    def _connection(self):
+        """The open connection (lock held), connecting and starting its reader first if needed"""
+        if self.socket is None:
+            self.socket = socket.create_connection(self.address, timeout=self.timeout)
+            threading.Thread(target=self._read, args=(self.socket,), name='live-broker', daemon=True).start()
+        return self.socket
+
+    def _disconnect(self, connection):
+        with self.lock:
+            if self.socket is connection:
+                self.socket = None
+        try:
+            # Wakes the reader blocked in recv()
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        connection.close()
+
+    def listen(self):
+        # Called for every new stream: while the relay is down, retry at most every BROKER_RETRY_DELAY
+        if self.socket is not None or time.monotonic() - self.last_attempt < BROKER_RETRY_DELAY:
+            return
+        self.last_attempt = time.monotonic()
+        try:
+            with self.lock:
+                self._connection()
+        except OSError as e:
+            logger.warning('Live update relay at %s:%s unreachable: %s', *self.address, e)
+
+    def publish(self, channel, event_id, message):
+        line = json.dumps({'channel': channel, 'id': event_id, 'message': message.decode()}) + '\n'
+        connection = None
+        try:
+            with self.lock:
+                connection = self._connection()
+                connection.sendall(line.encode())
+        except OSError as e:
+            if connection is not None:
+                self._disconnect(connection)
+            logger.warning('Live update on %s not published: %s', channel, e)
+
+    def _read(self, connection):
+        pending = b''
+        try:
+            while True:
+                try:
+                    data = connection.recv(65536)
+                except TimeoutError:
+                    continue  # idle; the timeout only bounds publishing
+                if not data:
+                    break
+                *lines, pending = (pending + data).split(b'\n')
+                for line in lines:
+                    event = json.loads(line)
+                    HUB.dispatch(event['channel'], event['id'], event['message'].encode())
+        except (OSError, ValueError) as e:
+            logger.warning('Live update relay connection lost: %s', e)
+        finally:
+            self._disconnect(connection)
+        # Keep streams of this process fed: reconnect (which starts a new reader)
+        while True:
+            time.sleep(BROKER_RETRY_DELAY)
+            try:
+                with self.lock:
+                    self._connection()
+                return
+            except OSError:
+                continue
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    config = getattr(settings, 'LIVE_UPDATES_BROKER', {})
+    broker_class = import_string(config.get('BACKEND', 'reviews.live.LocalBroker'))
+    return broker_class(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def _reset_broker(setting, **kwargs):
+    if setting == 'LIVE_UPDATES_BROKER':
+        get_broker.cache_clear()
+
+
+def review_added(review):
+    """Publish a new review to its page's stream once the transaction commits"""
+    if enabled():
+        tenants.on_commit(lambda: publish_review(review))
+
+
+def publish_review(review):
+    # Runs after the commit: a failure here must not fail the submission
+    try:
+        if isinstance(review, CourseReview):
+            kind, owner, channel = 'course', review.course, purge.course_key(review.course_id)
+        else:
+            kind, owner, channel = 'faculty', review.faculty, purge.faculty_key(review.faculty_id)
+        data = {
+            'review': f'{kind}-{review.pk}',
+            'html': render_to_string('reviews/review_item.html', {'review': review, 'kind': kind}),
+            'tags': review.tags,
+            'avg_rating': owner.average_rating(),
+            'total_reviews': owner.total_reviews(),
+        }
+        event_id = time.time_ns()
+        get_broker().publish(tenants.scoped(channel), event_id, encode(event_id, 'review', data))
+    except Exception:
+        logger.exception('Publishing a live update for review %s failed', review.pk)
+
+
+async def stream(channel, last_event_id):
+    """Body of an event stream: queued events, a comment line every heartbeat, until the max age"""
+    loop = asyncio.get_running_loop()
+    heartbeat = getattr(settings, 'LIVE_UPDATES_HEARTBEAT', 15)
+    # Spread reconnections so streams opened together don't all return at once
+    deadline = loop.time() + getattr(settings, 'LIVE_UPDATES_MAX_AGE', 300) * random.uniform(0.75, 1)
+    get_broker().listen()
+    subscription = HUB.subscribe(channel, last_event_id)
+    metrics.LIVE_STREAMS.inc()
+    try:
+        yield f'retry: {RECONNECT_MS}\n\n'.encode()
+        while not subscription.overflowed:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            yield message
+    finally:
+        HUB.unsubscribe(subscription)
+        metrics.LIVE_STREAMS.dec()
+
+
+def event_stream(request, channel):
+    """Streaming response for a page's channel, or 204 when live updates are off or served over WSGI"""
+    if not enabled() or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    # Where the browser left off: the last event it got, else when its page was rendered
+    position = request.headers.get('Last-Event-ID') or request.GET.get('since', '')
+    last_event_id = int(position) if position.isdigit() else None
+    response = StreamingHttpResponse(
+        stream(tenants.scoped(channel), last_event_id), content_type='text/event-stream',
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
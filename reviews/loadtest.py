@@ -0,0 +1,358 @@
+"""
+Load generator for the student journey.
+
+Virtual students run against a live server (``manage.py runserver`` or a
+production-like WSGI server): they browse the faculty list and detail pages,
+register, read their OTP from the file-based mail sink, verify it, submit a
+review and search. Latency, throughput and errors are recorded per endpoint.
+Used by ``manage.py loadtest``.
+"""
+import http.cookiejar
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+FACULTY_LINK_RE = re.compile(r'/faculty/(\d+)/')
+OTP_RE = re.compile(r'verification is: (\d{6})')
+# Where the site sends students who aren't (or are no longer) verified
+REGISTER_PATH = '/register/'
+
+SEARCH_TERMS = ['good', 'great', 'helpful', 'strict', 'clear', 'lab', 'exam']
+REVIEW_SENTENCES = [
+    'Explains difficult topics clearly and gives helpful examples.',
+    'Assignments were challenging but the grading was fair.',
+    'Very approachable during office hours.',
+    'Lectures could be more organised, but the labs were great.',
+    'Exams matched what was taught in class.',
+]
+
+# Named ramp profiles: (target users, seconds to reach it) stages
+PROFILES = {
+    'smoke': '2:10',
+    'ramp': '10:30,50:60,50:60,0:15',
+    'spike': '5:10,100:5,100:30,5:10',
+    'soak': '20:30,20:600,0:15',
+}
+
+
+def parse_profile(profile):
+    """'10:30,50:60' -> [(10, 30.0), (50, 60.0)]; named profiles are expanded first"""
+    profile = PROFILES.get(profile, profile)
+    stages = []
+    for stage in profile.split(','):
+        users, seconds = stage.split(':')
+        stages.append((int(users), float(seconds)))
+    return stages
+
+
+def target_users(stages, elapsed):
+    """Number of users that should be running after ``elapsed`` seconds (linear ramps)"""
+    previous = 0
+    for users, seconds in stages:
+        if elapsed < seconds:
+            return round(previous + (users - previous) * elapsed / seconds)
+        elapsed -= seconds
+        previous = users
+    return None  # profile finished
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Stats:
+    """Thread-safe latency and error recorder, keyed by endpoint name"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, endpoint, seconds, error=None):
+        with self.lock:
+            self.latencies[endpoint].append(seconds * 1000)
+            if error:
+                self.errors[endpoint] += 1
+                self.error_samples.setdefault(endpoint, error)
+
+    def summary(self):
+        duration = (self.finished or time.monotonic()) - self.started
+        endpoints = {}
+        all_latencies = []
+        with self.lock:
+            for endpoint, latencies in sorted(self.latencies.items()):
+                ordered = sorted(latencies)
+                all_latencies.extend(ordered)
+                endpoints[endpoint] = self._summarise(ordered, self.errors[endpoint], duration)
+                if endpoint in self.error_samples:
+                    endpoints[endpoint]['first_error'] = self.error_samples[endpoint]
+            total = self._summarise(sorted(all_latencies), sum(self.errors.values()), duration)
+        return {'duration_s': round(duration, 2), 'endpoints': endpoints, 'total': total}
+
+    @staticmethod
+    def _summarise(ordered, errors, duration):
+        count = len(ordered)
+        return {
+            'requests': count,
+            'errors': errors,
+            'error_rate': round(errors / count, 4) if count else 0.0,
+            'rps': round(count / duration, 2) if duration else 0.0,
+            'mean_ms': round(sum(ordered) / count, 2) if count else 0.0,
+            'p50_ms': round(percentile(ordered, 0.50), 2),
+            'p95_ms': round(percentile(ordered, 0.95), 2),
+            'p99_ms': round(percentile(ordered, 0.99), 2),
+        }
+
+
+class MailSink:
+    """Reads OTPs from the directory written by Django's file-based email backend"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.otps = {}
+
+    def wait_for_otp(self, email, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                self._scan()
+                otp = self.otps.pop(email, None)
+            if otp:
+                return otp
+            time.sleep(0.1)
+        return None
+
+    def _scan(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name in self.seen:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    content = f.read()
+            except OSError:
+                continue
+            self.seen.add(name)
+            # A file may hold several messages; the last OTP per recipient wins
+            for message in content.split('\n' + '-' * 79):
+                otp = OTP_RE.search(message)
+                recipient = re.search(r'^To: (.+)$', message, re.M)
+                if otp and recipient:
+                    self.otps[recipient.group(1).strip()] = otp.group(1)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects as responses so every hop is timed as its own endpoint"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualStudent(threading.Thread):
+    """One simulated student repeatedly walking through the site"""
+
+    def __init__(self, runner, number):
+        super().__init__(daemon=True)
+        self.runner = runner
+        self.number = number
+        self.stop_event = threading.Event()
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect
+        )
+        self.email = f'loadtest-{runner.run_id}-{number}@std.ewubd.edu'
+        self.verified = False
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set() and not self.runner.finished.is_set():
+            try:
+                self.journey()
+            except Exception as e:  # keep the user alive, the error is already counted
+                self.runner.stats.record('journey', 0, error=repr(e))
+                self.think()
+
+    def journey(self):
+        home = self.request('home', '/')
+        faculty_ids = FACULTY_LINK_RE.findall(home or '') or self.runner.faculty_ids
+        if faculty_ids:
+            self.runner.faculty_ids = faculty_ids
+        self.think()
+
+        faculty_id = random.choice(faculty_ids) if faculty_ids else None
+        if faculty_id:
+            self.request('faculty_detail', f'/faculty/{faculty_id}/')
+            self.think()
+
+        if not self.verified:
+            self.verified = self.register_and_verify()
+            self.think()
+
+        if self.verified and faculty_id and random.random() < self.runner.review_ratio:
+            self.submit_review(faculty_id)
+            self.think()
+
+        self.request('search_reviews', '/search/?' + urllib.parse.urlencode(
+            {'search': random.choice(SEARCH_TERMS)}
+        ))
+        self.think()
+
+    def register_and_verify(self):
+        page = self.request('register', '/register/')
+        self.request('register', '/register/', data={
+            'csrfmiddlewaretoken': self.csrf_token(page),
+            'name': f'Load Test {self.number}',
+            'email': self.email,
+        })
+        otp = self.runner.mail.wait_for_otp(self.email)
+        if otp is None:
+            self.runner.stats.record('otp_mail', 0, error=f'No OTP received for {self.email}')
+            return False
+
+        page = self.request('verify_otp', '/verify-otp/')
+        # The session cookie exists since registering; only the redirect home means the OTP was accepted
+        return self.request('verify_otp', '/verify-otp/', data={
+            'csrfmiddlewaretoken': self.csrf_token(page),
+            'otp': otp,
+        }, expect_redirect='/') is not None
+
+    def submit_review(self, faculty_id):
+        url = f'/submit-review/?faculty_id={faculty_id}'
+        page = self.request('submit_review', url)
+        self.request('submit_review', url, data={
+            'csrfmiddlewaretoken': self.csrf_token(page),
+            'faculty_id': faculty_id,
+            'description': ' '.join(random.sample(REVIEW_SENTENCES, 3)),
+            'points': random.randint(0, 10),
+        }, expect_redirect=f'/faculty/{faculty_id}/')
+
+    def csrf_token(self, page):
+        match = CSRF_RE.search(page or '')
+        return match.group(1) if match else ''
+
+    def request(self, endpoint, path, data=None, expect_redirect=None):
+        """
+        Time one HTTP request; returns the body of a successful response ('' for a redirect), else None.
+
+        A redirect to the register page is an error (the student isn't verified),
+        and with ``expect_redirect`` so is any response not redirecting to that path.
+        """
+        url = self.runner.host + path
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(url, data=body, headers={'Referer': url})
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.runner.timeout) as response:
+                content = response.read().decode('utf-8', errors='replace')
+            elapsed = time.perf_counter() - started
+            if expect_redirect is not None:
+                self.runner.stats.record(endpoint, elapsed, error=f'HTTP {response.status} instead of a redirect')
+                return None
+            self.runner.stats.record(endpoint, elapsed)
+            return content
+        except urllib.error.HTTPError as e:
+            elapsed = time.perf_counter() - started
+            e.read()
+            if not 300 <= e.code < 400:
+                self.runner.stats.record(endpoint, elapsed, error=f'HTTP {e.code}')
+                return None
+            target = urllib.parse.urlsplit(e.headers.get('Location', '')).path
+            if target == REGISTER_PATH or (expect_redirect is not None and target != expect_redirect):
+                self.runner.stats.record(endpoint, elapsed, error=f'Redirected to {target}')
+                return None
+            self.runner.stats.record(endpoint, elapsed)
+            return ''
+        except OSError as e:
+            self.runner.stats.record(endpoint, time.perf_counter() - started, error=repr(e))
+        return None
+
+    def think(self):
+        if self.runner.think_time:
+            self.stop_event.wait(random.uniform(0, self.runner.think_time * 2))
+
+
+class LoadTestRunner:
+    """Starts and stops virtual students following a ramp profile"""
+
+    def __init__(self, host, profile, mail_dir, think_time=1.0, review_ratio=0.3, timeout=30.0):
+        self.host = host.rstrip('/')
+        self.stages = parse_profile(profile)
+        self.mail = MailSink(mail_dir)
+        self.think_time = think_time
+        self.review_ratio = review_ratio
+        self.timeout = timeout
+        self.run_id = uuid.uuid4().hex[:8]
+        self.stats = Stats()
+        self.finished = threading.Event()
+        self.faculty_ids = []
+        self.users = []
+
+    def run(self, on_tick=None, tick=0.5):
+        started = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - started
+            wanted = target_users(self.stages, elapsed)
+            if wanted is None:
+                break
+            self._scale(wanted)
+            if on_tick:
+                on_tick(elapsed, len(self.active_users()))
+            time.sleep(tick)
+
+        self.finished.set()
+        for user in self.users:
+            user.stop()
+        for user in self.users:
+            user.join(timeout=self.timeout)
+        self.stats.finished = time.monotonic()
+        return self.stats.summary()
+
+    def active_users(self):
+        return [user for user in self.users if not user.stop_event.is_set()]
+
+    def _scale(self, wanted):
+        active = self.active_users()
+        for _ in range(wanted - len(active)):
+            user = VirtualStudent(self, len(self.users) + 1)
+            self.users.append(user)
+            user.start()
+        for user in active[wanted:]:
+            user.stop()
+
+
+def compare(baseline, current):
+    """Rows of (endpoint, metric, baseline, current, change %) between two summaries"""
+    rows = []
+    endpoints = sorted(set(baseline['endpoints']) | set(current['endpoints'])) + ['total']
+    for endpoint in endpoints:
+        before = baseline['total'] if endpoint == 'total' else baseline['endpoints'].get(endpoint, {})
+        after = current['total'] if endpoint == 'total' else current['endpoints'].get(endpoint, {})
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'error_rate'):
+            old, new = before.get(metric), after.get(metric)
+            change = None
+            if old not in (None, 0) and new is not None:
+                change = round((new - old) / old * 100, 1)
+            rows.append((endpoint, metric, old, new, change))
+    return rows
@@ -0,0 +1,183 @@
+"""
+Non-blocking logging: a bounded queue handler, a JSON formatter and a rate limit filter.
+
+Request threads only put records on an in-memory queue; a background
+listener thread formats and writes them. When the sink falls behind and
+the queue is full, records are dropped (and counted) instead of stalling
+the request. Configured through LOGGING in settings.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including any ``extra=`` fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most ``burst`` identical records through per ``period`` seconds.
+
+    Records are identical when they share logger, level, formatted message
+    and exception type, so the same failure repeating is limited but
+    different failures logged with one template (other recipients, other
+    errors) are not; only records at ``level`` or above are limited. The next record
+    let through notes how many were suppressed in its ``suppressed`` field.
+    """
+
+    max_keys = 1000
+
+    def __init__(self, burst=5, period=60.0, level='WARNING'):
+        super().__init__()
+        self.burst = int(burst)
+        self.period = float(period)
+        self.level = level if isinstance(level, int) else logging.getLevelName(level.upper())
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        try:
+            message = record.getMessage()
+        except Exception:
+            message = str(record.msg)  # bad arguments; the handler reports them
+        key = (record.name, record.levelno, message, record.exc_info[0] if record.exc_info else None)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                suppressed = window[2] if window else 0
+                if len(self.windows) >= self.max_keys:
+                    self.windows.clear()
+                self.windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Block rather than fail when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hand records to a background thread that writes them to ``stream``.
+
+    At most ``maxsize`` records are buffered; further records are dropped,
+    counted in ``dropped`` and reported by the listener once it catches up.
+    The formatter configured for this handler is used by the writer thread.
+    """
+
+    def __init__(self, maxsize=10000, stream=None):
+        super().__init__(queue.Queue(int(maxsize)))
+        self.maxsize = int(maxsize)
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._reported = 0
+        self.listener = None
+        self._start()
+        atexit.register(self.close)
+        if hasattr(os, 'register_at_fork'):
+            # The listener thread does not survive fork (e.g. gunicorn --preload)
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        if self.listener is not None:
+            # Records queued in the parent are the parent's to write
+            self.queue = queue.Queue(self.maxsize)
+            self._start()
+
+    def _start(self):
+        self.listener = _Listener(self.queue, _DropReporter(self), respect_handler_level=False)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message now (args may change later) but leave the
+        # formatting, including tracebacks, to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            from . import metrics
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.target.close()
+        super().close()
+
+
+class _DropReporter:
+    """Listener-side handler: writes records, noting drops since the last write"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.level = logging.NOTSET
+
+    def handle(self, record):
+        handler = self.handler
+        dropped = handler.dropped
+        if dropped > handler._reported:
+            notice = logging.makeLogRecord({
+                'name': __name__,
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': 'Log queue full, dropped %d records' % (dropped - handler._reported),
+                'dropped_total': dropped,
+            })
+            handler._reported = dropped
+            handler.target.handle(notice)
+        handler.target.handle(record)
@@ -0,0 +1,138 @@
+"""
+Batch ratings lookup for the course-registration browser extension.
+
+``/api/ratings/`` takes up to LOOKUP_MAX_ITEMS faculty names or emails
+(``faculty=``) and course codes (``course=``) and answers with each one's
+rating, review count and top tags. Names are matched on
+Faculty.normalized_name, so "Dr. A. K. Rahman" and "a k rahman" find the
+same person, emails are compared lowercased and course codes are matched
+with or without spaces. Every lookup is an IN query and the statistics come
+from one grouped query per kind, so a batch costs four queries however many
+items it holds, plus one on the archive per kind when a match has archived
+reviews (they count towards ratings, review counts and tags alike).
+"""
+import re
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Lower
+from django.urls import reverse
+
+from . import archive, refdata
+from .models import Course, CourseReview, Faculty, Review, normalize_name
+from .search import tag_q
+
+
+class TooManyItems(ValueError):
+    pass
+
+
+def max_items():
+    return getattr(settings, 'LOOKUP_MAX_ITEMS', 300)
+
+
+def course_code_forms(code):
+    """Stored forms a typed course code may have: 'cse 137' -> {'CSE 137', 'CSE137'}"""
+    code = ' '.join(code.upper().split())
+    return {code, re.sub(r'[^A-Z0-9]', '', code)} - {''}
+
+
+def _stats(model, owner_field, owners):
+    """{owner id: [review count, points total, per-tag counts]}, archived reviews included"""
+    tags = refdata.tag_names(model)
+    stats = {owner['id']: [0, 0, [0] * len(tags)] for owner in owners}
+    # The archive may be another database: one grouped query on each table
+    archived = [owner['id'] for owner in owners if owner['archived_review_count']]
+    for source, ids in ((model, list(stats)), (archive.archive_of(model), archived)):
+        if not ids:
+            continue
+        rows = (source.objects.filter(**{f'{owner_field}__in': ids})
+                .values(owner_field)
+                .annotate(
+                    count=Count('id'),
+                    total=Sum('points'),
+                    **{f'tag_{i}': Count('id', filter=tag_q(tag)) for i, tag in enumerate(tags)},
+                )
+                .order_by(owner_field))
+        for row in rows:
+            entry = stats[row[owner_field]]
+            entry[0] += row['count']
+            entry[1] += row['total'] or 0
+            entry[2] = [n + row[f'tag_{i}'] for i, n in enumerate(entry[2])]
+    return tags, stats
+
+
+def _summary(tags, stats, top_tags):
+    count, total, tag_counts = stats
+    ranked = sorted(
+        ([tag, n] for tag, n in zip(tags, tag_counts) if n),
+        key=lambda item: (-item[1], item[0]),
+    )
+    return {
+        'rating': round(total / count, 2) if count else None,
+        'reviews': count,
+        'top_tags': ranked[:top_tags],
+    }
+
+
+def lookup(faculty_queries, course_queries, build_url=lambda path: path):
+    """
+    Ratings of the faculty (names or emails) and courses (codes) asked for.
+
+    Returns {'faculty': {query: [matches]}, 'courses': {query: [matches]}};
+    a name shared by several faculty members lists all of them, an unknown
+    one an empty list. Raises TooManyItems past LOOKUP_MAX_ITEMS.
+    """
+    faculty_queries = list(dict.fromkeys(q.strip() for q in faculty_queries if q.strip()))
+    course_queries = list(dict.fromkeys(q.strip() for q in course_queries if q.strip()))
+    if len(faculty_queries) + len(course_queries) > max_items():
+        raise TooManyItems(f'At most {max_items()} faculty and courses can be looked up at once')
+    top_tags = getattr(settings, 'LOOKUP_TOP_TAGS', 3)
+
+    keys = {q: q.lower() if '@' in q else normalize_name(q) for q in faculty_queries}
+    emails = {key for q, key in keys.items() if '@' in q}
+    names = set(keys.values()) - emails
+    faculty = list(
+        Faculty.objects.annotate(email_lower=Lower('email'))
+        .filter(Q(normalized_name__in=names) | Q(email_lower__in=emails))
+        .values('id', 'name', 'email', 'normalized_name', 'designation', 'department__name',
+                'archived_review_count')
+        .order_by('name', 'id')
+    ) if keys else []
+    tags, stats = _stats(Review, 'faculty_id', faculty)
+    matches = {}
+    for f in faculty:
+        match = {
+            'id': f['id'],
+            'name': f['name'],
+            'email': f['email'],
+            'designation': f['designation'],
+            'department': f['department__name'],
+            'url': build_url(reverse('faculty_detail', args=[f['id']])),
+            **_summary(tags, stats[f['id']], top_tags),
+        }
+        for key in {f['normalized_name'], f['email'].lower()}:
+            matches.setdefault(key, []).append(match)
+
+    forms = {q: course_code_forms(q) for q in course_queries}
+    courses = list(
+        Course.objects.filter(code__in=set().union(*forms.values()))
+        .values('id', 'code', 'name', 'department__name', 'archived_review_count')
+        .order_by('code')
+    ) if forms else []
+    tags, stats = _stats(CourseReview, 'course_id', courses)
+    by_code = {}
+    for c in courses:
+        by_code[c['code']] = {
+            'id': c['id'],
+            'code': c['code'],
+            'name': c['name'],
+            'department': c['department__name'],
+            'url': build_url(reverse('course_detail', args=[c['id']])),
+            **_summary(tags, stats[c['id']], top_tags),
+        }
+
+    return {
+        'faculty': {q: matches.get(key, []) for q, key in keys.items()},
+        'courses': {q: [by_code[code] for code in sorted(forms[q]) if code in by_code] for q in course_queries},
+    }
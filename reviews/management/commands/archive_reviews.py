@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import archive
+from reviews.signals import pages_changed
+
+
+class Command(BaseCommand):
+    help = 'Move reviews older than ARCHIVE_AFTER_DAYS into the archive tables, in resumable batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Archive reviews older than this many days (default: ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Reviews moved per batch (one transaction each)')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches per table; run again to continue')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches to leave room for live traffic')
+    
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['older_than_days'])
+        self.stdout.write(f'Archiving reviews created before {before:%Y-%m-%d %H:%M} UTC')
+        for name, review_model, archive_model, owner_field, owner_model in archive.sources():
+            moved, batches = 0, 0
+            while options['max_batches'] is None or batches < options['max_batches']:
+                result = archive.archive_batch(
+                    review_model, archive_model, owner_field, owner_model, before, options['batch_size']
+                )
+                if result is None:
+                    break
+                count, owner_ids = result
+                moved += count
+                batches += 1
+                department_ids = set(owner_model.objects.filter(id__in=owner_ids).values_list('department_id', flat=True))
+                # faculty_id -> faculty_ids, course_id -> course_ids
+                pages_changed(**{owner_field + 's': owner_ids}, department_ids=department_ids)
+                self.stdout.write(f'{name}: {moved} archived')
+                if options['pause']:
+                    time.sleep(options['pause'])
+            self.stdout.write(self.style.SUCCESS(f'{name}: {moved} reviews archived in {batches} batches'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reviews import terms
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-term faculty and course rating rollups from all reviews, in chunks'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Reviews read and applied per transaction')
+    
+    def handle(self, *args, **options):
+        terms.backfill(chunk_size=options['chunk_size'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS('Term scores rebuilt'))
@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from reviews.middleware import BrotliStream, GzipStream, brotli, minify_html
+from reviews.models import Course, Faculty
+
+
+class Command(BaseCommand):
+    help = 'Measure bytes-on-wire and CPU cost of compressing the main pages'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Compressions per page and codec (default: 50)')
+        parser.add_argument('--gzip-level', type=int, default=settings.COMPRESSION_LEVEL)
+        parser.add_argument('--brotli-quality', type=int, default=settings.COMPRESSION_BROTLI_QUALITY)
+    
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        codecs = [
+            ('identity', None),
+            ('minify', None),
+            (f'gzip-{options["gzip_level"]}', lambda: GzipStream(options['gzip_level'])),
+            (f'minify+gzip-{options["gzip_level"]}', lambda: GzipStream(options['gzip_level'])),
+        ]
+        if brotli is not None:
+            codecs += [
+                (f'br-{options["brotli_quality"]}', lambda: BrotliStream(options['brotli_quality'])),
+                (f'minify+br-{options["brotli_quality"]}', lambda: BrotliStream(options['brotli_quality'])),
+            ]
+        else:
+            self.stdout.write(self.style.WARNING('brotli is not installed, skipping br codecs'))
+        
+        self.stdout.write(f'{"page":<16} {"codec":<16} {"bytes":>10} {"ratio":>7} {"cpu ms/resp":>12}')
+        for page, url in self.pages():
+            response = Client().get(url)
+            if response.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'{page}: HTTP {response.status_code}, skipped'))
+                continue
+            html = response.content.decode(response.charset)
+            raw = html.encode('utf-8')
+            
+            for name, make_encoder in codecs:
+                started = time.process_time()
+                for _ in range(iterations):
+                    body = raw
+                    if name.startswith('minify'):
+                        body = minify_html(html).encode('utf-8')
+                    if make_encoder is not None:
+                        encoder = make_encoder()
+                        body = encoder.compress(body) + encoder.finish()
+                cpu_ms = (time.process_time() - started) * 1000 / iterations
+                self.stdout.write(
+                    f'{page:<16} {name:<16} {len(body):>10} {len(body) / len(raw):>7.1%} {cpu_ms:>12.3f}'
+                )
+    
+    def pages(self):
+        """Main views to measure, using the first faculty/course that exists"""
+        pages = [
+            ('home', reverse('home')),
+            ('course_list', reverse('course_list')),
+            ('search_reviews', reverse('search_reviews')),
+        ]
+        faculty = Faculty.objects.first()
+        if faculty:
+            pages.append(('faculty_detail', reverse('faculty_detail', args=[faculty.id])))
+        course = Course.objects.first()
+        if course:
+            pages.append(('course_detail', reverse('course_detail', args=[course.id])))
+        return pages
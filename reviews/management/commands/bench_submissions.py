@@ -0,0 +1,173 @@
+import itertools
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.test.utils import override_settings
+
+from reviews import tenants, writebehind
+from reviews.loadtest import percentile
+from reviews.models import Faculty, PrerenderQueue, Review, Student
+from reviews.signals import review_deleted, review_saved
+
+# Descriptions of benchmark reviews start with this, so they can be removed afterwards
+MARKER = '[bench_submissions]'
+# none: bare inserts, no summaries or invalidation (the baseline)
+# configured: the work review_saved does with the current settings
+# all: also pre-rendered page invalidation and live update publishing
+FEATURES = ['none', 'configured', 'all']
+
+
+class Command(BaseCommand):
+    help = ('Measure sustained review submission throughput with direct saves and with the write-behind '
+            'buffer (writes reviews to the database and removes them afterwards)')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000,
+                            help='Reviews submitted per mode (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Threads submitting at the same time, like request workers (default: 16)')
+        parser.add_argument('--mode', choices=['direct', 'write-behind', 'both'], default='both')
+        parser.add_argument('--features', nargs='+', choices=FEATURES, default=['configured'],
+                            help='Work done per saved review: none (bare inserts), configured (default) or all '
+                                 '(PRERENDER and LIVE_UPDATES on too); several compare them')
+        parser.add_argument('--keep', action='store_true',
+                            help='Leave the benchmark reviews in the database')
+    
+    def handle(self, *args, **options):
+        faculty_ids = list(Faculty.objects.values_list('id', flat=True))
+        student_ids = list(Student.objects.values_list('id', flat=True)[:500])
+        if not faculty_ids or not student_ids:
+            raise CommandError('Needs at least one faculty member and one student (see populate_db.py)')
+        modes = ['direct', 'write-behind'] if options['mode'] == 'both' else [options['mode']]
+        if options['keep'] and 'none' in options['features']:
+            raise CommandError('--features none reviews are never counted in the summaries, so they cannot be kept')
+
+        self.stdout.write(f'{options["count"]} reviews per mode, {options["concurrency"]} concurrent submitters')
+        self.stdout.write(f'{"features":<11} {"mode":<14} {"saved":>7} {"errors":>7} {"acked/s":>9} '
+                          f'{"saved/s":>9} {"p50 ms":>8} {"p99 ms":>8}')
+        try:
+            for features in dict.fromkeys(options['features']):
+                with self.features(features):
+                    for mode in modes:
+                        row = self.run(mode, features, options['count'], options['concurrency'],
+                                       faculty_ids, student_ids)
+                        self.stdout.write(
+                            f'{features:<11} {mode:<14} {row["saved"]:>7} {row["errors"]:>7} '
+                            f'{row["acked_rate"]:>9.0f} {row["saved_rate"]:>9.0f} {row["p50"]:>8.2f} '
+                            f'{row["p99"]:>8.2f}'
+                        )
+        finally:
+            if not options['keep']:
+                removed = Review.objects.filter(description__startswith=MARKER).delete()[1].get('reviews.Review', 0)
+                self.stdout.write(f'Removed {removed} benchmark reviews')
+    
+    @contextmanager
+    def features(self, features):
+        """Settings and signal receivers of one --features level, restored afterwards"""
+        if features == 'configured':
+            yield
+        elif features == 'none':
+            post_save.disconnect(review_saved, sender=Review)
+            post_delete.disconnect(review_deleted, sender=Review)
+            try:
+                yield
+            finally:
+                # Removed while review_deleted is off: they were never added to the summaries
+                Review.objects.filter(description__startswith=f'{MARKER} none ').delete()
+                post_save.connect(review_saved, sender=Review)
+                post_delete.connect(review_deleted, sender=Review)
+        else:
+            prerendered = getattr(settings, 'PRERENDER', False)
+            queued = PrerenderQueue.objects.aggregate(last=Max('id'))['last'] or 0
+            pages = tempfile.mkdtemp(prefix='bench-prerender-')
+            overrides = {'LIVE_UPDATES': True}
+            if not prerendered:
+                overrides.update(PRERENDER=True, PRERENDER_DIR=pages)
+            try:
+                with override_settings(**overrides):
+                    yield
+            finally:
+                if not prerendered:
+                    # Pages queued for a pre-render build this site doesn't use
+                    PrerenderQueue.objects.filter(id__gt=queued).delete()
+                shutil.rmtree(pages, ignore_errors=True)
+    
+    def run(self, mode, features, count, concurrency, faculty_ids, student_ids):
+        marker = f'{MARKER} {features} {mode} {time.time_ns()}'
+        journal = tempfile.mkdtemp(prefix='bench-journal-') if mode == 'write-behind' else None
+        buffer = None
+        if journal:
+            buffer = writebehind.WriteBehindBuffer(
+                journal,
+                interval=getattr(settings, 'WRITE_BEHIND_INTERVAL', 0.005),
+                batch_size=getattr(settings, 'WRITE_BEHIND_BATCH_SIZE', 500),
+                fsync=getattr(settings, 'WRITE_BEHIND_FSYNC', True),
+            )
+        numbers = itertools.count()
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+
+        def submitter():
+            rng = random.Random()
+            try:
+                while True:
+                    with lock:
+                        number = next(numbers)
+                    if number >= count:
+                        return
+                    review = Review(
+                        faculty_id=rng.choice(faculty_ids),
+                        student_id=rng.choice(student_ids),
+                        description=f'{marker} review {number}: clear lectures and fair grading',
+                        points=rng.randint(0, 10),
+                        tags=rng.sample([tag for tag, _ in Review.TAG_CHOICES], 2),
+                    )
+                    started = time.perf_counter()
+                    try:
+                        if buffer is not None:
+                            buffer.submit(review)
+                        else:
+                            with tenants.atomic():
+                                review.save()
+                    except DatabaseError:
+                        # e.g. "database is locked" once writers queue up past the timeout
+                        with lock:
+                            errors[0] += 1
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed * 1000)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=submitter) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        acked = time.perf_counter() - started
+        if buffer is not None:
+            buffer.drain()
+            buffer.close()
+            shutil.rmtree(journal, ignore_errors=True)
+        finished = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'saved': Review.objects.filter(description__startswith=marker).count(),
+            'errors': errors[0],
+            'acked_rate': len(latencies) / acked,
+            'saved_rate': len(latencies) / finished,
+            'p50': percentile(latencies, 0.50),
+            'p99': percentile(latencies, 0.99),
+        }
@@ -0,0 +1,51 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+# Longest event line accepted (a review's rendered HTML plus its JSON envelope)
+MAX_LINE = 1024 * 1024
+# A worker this far behind on reading is dropped; its streams catch up when it reconnects
+MAX_BACKLOG = 16 * 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Run a local pub/sub relay for live review updates, standing in for a broker such as Redis '
+            '(set LIVE_UPDATES_BROKER=reviews.live.SocketBroker)')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=7071)
+    
+    def handle(self, *args, **options):
+        try:
+            asyncio.run(self.serve(options['host'], options['port']))
+        except KeyboardInterrupt:
+            pass
+    
+    async def serve(self, host, port):
+        workers = set()
+
+        async def relay(reader, writer):
+            workers.add(writer)
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line.endswith(b'\n'):
+                        break  # disconnected (or an oversized line)
+                    # Every worker, the publisher included, feeds the line to its own streams
+                    for worker in list(workers):
+                        if worker.transport.get_write_buffer_size() > MAX_BACKLOG:
+                            workers.discard(worker)
+                            worker.close()
+                        else:
+                            worker.write(line)
+            except (ConnectionError, ValueError):
+                pass
+            finally:
+                workers.discard(writer)
+                writer.close()
+
+        server = await asyncio.start_server(relay, host, port, limit=MAX_LINE)
+        self.stdout.write(f'Relaying live review updates on {host}:{port}')
+        async with server:
+            await server.serve_forever()
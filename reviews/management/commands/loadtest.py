@@ -0,0 +1,99 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews.loadtest import PROFILES, LoadTestRunner, compare
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the student journey (browse, register, OTP, review, search) against a '
+        'running server and report latency percentiles, throughput and errors per endpoint. '
+        'Run the server with EMAIL_BACKEND=file so OTPs can be read from the mail sink.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='http://127.0.0.1:8000',
+                            help='Base URL of the server under test')
+        parser.add_argument('--profile', default='smoke',
+                            help=f'Ramp profile "users:seconds,..." or one of: {", ".join(PROFILES)}')
+        parser.add_argument('--mail-dir', default=getattr(settings, 'EMAIL_FILE_PATH', None),
+                            help="Directory written by the server's file-based email backend")
+        parser.add_argument('--think-time', type=float, default=1.0,
+                            help='Average pause between steps in seconds')
+        parser.add_argument('--review-ratio', type=float, default=0.3,
+                            help='Share of journeys that submit a review')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Diff the results against an earlier --output file')
+        parser.add_argument('--diff', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                            help='Only diff two earlier result files, without running a test')
+    
+    def handle(self, *args, **options):
+        if options['diff']:
+            baseline, current = (self._load(path) for path in options['diff'])
+            self._print_diff(baseline, current)
+            return
+        
+        if not options['mail_dir']:
+            raise CommandError('Set EMAIL_FILE_PATH or pass --mail-dir so OTPs can be read.')
+        
+        try:
+            runner = LoadTestRunner(
+                options['host'], options['profile'], options['mail_dir'],
+                think_time=options['think_time'], review_ratio=options['review_ratio'],
+            )
+        except ValueError:
+            raise CommandError(f'Invalid profile: {options["profile"]}')
+        
+        self.stdout.write(f'Load testing {runner.host} with profile {options["profile"]} (run {runner.run_id})')
+        results = runner.run(on_tick=self._progress)
+        self.stdout.write('')
+        self._print_results(results)
+        
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+        if options['compare']:
+            self._print_diff(self._load(options['compare']), results)
+    
+    def _progress(self, elapsed, users):
+        self.stdout.write(f'\r  {elapsed:6.1f}s  {users:4d} users', ending='')
+        self.stdout.flush()
+    
+    def _print_results(self, results):
+        self.stdout.write(
+            f'{"endpoint":<16} {"reqs":>7} {"err%":>6} {"rps":>8} '
+            f'{"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}'
+        )
+        rows = list(results['endpoints'].items()) + [('TOTAL', results['total'])]
+        for endpoint, row in rows:
+            self.stdout.write(
+                f'{endpoint:<16} {row["requests"]:>7} {row["error_rate"] * 100:>6.2f} {row["rps"]:>8.2f} '
+                f'{row["p50_ms"]:>9.1f} {row["p95_ms"]:>9.1f} {row["p99_ms"]:>9.1f}'
+            )
+        for endpoint, row in results['endpoints'].items():
+            if 'first_error' in row:
+                self.stdout.write(self.style.WARNING(f'{endpoint}: {row["first_error"]}'))
+    
+    def _print_diff(self, baseline, current):
+        self.stdout.write(f'{"endpoint":<16} {"metric":<11} {"baseline":>10} {"current":>10} {"change":>9}')
+        for endpoint, metric, old, new, change in compare(baseline, current):
+            change_text = '' if change is None else f'{change:+.1f}%'
+            line = f'{endpoint:<16} {metric:<11} {_fmt(old):>10} {_fmt(new):>10} {change_text:>9}'
+            # Higher latency or error rate is worse, lower throughput is worse
+            worse = change is not None and ((change > 5) if metric != 'rps' else (change < -5))
+            self.stdout.write(self.style.ERROR(line) if worse else line)
+    
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read results from {path}: {e}')
+
+
+def _fmt(value):
+    return '-' if value is None else f'{value:g}'
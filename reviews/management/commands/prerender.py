@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews import prerender
+
+
+class Command(BaseCommand):
+    help = 'Pre-render anonymous faculty, course and listing pages to PRERENDER_DIR'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Render every page (e.g. on deploy) instead of only the queued ones')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes for --all (default: CPU count)')
+        parser.add_argument('--watch', action='store_true',
+                            help='Keep running, rendering pages as they are queued')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between queue checks with --watch')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Queued pages claimed at a time')
+    
+    def handle(self, *args, **options):
+        if not prerender.enabled():
+            raise CommandError('Set PRERENDER=True to pre-render pages')
+        if options['all']:
+            rendered, total = prerender.build(workers=options['workers'], log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} of {total} pages to {prerender.root()}'))
+        while True:
+            rendered = prerender.drain(options['batch_size'])
+            if rendered or not options['watch']:
+                self.stdout.write(f'Rendered {rendered} queued pages')
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,60 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from reviews import archive, tenants
+from reviews.keywords import count_terms_batch, prune_terms, top_terms
+from reviews.models import CourseKeywordSummary, CourseReview, FacultyKeywordSummary, Review
+
+
+class Command(BaseCommand):
+    help = 'Rebuild faculty and course keyword summaries from all review descriptions, archived ones included'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes (default: CPU count)')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Faculty/courses handed to a worker at a time')
+    
+    def handle(self, *args, **options):
+        targets = [
+            (Review, 'faculty_id', FacultyKeywordSummary),
+            (CourseReview, 'course_id', CourseKeywordSummary),
+        ]
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for review_model, owner_field, summary_model in targets:
+                batches = self._batches(review_model, owner_field, options['batch_size'])
+                rebuilt = self._rebuild(pool, batches, owner_field, summary_model)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Rebuilt {rebuilt} {summary_model._meta.verbose_name_plural.lower()}'
+                ))
+    
+    def _batches(self, review_model, owner_field, batch_size):
+        """Stream descriptions (archived reviews' too) grouped by owner without loading every review at once"""
+        rows = archive.owner_rows(review_model, owner_field, 'description')
+        batch = []
+        for owner_id, group in groupby(rows, key=lambda row: row[0]):
+            batch.append((owner_id, [description for _, description in group]))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def _rebuild(self, pool, batches, owner_field, summary_model):
+        rebuilt = 0
+        with tenants.atomic():
+            summary_model.objects.all().delete()
+            for results in pool.map(count_terms_batch, batches):
+                summary_model.objects.bulk_create([
+                    summary_model(**{
+                        owner_field: owner_id,
+                        'term_counts': prune_terms(counts),
+                        'top_terms': top_terms(counts),
+                        'review_count': review_count,
+                    })
+                    for owner_id, counts, review_count in results
+                ])
+                rebuilt += len(results)
+        return rebuilt
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from reviews import scores
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the faculty and course per-question score rollups from all reviews'
+    
+    def handle(self, *args, **options):
+        written = scores.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} question score rows'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from reviews import similar
+from reviews.models import Faculty
+from reviews.signals import pages_changed
+
+
+class Command(BaseCommand):
+    help = 'Recompute "similar faculty" recommendations for faculty whose reviews or courses changed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every faculty member instead of only the changed ones')
+        parser.add_argument('--rebuild-profiles', action='store_true',
+                            help='Recount tag and rating profiles from all reviews first (implies --full)')
+    
+    def handle(self, *args, **options):
+        full = options['full']
+        if options['rebuild_profiles']:
+            rebuilt = similar.rebuild_profiles()
+            self.stdout.write(f'Rebuilt profiles of {rebuilt} reviewed faculty')
+            full = True
+        changed = similar.refresh(full=full)
+        if changed:
+            # Faculty pages embed the list, so their cached copies are stale
+            department_ids = Faculty.objects.filter(id__in=changed).values_list('department_id', flat=True)
+            pages_changed(faculty_ids=changed, department_ids=set(department_ids))
+        self.stdout.write(self.style.SUCCESS(f'Updated similar faculty of {len(changed)} faculty members'))
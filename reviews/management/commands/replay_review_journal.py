@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from reviews import writebehind
+
+
+class Command(BaseCommand):
+    help = 'Save reviews left in write-behind journals by stopped or crashed processes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None,
+                            help='Journal directory (default: WRITE_BEHIND_DIR)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Reviews saved per transaction')
+        parser.add_argument('--dead-letter', action='store_true',
+                            help='Retry the reviews moved to dead-letter.jsonl after failing repeatedly')
+    
+    def handle(self, *args, **options):
+        if options['dead_letter']:
+            saved, failed = writebehind.replay_dead_letters(options['dir'])
+            self.stdout.write(self.style.SUCCESS(f'Saved {saved} dead-lettered reviews'))
+            if failed:
+                self.stdout.write(self.style.WARNING(f'{failed} still fail and are back in the dead-letter file'))
+            return
+        saved = writebehind.recover(options['dir'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Saved {saved} reviews from the journal'))
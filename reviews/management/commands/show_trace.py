@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews.tracing import read_spans
+
+
+class Command(BaseCommand):
+    help = 'Print the span timeline of a trace (the slowest one if no id is given) from a JSONL span file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('trace_id', nargs='?')
+        parser.add_argument('--file', default=settings.TRACING.get('OPTIONS', {}).get('path'),
+                            help='JSONL span file (default: TRACING OPTIONS path)')
+        parser.add_argument('--route', help='With no trace id, pick the slowest trace of this route')
+    
+    def handle(self, *args, **options):
+        try:
+            spans = read_spans(options['file'])
+        except OSError as e:
+            raise CommandError(f'Cannot read spans: {e}')
+        
+        trace_id = options['trace_id']
+        if not trace_id:
+            roots = [
+                s for s in spans
+                if s['kind'] == 'server'
+                and (not options['route'] or s['attributes'].get('http.route') == options['route'])
+            ]
+            if not roots:
+                raise CommandError('No traced requests found')
+            trace_id = max(roots, key=lambda s: s['duration_ms'])['trace_id']
+        
+        spans = [s for s in spans if s['trace_id'] == trace_id]
+        if not spans:
+            raise CommandError(f'Trace {trace_id} not found')
+        
+        ids = {s['span_id'] for s in spans}
+        children = defaultdict(list)
+        for s in spans:
+            children[s['parent_id'] if s['parent_id'] in ids else None].append(s)
+        start = min(s['start_ns'] for s in spans)
+        
+        self.stdout.write(f'Trace {trace_id}')
+        self.stdout.write(f'{"offset ms":>10} {"duration ms":>12}  span')
+        
+        def show(parent_id, depth):
+            for s in sorted(children[parent_id], key=lambda s: s['start_ns']):
+                detail = s['attributes'].get('db.statement') or s['attributes'].get('template.name') or ''
+                line = (
+                    f'{(s["start_ns"] - start) / 1e6:10.2f} {s["duration_ms"]:12.2f}  '
+                    f'{"  " * depth}{s["name"]}{"  " + detail[:80] if detail else ""}'
+                )
+                self.stdout.write(self.style.ERROR(line) if s['status'] == 'error' else line)
+                show(s['span_id'], depth + 1)
+        
+        show(None, 0)
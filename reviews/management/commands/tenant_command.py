@@ -0,0 +1,69 @@
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management import get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews import tenants
+
+
+def takes_database(name):
+    """Whether a command has a --database option (migrate, createsuperuser, ...)"""
+    command = load_command_class(get_commands()[name], name)
+    parser = command.create_parser('manage.py', name)
+    return any('--database' in action.option_strings for action in parser._actions)
+
+
+class Command(BaseCommand):
+    help = 'Run a management command once per tenant, each in its own process, several tenants at a time'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', default='',
+                            help='Comma-separated tenant names (default: every tenant in TENANTS)')
+        parser.add_argument('--parallel', type=int, default=4,
+                            help='Tenants processed at the same time')
+        parser.add_argument('command_name', help='Command to run, e.g. migrate or refresh_similar_faculty')
+        parser.add_argument('command_args', nargs=argparse.REMAINDER,
+                            help='Arguments passed on to the command')
+    
+    def handle(self, *args, **options):
+        name = options['command_name']
+        if name not in get_commands():
+            raise CommandError(f'Unknown command: {name}')
+        try:
+            selected = ([tenants.get(t.strip()) for t in options['tenants'].split(',') if t.strip()]
+                        or tenants.all_tenants())
+        except LookupError as e:
+            raise CommandError(e)
+
+        command_args = list(options['command_args'])
+        # The process talks to 'default' unless told otherwise; point it at the tenant's database
+        add_database = takes_database(name) and not any(a.startswith('--database') for a in command_args)
+
+        def run(tenant):
+            argv = [sys.executable, str(settings.BASE_DIR / 'manage.py'), name, *command_args]
+            if add_database:
+                argv += ['--database', tenant.database]
+            result = subprocess.run(
+                argv, env={**os.environ, 'TENANT': tenant.name},
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            )
+            return tenant, result
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(options['parallel'], 1)) as pool:
+            for future in as_completed([pool.submit(run, tenant) for tenant in selected]):
+                tenant, result = future.result()
+                for line in result.stdout.splitlines():
+                    self.stdout.write(f'[{tenant.name}] {line}')
+                if result.returncode:
+                    failed.append(tenant.name)
+                    self.stderr.write(f'[{tenant.name}] exited with status {result.returncode}')
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'[{tenant.name}] done'))
+        if failed:
+            raise CommandError(f'{name} failed for: {", ".join(sorted(failed))}')
@@ -0,0 +1,76 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+def otlp_spans(payload):
+    """Flatten an OTLP/JSON export request into JSONL span dicts (reviews.tracing format)"""
+    for resource_spans in payload.get('resourceSpans', []):
+        for scope_spans in resource_spans.get('scopeSpans', []):
+            for s in scope_spans.get('spans', []):
+                start, end = int(s['startTimeUnixNano']), int(s['endTimeUnixNano'])
+                yield {
+                    'trace_id': s['traceId'],
+                    'span_id': s['spanId'],
+                    'parent_id': s.get('parentSpanId') or None,
+                    'name': s['name'],
+                    'kind': 'server' if s.get('kind') == 2 else 'internal',
+                    'start_ns': start,
+                    'end_ns': end,
+                    'duration_ms': round((end - start) / 1e6, 3),
+                    'status': 'error' if s.get('status', {}).get('code') == 2 else 'ok',
+                    'attributes': {
+                        a['key']: next(iter(a['value'].values()), None) for a in s.get('attributes', [])
+                    },
+                }
+
+
+class Command(BaseCommand):
+    help = 'Run a local OTLP/HTTP JSON collector stand-in that writes received spans to a JSONL file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=4318)
+        parser.add_argument('--output', default='traces/collected.jsonl',
+                            help='JSONL file spans are appended to (default: traces/collected.jsonl)')
+    
+    def handle(self, *args, **options):
+        output = options['output']
+        stdout = self.stdout
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.rstrip('/') != '/v1/traces':
+                    self.send_error(404)
+                    return
+                try:
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    spans = list(otlp_spans(json.loads(body)))
+                except (ValueError, KeyError) as e:
+                    self.send_error(400, str(e))
+                    return
+                with open(output, 'a') as f:
+                    for s in spans:
+                        f.write(json.dumps(s) + '\n')
+                for s in spans:
+                    if not s['parent_id'] or s['kind'] == 'server':
+                        stdout.write(f'{s["trace_id"]}  {s["duration_ms"]:9.2f} ms  {s["name"]}')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{}')
+            
+            def log_message(self, format, *args):
+                pass
+        
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(f'Collecting spans on http://{options["host"]}:{options["port"]}/v1/traces -> {output}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,194 @@
+"""
+Prometheus metrics for views, database, cache, OTP mail, review submissions, live streams and logging.
+
+Exposed at ``/metrics`` (see ``views.metrics_view``). With several worker
+processes (gunicorn, uWSGI) set the PROMETHEUS_MULTIPROC_DIR environment
+variable to an empty, writable directory before the workers start: every
+process then writes its samples there and the endpoint aggregates them, so a
+scrape reflects all workers no matter which one answers it. When a worker
+exits its files should be released, e.g. in gunicorn's ``child_exit`` hook::
+
+    from prometheus_client import multiprocess
+
+    def child_exit(server, worker):
+        multiprocess.mark_process_dead(worker.pid)
+"""
+import os
+import time
+from contextlib import ExitStack
+
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+from django.utils.module_loading import import_string
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from prometheus_client import multiprocess
+
+REQUEST_LATENCY = Histogram(
+    'classcritic_request_duration_seconds',
+    'Time spent handling a request, by URL name',
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Counter(
+    'classcritic_db_queries_total',
+    'Database queries executed, by URL name',
+    ['view'],
+)
+DB_QUERY_TIME = Counter(
+    'classcritic_db_query_seconds_total',
+    'Time spent in database queries, by URL name',
+    ['view'],
+)
+CACHE_REQUESTS = Counter(
+    'classcritic_cache_requests_total',
+    'Cache lookups by cache alias and result (hit/miss)',
+    ['cache', 'result'],
+)
+OTP_EMAILS = Counter(
+    'classcritic_otp_emails_total',
+    'OTP emails by result (sent/failed)',
+    ['result'],
+)
+SMTP_SEND_LATENCY = Histogram(
+    'classcritic_smtp_send_duration_seconds',
+    'Time spent handing an OTP email to the mail backend',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REVIEW_SUBMISSIONS = Counter(
+    'classcritic_review_submissions_total',
+    'Reviews stored, by kind (faculty/course)',
+    ['kind'],
+)
+STALE_PAGES_SERVED = Counter(
+    'classcritic_stale_pages_served_total',
+    'Pages answered from the last good copy during database overload, by page',
+    ['page'],
+)
+LIVE_STREAMS = Gauge(
+    'classcritic_live_streams',
+    'Open live review update streams (Server-Sent Events)',
+    multiprocess_mode='livesum',
+)
+LOG_RECORDS_DROPPED = Counter(
+    'classcritic_log_records_dropped_total',
+    'Log records dropped because the logging queue was full',
+)
+
+
+def exposition():
+    """Render all metrics (aggregated across worker processes when enabled)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and their total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def observe_request(request, get_response):
+    """Call the rest of the stack, recording latency and DB usage for the request"""
+    timer = QueryTimer()
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        response = get_response(request)
+    elapsed = time.perf_counter() - started
+
+    match = getattr(request, 'resolver_match', None)
+    view = (match.url_name or match.view_name) if match else 'unresolved'
+    REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(elapsed)
+    DB_QUERIES.labels(view).inc(timer.count)
+    DB_QUERY_TIME.labels(view).inc(timer.seconds)
+    return response
+
+
+class InstrumentedCache(BaseCache):
+    """
+    Cache backend wrapper that counts hits and misses of another backend.
+
+    Configure with ``'BACKEND': 'reviews.metrics.InstrumentedCache'`` and the
+    real backend in ``OPTIONS['BACKEND']``; other settings are passed through.
+    """
+
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.get('OPTIONS', {}))
+        backend_class = import_string(options.pop('BACKEND', 'django.core.cache.backends.locmem.LocMemCache'))
+        params['OPTIONS'] = options
+        self._backend = backend_class(location, params)
+        self._alias = params.get('ALIAS', location or 'default')
+        super().__init__(params)
+
+    def _count(self, hits, misses):
+        if hits:
+            CACHE_REQUESTS.labels(self._alias, 'hit').inc(hits)
+        if misses:
+            CACHE_REQUESTS.labels(self._alias, 'miss').inc(misses)
+
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = self._backend.get(key, self._missing, version=version)
+        if value is self._missing:
+            self._count(0, 1)
+            return default
+        self._count(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self._backend.get_many(keys, version=version)
+        self._count(len(found), len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        return self._backend.has_key(key, version=version)
+
+    def add(self, *args, **kwargs):
+        return self._backend.add(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._backend.set(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._backend.set_many(*args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        return self._backend.touch(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._backend.delete(*args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        return self._backend.delete_many(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self._backend.incr(*args, **kwargs)
+
+    def decr(self, *args, **kwargs):
+        return self._backend.decr(*args, **kwargs)
+
+    def clear(self):
+        return self._backend.clear()
+
+    def close(self, **kwargs):
+        return self._backend.close(**kwargs)
@@ -0,0 +1,414 @@
+"""
+Custom middleware for ClassCritic.
+"""
+import asyncio
+import json
+import mimetypes
+import os
+import re
+import secrets
+import zlib
+from gzip import GzipFile
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.crypto import get_random_string
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date
+from django.utils.text import StreamingBuffer
+
+from . import metrics, profiling, tenants, tracing
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Hashed (fingerprinted) assets never change, so browsers may keep them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Precompressed variants in order of preference: (Content-Encoding, suffix)
+STATIC_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+class MetricsMiddleware:
+    """Record per-view latency and database usage; should be first in MIDDLEWARE"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return metrics.observe_request(request, self.get_response)
+
+
+class TracingMiddleware:
+    """Trace sampled requests (see reviews/tracing.py); should follow MetricsMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return tracing.trace_request(request, self.get_response)
+
+
+class TenantMiddleware:
+    """Activate the tenant serving the request's host name; must precede SessionMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tenant = tenants.for_host(request.get_host())
+        if tenant is None:
+            raise Http404('No university is hosted at this address')
+        request.tenant = tenant
+        with tenants.activate(tenant):
+            return self.get_response(request)
+
+
+class TracingViewMiddleware:
+    """Record the view call as its own span; must be last in MIDDLEWARE"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if tracing.current_span() is None or asyncio.iscoroutinefunction(view_func):
+            return None
+        with tracing.span('view', **{'view.name': request.resolver_match.view_name}):
+            return view_func(request, *view_args, **view_kwargs)
+
+
+class StaticFile:
+    """A collected static file and its precompressed variants"""
+
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.mtime = int(stat.st_mtime)
+        # Weak, so the same validator covers the plain and compressed variants
+        self.etag = f'W/"{self.mtime:x}-{stat.st_size:x}"'
+        self.immutable = immutable
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.variants = {
+            encoding: path + suffix
+            for encoding, suffix in STATIC_ENCODINGS
+            if os.path.exists(path + suffix)
+        }
+
+
+class StaticFilesMiddleware:
+    """
+    Serve files from STATIC_ROOT in-process, so no separate web server is needed.
+
+    Picks the brotli or gzip variant written by ``collectstatic`` when the client
+    accepts it, and marks fingerprinted files as immutable for far-future caching.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.root = getattr(settings, 'STATIC_ROOT', None)
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60)
+        self._files = None
+
+    def __call__(self, request):
+        if self.root and request.path_info.startswith(self.prefix):
+            static_file = self.files.get(request.path_info[len(self.prefix):])
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    @property
+    def files(self):
+        """Index of collected files, built once per process"""
+        if self._files is None:
+            self._files = self._scan()
+        return self._files
+
+    def _scan(self):
+        files = {}
+        if not os.path.isdir(self.root):
+            return files
+
+        immutable_names = set()
+        manifest_path = os.path.join(self.root, 'staticfiles.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                immutable_names = set(json.load(f).get('paths', {}).values())
+
+        compressed_suffixes = tuple(suffix for _, suffix in STATIC_ENCODINGS)
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(compressed_suffixes) or filename == 'staticfiles.json':
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[name] = StaticFile(path, immutable=name in immutable_names)
+        return files
+
+    def serve(self, request, static_file):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+        response = get_conditional_response(
+            request, etag=static_file.etag, last_modified=static_file.mtime,
+        )
+        if response is None:
+            path, encoding = static_file.path, None
+            accepted = accepted_encodings(request)
+            for candidate, variant_path in static_file.variants.items():
+                if candidate in accepted:
+                    path, encoding = variant_path, candidate
+                    break
+
+            response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.headers['Last-Modified'] = http_date(static_file.mtime)
+            response.headers['ETag'] = static_file.etag
+
+        if static_file.immutable:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={self.max_age}'
+        if static_file.variants:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+
+def accepted_encodings(request):
+    """Set of content codings listed in the request's Accept-Encoding header"""
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return {token.split(';')[0].strip().lower() for token in header.split(',') if token.strip()}
+
+
+COMPRESSIBLE_CONTENT_TYPES = (
+    'text/html', 'text/plain', 'text/css', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+)
+
+# Blocks whose whitespace is significant and must survive minification
+HTML_PRESERVE_RE = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.S | re.I)
+HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+HTML_SPACE_RE = re.compile(r'[ \t]{2,}')
+
+
+def minify_html(html):
+    """Drop comments and collapse whitespace runs outside of pre/textarea/script/style"""
+    parts = HTML_PRESERVE_RE.split(html)
+    output = []
+    # re.split yields [text, block, tag name, text, block, tag name, ...]
+    for i in range(0, len(parts), 3):
+        text = HTML_COMMENT_RE.sub('', parts[i])
+        lines = (line.strip() for line in text.splitlines())
+        minified = HTML_SPACE_RE.sub(' ', '\n'.join(line for line in lines if line))
+        # Keep a separator where whitespace touched a preserved block
+        if minified and text[:1].isspace():
+            minified = '\n' + minified
+        if minified and text[-1:].isspace():
+            minified += '\n'
+        output.append(minified)
+        if i + 1 < len(parts):
+            output.append(parts[i + 1])
+    return ''.join(output)
+
+
+class GzipStream:
+    """Incremental gzip encoder that flushes after every chunk"""
+
+    # Random gzip header padding to mitigate BREACH (as Django's GZipMiddleware does)
+    max_random_bytes = 100
+
+    def __init__(self, level):
+        self.buffer = StreamingBuffer()
+        self.file = GzipFile(
+            filename=get_random_string(secrets.randbelow(self.max_random_bytes) + 1).encode(),
+            mode='wb', compresslevel=level, fileobj=self.buffer, mtime=0,
+        )
+
+    def compress(self, data):
+        self.file.write(data)
+        self.file.flush(zlib.Z_SYNC_FLUSH)
+        return self.buffer.read()
+
+    def finish(self):
+        self.file.close()
+        return self.buffer.read()
+
+
+class BrotliStream:
+    """Incremental brotli encoder that flushes after every chunk"""
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress dynamic responses with brotli (when installed) or gzip.
+
+    Handles regular and streaming (sync or async) responses, skips bodies
+    smaller than COMPRESSION_MIN_SIZE, and optionally minifies HTML first
+    when HTML_MINIFY is enabled.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 200)
+        self.gzip_level = getattr(settings, 'COMPRESSION_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+        self.minify = getattr(settings, 'HTML_MINIFY', False)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in COMPRESSIBLE_CONTENT_TYPES:
+            return response
+
+        if not response.streaming:
+            if self.minify and content_type == 'text/html':
+                response.content = minify_html(response.content.decode(response.charset))
+                response.headers['Content-Length'] = str(len(response.content))
+            if len(response.content) < self.min_size:
+                return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.compress_async(
+                    response.streaming_content, self.encoder(encoding)
+                )
+            else:
+                response.streaming_content = self.compress_sync(
+                    response.streaming_content, self.encoder(encoding)
+                )
+            # The compressed size isn't known until the stream is consumed
+            del response.headers['Content-Length']
+        else:
+            encoder = self.encoder(encoding)
+            compressed = encoder.compress(response.content) + encoder.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Compressed bodies differ byte-for-byte, so a strong ETag must become weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def choose_encoding(self, request):
+        accepted = accepted_encodings(request)
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def encoder(self, encoding):
+        if encoding == 'br':
+            return BrotliStream(self.brotli_quality)
+        return GzipStream(self.gzip_level)
+
+    @staticmethod
+    def compress_sync(chunks, encoder):
+        for chunk in chunks:
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+
+    @staticmethod
+    async def compress_async(chunks, encoder):
+        async for chunk in chunks:
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+
+
+class ProfilingMiddleware:
+    """
+    Profile a single request when a staff user asks for it (see reviews.profiling).
+
+    Must come after AuthenticationMiddleware. Other requests only pay for a
+    substring check of the query string and a header lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profiling.requested_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+        if not profiling.capture_lock.acquire(blocking=False):
+            # Another capture is running in this process; serve normally
+            return self.get_response(request)
+        try:
+            with profiling.Capture(request, mode) as capture:
+                response = self.get_response(request)
+            metadata = capture.save(response)
+        finally:
+            profiling.capture_lock.release()
+        response.headers['X-Profile-Id'] = metadata['id']
+        return response
+
+
+class SurrogateKeyMiddleware(MiddlewareMixin):
+    """
+    Expose surrogate keys set with ``reviews.purge.tag_response`` to the proxy.
+
+    Anonymous responses are marked cacheable by shared caches for
+    SURROGATE_CACHE_MAX_AGE seconds (browsers still revalidate with the ETag);
+    anything personal, such as a verified student's view or a page showing
+    flash messages, is marked private.
+    """
+
+    def process_response(self, request, response):
+        keys = getattr(response, 'surrogate_keys', None)
+        if not keys or request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+
+        header = getattr(settings, 'SURROGATE_KEY_HEADER', 'Surrogate-Key')
+        response.headers[header] = ' '.join(tenants.scoped(key) for key in keys)
+
+        if self.is_shareable(request, response):
+            patch_cache_control(
+                response, public=True, max_age=0,
+                s_maxage=getattr(settings, 'SURROGATE_CACHE_MAX_AGE', 3600),
+            )
+        else:
+            patch_cache_control(response, private=True)
+        return response
+
+    @staticmethod
+    def is_shareable(request, response):
+        if response.cookies:
+            return False
+        session = getattr(request, 'session', None)
+        if session is not None and session.get('verified_student_id'):
+            return False
+        messages = getattr(request, '_messages', None)
+        # Messages get iterated (marked used) only when the page displayed some
+        return not (messages is not None and messages.used)
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_alter_review_student_coursereview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacultyKeywordSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term_counts', models.JSONField(blank=True, default=dict)),
+                ('top_terms', models.JSONField(blank=True, default=list, help_text='Top-k [term, count] pairs shown on the faculty page')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('faculty', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_summary', to='reviews.faculty')),
+            ],
+            options={
+                'verbose_name_plural': 'Faculty keyword summaries',
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseKeywordSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term_counts', models.JSONField(blank=True, default=dict)),
+                ('top_terms', models.JSONField(blank=True, default=list, help_text='Top-k [term, count] pairs shown on the course page')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_summary', to='reviews.course')),
+            ],
+            options={
+                'verbose_name_plural': 'Course keyword summaries',
+            },
+        ),
+    ]
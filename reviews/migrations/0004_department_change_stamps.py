@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_stamps(apps, schema_editor):
+    Department = apps.get_model('reviews', 'Department')
+    DepartmentChangeStamp = apps.get_model('reviews', 'DepartmentChangeStamp')
+    DepartmentChangeStamp.objects.bulk_create([
+        DepartmentChangeStamp(department_id=department_id)
+        for department_id in Department.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_keyword_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentChangeStamp',
+            fields=[
+                ('department', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='change_stamp', serialize=False, to='reviews.department')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_stamps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_department_change_stamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacultyNeighbors',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag_counts', models.JSONField(blank=True, default=dict)),
+                ('rating_counts', models.JSONField(blank=True, default=list, help_text='Number of reviews giving each of 0-10 points')),
+                ('neighbors', models.JSONField(blank=True, default=list, help_text='Top-k similar faculty shown on the faculty page')),
+                ('dirty', models.BooleanField(db_index=True, default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('faculty', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='reviews.faculty')),
+            ],
+            options={
+                'verbose_name_plural': 'Faculty neighbors',
+            },
+        ),
+    ]
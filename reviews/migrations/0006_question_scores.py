@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_scores(apps, schema_editor):
+    from django.db.models import Count, Sum
+
+    for review_name, score_name, owner in (
+        ('Review', 'FacultyQuestionScore', 'faculty_id'),
+        ('CourseReview', 'CourseQuestionScore', 'course_id'),
+    ):
+        review_model = apps.get_model('reviews', review_name)
+        score_model = apps.get_model('reviews', score_name)
+        rows = (review_model.objects.filter(question__isnull=False)
+                .values(owner, 'question_id')
+                .annotate(count=Count('id'), total=Sum('points'))
+                .order_by())
+        score_model.objects.bulk_create([
+            score_model(**{owner: row[owner]}, question_id=row['question_id'], count=row['count'], total=row['total'])
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0005_faculty_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacultyQuestionScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('faculty', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_scores', to='reviews.faculty')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='faculty_scores', to='reviews.question')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseQuestionScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_scores', to='reviews.course')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_scores', to='reviews.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='facultyquestionscore',
+            constraint=models.UniqueConstraint(fields=('faculty', 'question'), name='unique_faculty_question_score'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursequestionscore',
+            constraint=models.UniqueConstraint(fields=('course', 'question'), name='unique_course_question_score'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0006_question_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacultyTermScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term_start', models.DateField()),
+                ('term', models.CharField(help_text='Term label, e.g. "Spring 2025"', max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('faculty', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_scores', to='reviews.faculty')),
+            ],
+            options={
+                'ordering': ['term_start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseTermScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term_start', models.DateField()),
+                ('term', models.CharField(help_text='Term label, e.g. "Spring 2025"', max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_scores', to='reviews.course')),
+            ],
+            options={
+                'ordering': ['term_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='facultytermscore',
+            constraint=models.UniqueConstraint(fields=('faculty', 'term_start'), name='unique_faculty_term_score'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursetermscore',
+            constraint=models.UniqueConstraint(fields=('course', 'term_start'), name='unique_course_term_score'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:15
+
+from django.db import migrations, models
+import reviews.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0008_review_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='student',
+            name='student_id',
+            field=models.EmailField(help_text="Must be an email address on one of the university's student domains (TENANTS)", max_length=254, unique=True, validators=[reviews.models.validate_student_email]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0009_student_id_help_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrerenderQueue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.CharField(help_text='URL path and query, e.g. /faculty/3/', max_length=200, unique=True)),
+                ('queued_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Pre-render queue entry',
+                'verbose_name_plural': 'Pre-render queue',
+            },
+        ),
+    ]
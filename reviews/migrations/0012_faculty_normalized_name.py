@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:27
+
+from django.db import migrations, models
+
+
+def fill_normalized_names(apps, schema_editor):
+    from reviews.models import normalize_name
+
+    faculty_model = apps.get_model('reviews', 'Faculty')
+    faculty = list(faculty_model.objects.only('id', 'name'))
+    for f in faculty:
+        f.normalized_name = normalize_name(f.name)
+    faculty_model.objects.bulk_update(faculty, ['normalized_name'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0011_review_submission_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faculty',
+            name='normalized_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_normalized_names, migrations.RunPython.noop),
+    ]
@@ -1,20 +1,39 @@
+import re
+import unicodedata
+
 from django.db import models
+from django.db.models import Count, Sum
 from django.core.validators import MinValueValidator, MaxValueValidator, EmailValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import timedelta
 
+from . import tenants, tracing
+
 
 def validate_student_email(value):
-    """Validate that email ends with @std.ewubd.edu"""
-    if not value.endswith('@std.ewubd.edu'):
+    """Validate that email ends with one of the current university's student domains"""
+    tenant = tenants.current()
+    if not tenant.allows_email(value):
         raise ValidationError(
-            'Only @std.ewubd.edu email addresses are allowed for student registration.'
+            f'Only {tenant.email_hint} email addresses are allowed for student registration.'
         )
 
 
 # Word count validation removed - no minimum word requirement
 
+# Leading titles ignored when matching faculty names
+NAME_TITLES = {'dr', 'prof', 'professor', 'mr', 'mrs', 'ms', 'miss', 'engr'}
+
+
+def normalize_name(name):
+    """Lookup form of a person's name, e.g. 'Dr. José  Rahman' -> 'jose rahman'"""
+    text = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+    words = re.findall(r'\w+', text.lower())
+    while len(words) > 1 and words[0] in NAME_TITLES:
+        words.pop(0)
+    return ' '.join(words)
+
 
 class Department(models.Model):
     """Department model - represents academic departments"""
@@ -27,6 +46,21 @@ class Department(models.Model):
         return self.name
 
 
+class DepartmentChangeStamp(models.Model):
+    """Version counter bumped whenever anything shown for a department changes"""
+    department = models.OneToOneField(
+        Department,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='change_stamp'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.department} v{self.version}"
+
+
 class Course(models.Model):
     """Course model - represents courses offered by departments"""
     name = models.CharField(max_length=200)
@@ -36,6 +70,9 @@ class Course(models.Model):
         on_delete=models.CASCADE,
         related_name='courses'
     )
+    # Reviews moved to the archive, still counted in the averages
+    archived_review_count = models.PositiveIntegerField(default=0, editable=False)
+    archived_points = models.PositiveBigIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['code']
@@ -44,15 +81,16 @@ class Course(models.Model):
         return f"{self.code} - {self.name}"
     
     def average_rating(self):
-        """Calculate average rating from all course reviews"""
-        reviews = self.course_reviews.all()
-        if reviews.exists():
-            return round(sum(r.points for r in reviews) / reviews.count(), 2)
+        """Calculate average rating from all course reviews, archived ones included"""
+        row = self.course_reviews.aggregate(count=Count('id'), total=Sum('points'))
+        count = row['count'] + self.archived_review_count
+        if count:
+            return round(((row['total'] or 0) + self.archived_points) / count, 2)
         return 0
     
     def total_reviews(self):
-        """Get total number of course reviews"""
-        return self.course_reviews.count()
+        """Get total number of course reviews, archived ones included"""
+        return self.course_reviews.count() + self.archived_review_count
 
 
 class Faculty(models.Model):
@@ -66,6 +104,11 @@ class Faculty(models.Model):
         related_name='faculty_members'
     )
     courses = models.ManyToManyField(Course, related_name='faculty_members', blank=True)
+    # Reviews moved to the archive, still counted in the averages
+    archived_review_count = models.PositiveIntegerField(default=0, editable=False)
+    archived_points = models.PositiveBigIntegerField(default=0, editable=False)
+    # normalize_name(name), for batch lookups by name (see reviews/lookup.py)
+    normalized_name = models.CharField(max_length=200, db_index=True, editable=False, default='')
     
     class Meta:
         ordering = ['name']
@@ -74,16 +117,24 @@ class Faculty(models.Model):
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_name'}
+        super().save(*args, **kwargs)
+    
     def average_rating(self):
-        """Calculate average rating from all reviews"""
-        reviews = self.reviews.all()
-        if reviews.exists():
-            return round(sum(r.points for r in reviews) / reviews.count(), 2)
+        """Calculate average rating from all reviews, archived ones included"""
+        row = self.reviews.aggregate(count=Count('id'), total=Sum('points'))
+        count = row['count'] + self.archived_review_count
+        if count:
+            return round(((row['total'] or 0) + self.archived_points) / count, 2)
         return 0
     
     def total_reviews(self):
-        """Get total number of reviews"""
-        return self.reviews.count()
+        """Get total number of reviews, archived ones included"""
+        return self.reviews.count() + self.archived_review_count
 
 
 class Student(models.Model):
@@ -92,7 +143,7 @@ class Student(models.Model):
     student_id = models.EmailField(
         unique=True,
         validators=[validate_student_email],
-        help_text='Must be a valid @std.ewubd.edu email address'
+        help_text="Must be an email address on one of the university's student domains (TENANTS)"
     )
     email_verified = models.BooleanField(default=False)
     last_otp = models.CharField(max_length=6, blank=True, null=True)
@@ -168,7 +219,10 @@ class Review(models.Model):
         help_text='Select from predefined tags'
     )
     is_anonymous = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind submissions keep the time they were received
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Set on write-behind submissions, so a replayed journal entry is saved once
+    submission_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
     
     class Meta:
         ordering = ['-created_at']
@@ -190,7 +244,8 @@ class Review(models.Model):
                     raise ValidationError(f"Invalid tag: {tag}. Allowed tags: {', '.join(allowed_tags)}")
     
     def save(self, *args, **kwargs):
-        self.full_clean()
+        with tracing.span('full_clean', model=type(self).__name__):
+            self.full_clean()
         super().save(*args, **kwargs)
 
 
@@ -242,7 +297,10 @@ class CourseReview(models.Model):
         help_text='Select from predefined tags'
     )
     is_anonymous = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind submissions keep the time they were received
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Set on write-behind submissions, so a replayed journal entry is saved once
+    submission_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
     
     class Meta:
         ordering = ['-created_at']
@@ -264,5 +322,275 @@ class CourseReview(models.Model):
                     raise ValidationError(f"Invalid tag: {tag}. Allowed tags: {', '.join(allowed_tags)}")
     
     def save(self, *args, **kwargs):
-        self.full_clean()
+        with tracing.span('full_clean', model=type(self).__name__):
+            self.full_clean()
         super().save(*args, **kwargs)
+
+
+class FacultyKeywordSummary(models.Model):
+    """Precomputed "what students mention most" terms for a faculty member"""
+    faculty = models.OneToOneField(
+        Faculty,
+        on_delete=models.CASCADE,
+        related_name='keyword_summary'
+    )
+    term_counts = models.JSONField(default=dict, blank=True)
+    top_terms = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='Top-k [term, count] pairs shown on the faculty page'
+    )
+    review_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Faculty keyword summaries'
+    
+    def __str__(self):
+        return f"Keywords for {self.faculty}"
+
+
+class CourseKeywordSummary(models.Model):
+    """Precomputed "what students mention most" terms for a course"""
+    course = models.OneToOneField(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='keyword_summary'
+    )
+    term_counts = models.JSONField(default=dict, blank=True)
+    top_terms = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='Top-k [term, count] pairs shown on the course page'
+    )
+    review_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Course keyword summaries'
+    
+    def __str__(self):
+        return f"Keywords for {self.course}"
+
+
+class FacultyNeighbors(models.Model):
+    """Review profile of a faculty member and its precomputed most similar faculty"""
+    faculty = models.OneToOneField(
+        Faculty,
+        on_delete=models.CASCADE,
+        related_name='similar'
+    )
+    tag_counts = models.JSONField(default=dict, blank=True)
+    rating_counts = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='Number of reviews giving each of 0-10 points'
+    )
+    neighbors = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='Top-k similar faculty shown on the faculty page'
+    )
+    dirty = models.BooleanField(default=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Faculty neighbors'
+    
+    def __str__(self):
+        return f"Similar faculty for {self.faculty}"
+
+
+class FacultyQuestionScore(models.Model):
+    """Running count and sum of review points per faculty member and question"""
+    faculty = models.ForeignKey(
+        Faculty,
+        on_delete=models.CASCADE,
+        related_name='question_scores'
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.CASCADE,
+        related_name='faculty_scores'
+    )
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['faculty', 'question'], name='unique_faculty_question_score'),
+        ]
+    
+    def __str__(self):
+        return f"{self.faculty} / question {self.question_id}"
+    
+    @property
+    def mean(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+
+class CourseQuestionScore(models.Model):
+    """Running count and sum of review points per course and question"""
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='question_scores'
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.CASCADE,
+        related_name='course_scores'
+    )
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'question'], name='unique_course_question_score'),
+        ]
+    
+    def __str__(self):
+        return f"{self.course} / question {self.question_id}"
+    
+    @property
+    def mean(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+
+class FacultyTermScore(models.Model):
+    """Running count and sum of review points per faculty member and academic term"""
+    faculty = models.ForeignKey(
+        Faculty,
+        on_delete=models.CASCADE,
+        related_name='term_scores'
+    )
+    term_start = models.DateField()
+    term = models.CharField(max_length=50, help_text='Term label, e.g. "Spring 2025"')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['term_start']
+        constraints = [
+            models.UniqueConstraint(fields=['faculty', 'term_start'], name='unique_faculty_term_score'),
+        ]
+    
+    def __str__(self):
+        return f"{self.faculty} / {self.term}"
+
+
+class CourseTermScore(models.Model):
+    """Running count and sum of review points per course and academic term"""
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='term_scores'
+    )
+    term_start = models.DateField()
+    term = models.CharField(max_length=50, help_text='Term label, e.g. "Spring 2025"')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['term_start']
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'term_start'], name='unique_course_term_score'),
+        ]
+    
+    def __str__(self):
+        return f"{self.course} / {self.term}"
+
+
+class ArchivedReview(models.Model):
+    """A faculty review moved out of the hot Review table by archive_reviews"""
+    # Same id as the original review; relations are unconstrained so the
+    # archive can live in a separate database (ARCHIVE_DATABASE)
+    id = models.BigIntegerField(primary_key=True)
+    faculty = models.ForeignKey(
+        Faculty,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_reviews'
+    )
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    description = models.TextField()
+    points = models.IntegerField()
+    tags = models.JSONField(default=list, blank=True)
+    is_anonymous = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['faculty', '-created_at'], name='archived_review_faculty_idx')]
+    
+    def __str__(self):
+        return f"Archived review {self.id} for faculty {self.faculty_id}"
+
+
+class ArchivedCourseReview(models.Model):
+    """A course review moved out of the hot CourseReview table by archive_reviews"""
+    id = models.BigIntegerField(primary_key=True)
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_reviews'
+    )
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    description = models.TextField()
+    points = models.IntegerField()
+    tags = models.JSONField(default=list, blank=True)
+    is_anonymous = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['course', '-created_at'], name='archived_course_review_idx')]
+    
+    def __str__(self):
+        return f"Archived review {self.id} for course {self.course_id}"
+
+
+class PrerenderQueue(models.Model):
+    """A pre-rendered page whose file was removed and awaits regeneration"""
+    page = models.CharField(max_length=200, unique=True, help_text='URL path and query, e.g. /faculty/3/')
+    queued_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Pre-render queue entry'
+        verbose_name_plural = 'Pre-render queue'
+    
+    def __str__(self):
+        return self.page
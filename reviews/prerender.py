@@ -0,0 +1,350 @@
+"""
+Static pre-rendering of the pages anonymous visitors read most.
+
+With PRERENDER on, ``manage.py prerender --all`` renders the home and course
+list pages (unfiltered and per department) and every faculty and course page
+to HTML files under PRERENDER_DIR, plus gzip/brotli variants. StaticPages,
+wrapped around the WSGI application (AsyncStaticPages around the ASGI one),
+answers GETs for those pages without a session or messages cookie straight
+from the files, before any middleware, view or query runs; a front web
+server can serve the same files.
+
+When reviews or reference data change, the signal handlers call
+``pages_changed``: the affected pages are queued in PrerenderQueue within the
+same transaction, and their files are deleted once it commits so Django
+answers those pages until they are regenerated. ``manage.py prerender
+--watch`` renders queued pages as they arrive.
+"""
+import asyncio
+import gzip
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.db import connections
+from django.utils.http import http_date
+
+from . import refdata, tenants
+from .models import Course, Faculty, PrerenderQueue
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Precompressed variants in order of preference: (Content-Encoding, suffix)
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+PAGE_PATH_RE = re.compile(r'^/(?:(?:faculty|course)/\d+/|courses/)?$')
+LISTING_PATHS = ('/', '/courses/')
+
+# Pages rendered per task of a full build
+BUILD_CHUNK_SIZE = 50
+
+
+def enabled():
+    return getattr(settings, 'PRERENDER', False)
+
+
+def root():
+    """Directory of the active tenant's pre-rendered pages"""
+    return tenants.scoped(str(getattr(settings, 'PRERENDER_DIR', os.path.join(settings.BASE_DIR, 'prerendered'))))
+
+
+def page_file(page):
+    """File holding a page ("/faculty/3/", "/?department=2"), or None if it is never pre-rendered"""
+    path, _, query = page.partition('?')
+    if not PAGE_PATH_RE.match(path):
+        return None
+    name = 'index.html'
+    if query:
+        params = parse_qsl(query, keep_blank_values=True)
+        if path not in LISTING_PATHS or len(params) != 1 or params[0][0] != 'department' or not params[0][1].isdigit():
+            return None
+        name = f'department-{int(params[0][1])}.html'
+    return os.path.join(root(), *filter(None, path.split('/')), name)
+
+
+def listing_pages(department_ids=()):
+    return list(LISTING_PATHS) + [f'{path}?department={d}' for d in department_ids for path in LISTING_PATHS]
+
+
+def all_pages():
+    return (
+        listing_pages([d.id for d in refdata.departments()])
+        + [f'/faculty/{f}/' for f in Faculty.objects.order_by('id').values_list('id', flat=True)]
+        + [f'/course/{c}/' for c in Course.objects.order_by('id').values_list('id', flat=True)]
+    )
+
+
+def pages_changed(faculty_ids=(), course_ids=(), department_ids=()):
+    """Queue the pages showing these faculty, courses or departments for regeneration"""
+    if not enabled():
+        return
+    invalidate(
+        listing_pages(department_ids)
+        + [f'/faculty/{f}/' for f in faculty_ids if f]
+        + [f'/course/{c}/' for c in course_ids if c]
+    )
+
+
+def invalidate_all():
+    """Queue every page (department names and questions appear everywhere)"""
+    if enabled():
+        invalidate(all_pages())
+
+
+def invalidate(pages):
+    """Queue pages now and delete their files once the transaction commits"""
+    pages = sorted(set(pages))
+    PrerenderQueue.objects.bulk_create([PrerenderQueue(page=page) for page in pages],
+                                       batch_size=500, ignore_conflicts=True)
+    tenants.on_commit(lambda: remove(pages))
+
+
+def remove(pages):
+    for page in pages:
+        path = page_file(page)
+        if path is None:
+            continue
+        # The plain file first: StaticPages only looks for variants next to it
+        for name in [path] + [path + suffix for _, suffix in ENCODINGS]:
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+
+def _atomic_write(path, data):
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.prerender-')
+    with os.fdopen(descriptor, 'wb') as f:
+        f.write(data)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def write(page, body):
+    path = page_file(page)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Variants before the plain file, which is what makes the page servable
+    if brotli is not None:
+        _atomic_write(path + '.br', brotli.compress(body, quality=11))
+    _atomic_write(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))
+    _atomic_write(path, body)
+
+
+_handler = None
+
+
+def _host(tenant):
+    return next((host for host in tenant.hosts if host != '*'), 'localhost')
+
+
+def render(page):
+    """(status code, headers, body) of an anonymous GET of a page, through the full middleware stack"""
+    global _handler
+    if _handler is None:
+        from django.core.handlers.wsgi import WSGIHandler
+        _handler = WSGIHandler()
+    host = _host(tenants.current())
+    path, _, query = page.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started.append((int(status.split()[0]), headers))
+
+    result = _handler(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, headers = started[0]
+    return status, headers, body
+
+
+def render_page(page):
+    """Regenerate one page's files; False (and no file) if it isn't a plain cacheable page"""
+    try:
+        status, headers, body = render(page)
+    except Exception:
+        logger.exception('Pre-rendering %s failed', page)
+        status, headers, body = None, [], b''
+    names = {name.lower(): value for name, value in headers}
+    if status != 200 or 'set-cookie' in names or not names.get('content-type', '').startswith('text/html'):
+        remove([page])
+        return False
+    write(page, body)
+    return True
+
+
+def drain(batch_size=100):
+    """Regenerate queued pages until the queue is empty; returns how many were rendered"""
+    rendered = 0
+    while True:
+        rows = list(PrerenderQueue.objects.order_by('queued_at', 'id').values_list('id', 'page')[:batch_size])
+        if not rows:
+            return rendered
+        # Claim the batch; a change arriving while it renders queues the page again
+        PrerenderQueue.objects.filter(id__in=[row_id for row_id, _ in rows]).delete()
+        for _, page in rows:
+            rendered += render_page(page)
+
+
+def _render_chunk(tenant_name, pages):
+    with tenants.activate(tenant_name):
+        return sum(render_page(page) for page in pages)
+
+
+def build(workers=None, log=None):
+    """Render every page, in parallel worker processes; returns (rendered, pages)"""
+    log = log or (lambda message: None)
+    pages = all_pages()
+    # Everything queued so far is covered by this build
+    PrerenderQueue.objects.all().delete()
+    chunks = [pages[i:i + BUILD_CHUNK_SIZE] for i in range(0, len(pages), BUILD_CHUNK_SIZE)]
+    tenant_name = tenants.current().name
+    # Workers are forked; they must not share the parent's open connections
+    connections.close_all()
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        for count, chunk in zip(pool.map(_render_chunk, [tenant_name] * len(chunks), chunks), chunks):
+            rendered += count
+            log(f'{rendered} of {len(pages)} pages rendered')
+    return rendered, len(pages)
+
+
+def static_response(environ):
+    """
+    (status, headers, body) of a pre-rendered page for a WSGI environ, or None.
+
+    None sends the request on to Django: methods other than GET and HEAD,
+    requests with a session or messages cookie, and pages without a file.
+    """
+    if not enabled() or environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+        return None
+    personal = {settings.SESSION_COOKIE_NAME, 'messages'}
+    cookies = {part.split('=', 1)[0].strip() for part in environ.get('HTTP_COOKIE', '').split(';')}
+    if cookies & personal:
+        return None
+    tenant = tenants.for_host(environ.get('HTTP_HOST') or environ.get('SERVER_NAME', ''))
+    if tenant is None:
+        return None
+    query = environ.get('QUERY_STRING', '')
+    with tenants.activate(tenant):
+        path = page_file(environ.get('PATH_INFO', '') + (f'?{query}' if query else ''))
+    if path is None:
+        return None
+    try:
+        return _serve(environ, path)
+    except FileNotFoundError:
+        return None  # not rendered, or removed since; Django renders it
+
+
+def _serve(environ, path):
+    stat = os.stat(path)
+    etag = f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = [
+        ('Content-Type', 'text/html; charset=utf-8'),
+        ('ETag', etag),
+        ('Last-Modified', http_date(stat.st_mtime)),
+        ('Cache-Control', 'public, max-age=0'),
+        ('Vary', 'Accept-Encoding, Cookie'),
+    ]
+    if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+        return 304, headers, b''
+
+    accepted = {token.split(';')[0].strip().lower() for token in environ.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.exists(path + suffix):
+            path = path + suffix
+            headers.append(('Content-Encoding', encoding))
+            break
+    with open(path, 'rb') as f:
+        body = f.read()
+    headers.append(('Content-Length', str(len(body))))
+    return 200, headers, b'' if environ['REQUEST_METHOD'] == 'HEAD' else body
+
+
+class StaticPages:
+    """WSGI middleware answering anonymous GETs of pre-rendered pages from PRERENDER_DIR"""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        response = static_response(environ)
+        if response is None:
+            return self.application(environ, start_response)
+        status, headers, body = response
+        start_response('304 Not Modified' if status == 304 else '200 OK', headers)
+        return [body] if body else []
+
+
+class AsyncStaticPages:
+    """
+    ASGI counterpart of StaticPages, for classcritic.asgi (which live review updates need).
+
+    The files are looked up and read in a worker thread so the event loop
+    serving open event streams never waits on the disk.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        response = None
+        if scope['type'] == 'http' and enabled():
+            response = await asyncio.to_thread(static_response, _environ(scope))
+        if response is None:
+            return await self.application(scope, receive, send)
+        status, headers, body = response
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _environ(scope):
+    """The parts of a WSGI environ static_response reads, from an ASGI HTTP scope"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': (scope.get('server') or ('', None))[0] or '',
+    }
+    for name, value in scope.get('headers', ()):
+        key = 'HTTP_' + name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        # Repeated headers are joined, as a WSGI server does (cookies with "; ")
+        separator = '; ' if key == 'HTTP_COOKIE' else ','
+        environ[key] = f'{environ[key]}{separator}{value}' if key in environ else value
+    return environ
@@ -0,0 +1,214 @@
+"""
+On-demand per-request profiling for staff.
+
+A staff user adds ``?__profile=cprofile`` (or ``sample``) to a URL, or sends
+an ``X-Profile`` header, and that one request is captured with cProfile or a
+stack sampler plus tracemalloc allocation snapshots. Captures are stored in a
+bounded on-disk ring under PROFILE_DIR and browsed from the staff profiles
+page. Requests without the flag only pay for a substring check.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+QUERY_PARAM = '__profile'
+HEADER = 'HTTP_X_PROFILE'
+MODES = ('cprofile', 'sample')
+
+# tracemalloc and the profilers are process-wide, so capture one request at a time
+capture_lock = threading.Lock()
+
+
+def requested_mode(request):
+    """Profiling mode asked for by this request, or None (the common, cheap path)"""
+    if QUERY_PARAM in request.META.get('QUERY_STRING', ''):
+        mode = request.GET.get(QUERY_PARAM) or 'cprofile'
+    elif HEADER in request.META:
+        mode = request.META[HEADER] or 'cprofile'
+    else:
+        return None
+    mode = mode.lower()
+    return mode if mode in MODES else 'cprofile'
+
+
+def profile_dir():
+    return str(getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval into folded-stack counts"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """Brendan Gregg's collapsed format, ready for flamegraph.pl or speedscope"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class Capture:
+    """Profiles a single request and writes the result to the profile ring"""
+
+    def __init__(self, request, mode):
+        self.request = request
+        self.mode = mode
+        self.id = f'{timezone.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}'
+        self.profiler = None
+        self.sampler = None
+        self.started_tracemalloc = False
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(getattr(settings, 'PROFILE_TRACEMALLOC_FRAMES', 10))
+            self.started_tracemalloc = True
+        self.before = tracemalloc.take_snapshot()
+
+        if self.mode == 'sample':
+            self.sampler = StackSampler(
+                threading.get_ident(), getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001)
+            )
+            self.sampler.start()
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.started
+        if self.profiler:
+            self.profiler.disable()
+        if self.sampler:
+            self.sampler.stop()
+
+        after = tracemalloc.take_snapshot()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        self.allocations = after.compare_to(self.before, 'lineno')[:30]
+        return False
+
+    def save(self, response):
+        """Write the capture files and trim the ring to PROFILE_RING_SIZE entries"""
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.id)
+
+        files = {}
+        summary = ''
+        if self.profiler:
+            self.profiler.dump_stats(base + '.prof')
+            files['prof'] = self.id + '.prof'
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(40)
+            summary = out.getvalue()
+        if self.sampler:
+            with open(base + '.folded', 'w') as f:
+                f.write(self.sampler.folded())
+            files['folded'] = self.id + '.folded'
+            summary = ''.join(
+                f'{count:6d}  {stack.rsplit(";", 1)[-1]}\n'
+                for stack, count in self.sampler.stacks.most_common(40)
+            )
+
+        metadata = {
+            'id': self.id,
+            'mode': self.mode,
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'user': self.request.user.get_username(),
+            'status': getattr(response, 'status_code', None),
+            'captured_at': timezone.now().isoformat(),
+            'duration_ms': round(self.duration * 1000, 2),
+            'peak_memory_kb': round(self.peak / 1024, 1),
+            'allocations': [
+                {
+                    'location': str(stat.traceback[0]) if stat.traceback else '?',
+                    'size_diff_kb': round(stat.size_diff / 1024, 2),
+                    'count_diff': stat.count_diff,
+                }
+                for stat in self.allocations
+            ],
+            'summary': summary,
+            'files': files,
+        }
+        with open(base + '.json', 'w') as f:
+            json.dump(metadata, f, indent=2)
+        trim_ring(directory, getattr(settings, 'PROFILE_RING_SIZE', 50))
+        return metadata
+
+
+def trim_ring(directory, size):
+    """Delete the oldest captures beyond ``size``"""
+    captures = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for capture_id in captures[:-size] if size else captures:
+        for suffix in ('.json', '.prof', '.folded'):
+            try:
+                os.remove(os.path.join(directory, capture_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures():
+    """Stored captures, newest first"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            capture = load_capture(name[:-5])
+            if capture:
+                captures.append(capture)
+    return captures
+
+
+def load_capture(capture_id):
+    if os.sep in capture_id or capture_id.startswith('.'):
+        return None
+    try:
+        with open(os.path.join(profile_dir(), capture_id + '.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def capture_file_path(capture_id, kind):
+    """Path of a stored .prof/.folded file, or None if it isn't part of that capture"""
+    capture = load_capture(capture_id)
+    if capture is None or kind not in capture['files']:
+        return None
+    return os.path.join(profile_dir(), capture['files'][kind])
@@ -0,0 +1,122 @@
+"""
+Surrogate-key tagging and purging for a shared reverse-proxy cache.
+
+Pages are tagged with the faculty, course and department they show (see
+``tag_response``); ``SurrogateKeyMiddleware`` turns the tags into a header
+the proxy indexes on. When reviews are submitted or admins edit data, the
+signal handlers call ``schedule_purge`` with exactly the affected keys, and
+the configured backend tells the proxy to drop those pages once the
+transaction commits. Keys of tenants other than the first carry the
+tenant's name (``tenants.scoped``).
+"""
+import logging
+import urllib.request
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import tenants, tracing
+
+logger = logging.getLogger(__name__)
+
+# Listing pages without a department filter show every department
+ALL_DEPARTMENTS_KEY = 'departments'
+
+
+def faculty_key(faculty_id):
+    return f'faculty-{faculty_id}'
+
+
+def course_key(course_id):
+    return f'course-{course_id}'
+
+
+def department_key(department_id):
+    return f'department-{department_id}'
+
+
+def tag_response(response, *keys):
+    """Attach surrogate keys to a response for SurrogateKeyMiddleware"""
+    existing = getattr(response, 'surrogate_keys', [])
+    response.surrogate_keys = existing + [key for key in keys if key not in existing]
+    return response
+
+
+class NullPurgeBackend:
+    """Discard purges (no shared cache in front of the site)"""
+
+    def __init__(self, **options):
+        pass
+
+    def purge(self, keys):
+        pass
+
+
+class RecordingPurgeBackend(NullPurgeBackend):
+    """Keep purged keys in memory; a stand-in for the proxy in tests and development"""
+
+    purged = []
+
+    def purge(self, keys):
+        RecordingPurgeBackend.purged.append(sorted(keys))
+
+    @classmethod
+    def reset(cls):
+        cls.purged.clear()
+
+    @classmethod
+    def purged_keys(cls):
+        return {key for batch in cls.purged for key in batch}
+
+
+class HTTPPurgeBackend(NullPurgeBackend):
+    """
+    Send a PURGE request listing the keys in a header (Varnish xkey / Fastly style).
+
+    OPTIONS: ``url`` of the proxy purge endpoint, ``method`` (default PURGE),
+    ``header`` carrying the keys and ``timeout`` in seconds.
+    """
+
+    def __init__(self, url='', method='PURGE', header=None, timeout=2, **options):
+        self.url = url
+        self.method = method
+        self.header = header or getattr(settings, 'SURROGATE_KEY_HEADER', 'Surrogate-Key')
+        self.timeout = timeout
+
+    def purge(self, keys):
+        if not self.url:
+            return
+        request = urllib.request.Request(
+            self.url, method=self.method,
+            headers=tracing.inject({self.header: ' '.join(sorted(keys))}),
+        )
+        try:
+            with tracing.span('cache.purge', keys=len(keys)), urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except OSError as e:
+            # A failed purge only means pages stay cached until they expire
+            logger.warning('Cache purge of %d keys failed: %s', len(keys), e)
+
+
+@lru_cache(maxsize=None)
+def get_purge_backend():
+    config = getattr(settings, 'CACHE_PURGE', {})
+    backend_class = import_string(config.get('BACKEND', 'reviews.purge.NullPurgeBackend'))
+    return backend_class(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def _reset_purge_backend(setting, **kwargs):
+    if setting == 'CACHE_PURGE':
+        get_purge_backend.cache_clear()
+
+
+def schedule_purge(keys):
+    """Purge keys once the current transaction commits (immediately in autocommit)"""
+    keys = set(keys)
+    if keys:
+        keys = {tenants.scoped(key) for key in keys}
+        tenants.on_commit(lambda: get_purge_backend().purge(keys))
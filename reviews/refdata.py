@@ -0,0 +1,123 @@
+"""
+Process-local cache of reference data: departments, questions, courses and tag choices.
+
+These tables change a few times a year, so each worker process keeps one
+snapshot in memory and views and forms read it without touching the
+database. Edits bump a version stamp file (REFDATA_VERSION_FILE); every
+process checks the file's stat at most once per REFDATA_CHECK_INTERVAL
+seconds and reloads its snapshot when the stamp has changed. All workers
+must see the same file, so on several hosts point it at a shared volume.
+Each tenant has its own snapshot and stamp file.
+"""
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from . import tenants
+from .models import Course, Department, Question, Review
+
+
+class Snapshot:
+    """Reference data as loaded at one version of the stamp"""
+
+    def __init__(self, stamp):
+        self.stamp = stamp
+        self.checked_at = time.monotonic()
+        self.departments = list(Department.objects.all())
+        self.questions = list(Question.objects.all())
+        self.courses = list(Course.objects.all())
+        self.by_id = {
+            'department': {d.pk: d for d in self.departments},
+            'question': {q.pk: q for q in self.questions},
+            'course': {c.pk: c for c in self.courses},
+        }
+
+
+# Tenant name -> Snapshot
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def version_file():
+    return tenants.scoped(str(getattr(settings, 'REFDATA_VERSION_FILE', os.path.join(settings.BASE_DIR, '.refdata-version'))))
+
+
+def _read_stamp():
+    try:
+        stat = os.stat(version_file())
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def snapshot():
+    """The current snapshot, reloaded if another process bumped the version"""
+    name = tenants.current().name
+    current = _snapshots.get(name)
+    interval = getattr(settings, 'REFDATA_CHECK_INTERVAL', 1.0)
+    if current is not None and time.monotonic() - current.checked_at < interval:
+        return current
+
+    stamp = _read_stamp()
+    if current is not None and current.stamp == stamp:
+        current.checked_at = time.monotonic()
+        return current
+    with _lock:
+        if _snapshots.get(name) is current:
+            _snapshots[name] = Snapshot(stamp)
+        return _snapshots[name]
+
+
+def warm():
+    """Load every tenant's snapshot at startup so the first requests don't pay for it"""
+    for tenant in tenants.all_tenants():
+        with tenants.activate(tenant):
+            snapshot()
+
+
+def bump():
+    """Invalidate every process's snapshot once the current transaction commits"""
+    tenants.on_commit(_write_stamp)
+
+
+def _write_stamp():
+    path = version_file()
+    temporary = f'{path}.{uuid.uuid4().hex}'
+    with open(temporary, 'w') as f:
+        f.write(uuid.uuid4().hex)
+    # A new file (inode) each time, so the change is seen even if mtime is coarse
+    os.replace(temporary, path)
+    _snapshots.pop(tenants.current().name, None)
+
+
+def departments():
+    return snapshot().departments
+
+
+def questions():
+    return snapshot().questions
+
+
+def courses():
+    return snapshot().courses
+
+
+def get(kind, pk):
+    """Cached department, question or course by primary key, or None"""
+    try:
+        return snapshot().by_id[kind].get(int(pk))
+    except (TypeError, ValueError):
+        return None
+
+
+def tag_names(model=Review):
+    """Allowed review tags of Review or CourseReview"""
+    return [tag for tag, _ in model.TAG_CHOICES]
+
+
+def tag_choices(model=Review):
+    return [(tag, tag) for tag in tag_names(model)]
+
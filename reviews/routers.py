@@ -0,0 +1,65 @@
+"""
+Database routing: the review archive and per-tenant databases.
+
+ArchivedReview and ArchivedCourseReview live in the active tenant's archive
+database, which is its own database unless a separate archive database
+(ARCHIVE_DATABASE) is configured; when it is separate, nothing else is
+migrated into it. Every other model goes to the active tenant's database
+(see reviews/tenants.py).
+"""
+from django.conf import settings
+
+from . import tenants
+
+ARCHIVE_MODELS = {'archivedreview', 'archivedcoursereview'}
+
+
+def archive_database():
+    return tenants.current().archive_database
+
+
+def is_archive_model(model):
+    return model._meta.app_label == 'reviews' and model._meta.model_name in ARCHIVE_MODELS
+
+
+def _route(model, hints):
+    if is_archive_model(model):
+        return archive_database()
+    instance = hints.get('instance')
+    if instance is not None and is_archive_model(type(instance)):
+        # Faculty, courses etc. reached from an archived review stay in the tenant's database
+        return tenants.database()
+    return None
+
+
+class ArchiveRouter:
+    def db_for_read(self, model, **hints):
+        return _route(model, hints)
+    
+    def db_for_write(self, model, **hints):
+        return _route(model, hints)
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Archived reviews point across databases on purpose (db_constraint=False)
+        if is_archive_model(type(obj1)) or is_archive_model(type(obj2)):
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        archive = getattr(settings, 'ARCHIVE_DATABASE', 'default')
+        if archive == 'default':
+            return None
+        if app_label == 'reviews' and model_name in ARCHIVE_MODELS:
+            # Only the first tenant's archive is separate
+            return db != 'default'
+        if db == archive:
+            return False
+        return None
+
+
+class TenantRouter:
+    def db_for_read(self, model, **hints):
+        return tenants.database()
+    
+    def db_for_write(self, model, **hints):
+        return tenants.database()
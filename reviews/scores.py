@@ -0,0 +1,139 @@
+"""
+Per-question score rollups.
+
+FacultyQuestionScore and CourseQuestionScore hold the count and sum of
+review points for every (faculty or course, question) pair and are updated
+in place as reviews are submitted or deleted. Detail pages and the
+department heatmap read these rows instead of grouping over the raw
+reviews.
+"""
+from django.db import IntegrityError
+from django.db.models import Count, F, Sum
+
+from . import archive, refdata, tenants
+from .models import CourseQuestionScore, CourseReview, Faculty, FacultyQuestionScore, Review
+
+KINDS = {'faculty', 'course'}
+
+
+def _target(review):
+    if isinstance(review, CourseReview):
+        return CourseQuestionScore, 'course_id', review.course_id
+    return FacultyQuestionScore, 'faculty_id', review.faculty_id
+
+
+def apply_review(review, sign=1):
+    """Add (sign=1) or remove (sign=-1) a review's points from its question's rollup"""
+    if review.question_id is None:
+        return
+    model, owner_field, owner_id = _target(review)
+    rows = model.objects.filter(**{owner_field: owner_id}, question_id=review.question_id)
+    if sign < 0:
+        rows = rows.filter(count__gt=0)
+    change = {'count': F('count') + sign, 'total': F('total') + sign * review.points}
+    if rows.update(**change) or sign < 0:
+        return
+    try:
+        with tenants.atomic():
+            model.objects.create(**{owner_field: owner_id}, question_id=review.question_id,
+                                 count=1, total=review.points)
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(**change)
+
+
+def rebuild():
+    """Recompute every rollup from the reviews, archived ones included; returns the number of rows written"""
+    written = 0
+    with tenants.atomic():
+        for review_model, model, owner_field in (
+            (Review, FacultyQuestionScore, 'faculty_id'),
+            (CourseReview, CourseQuestionScore, 'course_id'),
+        ):
+            model.objects.all().delete()
+            # Archived reviews still count; the archive may be another database, so sum the two here
+            sums = {}
+            for source in (review_model, archive.archive_of(review_model)):
+                rows = (source.objects.filter(question__isnull=False)
+                        .values_list(owner_field, 'question_id')
+                        .annotate(count=Count('id'), total=Sum('points'))
+                        .order_by())
+                for owner_id, question_id, count, total in rows:
+                    entry = sums.setdefault((owner_id, question_id), [0, 0])
+                    entry[0] += count
+                    entry[1] += total
+            created = model.objects.bulk_create([
+                model(**{owner_field: owner_id}, question_id=question_id, count=count, total=total)
+                for (owner_id, question_id), (count, total) in sums.items()
+            ], batch_size=1000)
+            written += len(created)
+    return written
+
+
+def _mean(count, total):
+    return round(total / count, 2) if count else None
+
+
+def _scores(model, **owner):
+    """[{question, count, mean}] for one faculty member or course, in question order"""
+    rows = model.objects.filter(**owner, count__gt=0).order_by('question_id').values_list('question_id', 'count', 'total')
+    scores = []
+    for question_id, count, total in rows:
+        question = refdata.get('question', question_id)
+        if question is not None:
+            scores.append({'question': question.text, 'count': count, 'mean': _mean(count, total)})
+    return scores
+
+
+def faculty_scores(faculty_id):
+    return _scores(FacultyQuestionScore, faculty_id=faculty_id)
+
+
+def course_scores(course_id):
+    return _scores(CourseQuestionScore, course_id=course_id)
+
+
+def _hue(mean):
+    """Red (0/10) through yellow to green (10/10)"""
+    return round(mean * 12)
+
+
+def department_matrix(department_id, kind='faculty'):
+    """Faculty (or course) x question matrix of one department for the heatmap"""
+    if kind == 'course':
+        owners = [(c.id, f'{c.code} - {c.name}') for c in refdata.courses() if c.department_id == department_id]
+        owners.sort(key=lambda owner: owner[1])
+        rows = CourseQuestionScore.objects.filter(course__department_id=department_id).values_list(
+            'course_id', 'question_id', 'count', 'total')
+    else:
+        owners = list(Faculty.objects.filter(department_id=department_id).order_by('name').values_list('id', 'name'))
+        rows = FacultyQuestionScore.objects.filter(faculty__department_id=department_id).values_list(
+            'faculty_id', 'question_id', 'count', 'total')
+
+    cells = {}
+    question_totals = {}
+    for owner_id, question_id, count, total in rows:
+        if count:
+            cells[owner_id, question_id] = (count, total)
+            seen = question_totals.setdefault(question_id, [0, 0])
+            seen[0] += count
+            seen[1] += total
+    questions = [q for q in refdata.questions() if q.id in question_totals]
+
+    def cell(count, total):
+        mean = _mean(count, total)
+        return {'count': count, 'mean': mean, 'hue': _hue(mean)}
+
+    return {
+        'questions': [
+            {'id': q.id, 'text': q.text, 'overall': cell(*question_totals[q.id])} for q in questions
+        ],
+        'rows': [
+            {
+                'id': owner_id,
+                'name': name,
+                'cells': [cell(*cells[owner_id, q.id]) if (owner_id, q.id) in cells else None for q in questions],
+            }
+            for owner_id, name in owners
+        ],
+    }
@@ -0,0 +1,152 @@
+"""
+Faceted review search.
+
+Each facet (department, faculty, tag, rating bucket) is counted over the
+reviews matching every *other* active filter, so the counts say how many
+results picking that value would give. Each facet is one grouped or
+conditional-aggregate query; the facet set is cached per filter
+combination and invalidated by the department change stamps that review
+writes bump.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from . import refdata
+from .models import DepartmentChangeStamp, Faculty, Review
+
+FILTERS = ('search', 'faculty', 'course', 'department', 'tag', 'rating')
+
+# (label, lowest points, highest points)
+RATING_BUCKETS = [
+    ('0-3', 0, 3),
+    ('4-6', 4, 6),
+    ('7-8', 7, 8),
+    ('9-10', 9, 10),
+]
+
+
+def tag_q(tag):
+    # Tags are stored as a JSON list; match the quoted string so one tag
+    # can't match inside another (SQLite has no JSON containment lookup)
+    return Q(tags__icontains=f'"{tag}"')
+
+
+def rating_q(label):
+    for bucket, low, high in RATING_BUCKETS:
+        if bucket == label:
+            return Q(points__gte=low, points__lte=high)
+    return None
+
+
+def read_filters(params):
+    """The active filters of a request's GET parameters, ignoring malformed ids"""
+    filters = {name: params.get(name, '').strip() for name in FILTERS}
+    for name in ('faculty', 'course', 'department'):
+        if not filters[name].isdigit():
+            filters[name] = ''
+    if filters['tag'] not in refdata.tag_names(Review):
+        filters['tag'] = ''
+    if rating_q(filters['rating']) is None:
+        filters['rating'] = ''
+    return filters
+
+
+def filter_reviews(filters, skip=None):
+    """Reviews matching ``filters``, leaving out the ``skip`` filter"""
+    reviews = Review.objects.all()
+    active = {name: value for name, value in filters.items() if value and name != skip}
+
+    if 'search' in active:
+        reviews = reviews.filter(
+            Q(description__icontains=active['search']) |
+            Q(faculty__name__icontains=active['search'])
+        )
+    if 'faculty' in active:
+        reviews = reviews.filter(faculty_id=active['faculty'])
+    if 'course' in active:
+        # A subquery instead of joining faculty__courses, which repeats a
+        # review once per matching course row
+        teachers = Faculty.courses.through.objects.filter(course_id=active['course']).values('faculty_id')
+        reviews = reviews.filter(faculty_id__in=teachers)
+    if 'department' in active:
+        reviews = reviews.filter(faculty__department_id=active['department'])
+    if 'tag' in active:
+        reviews = reviews.filter(tag_q(active['tag']))
+    if 'rating' in active:
+        reviews = reviews.filter(rating_q(active['rating']))
+    return reviews
+
+
+def _facets_version():
+    """Changes whenever a review is added or removed, or faculty/departments are edited"""
+    row = DepartmentChangeStamp.objects.aggregate(count=Count('pk'), version=Sum('version'))
+    return f"{row['count']}.{row['version'] or 0}"
+
+
+def compute_facets(filters):
+    departments = [
+        {'id': row['faculty__department_id'], 'name': row['faculty__department__name'], 'count': row['count']}
+        for row in filter_reviews(filters, skip='department')
+        .order_by()
+        .values('faculty__department_id', 'faculty__department__name')
+        .annotate(count=Count('id'))
+        .order_by('faculty__department__name')
+        if row['faculty__department_id'] is not None
+    ]
+    faculty = [
+        {'id': row['faculty_id'], 'name': row['faculty__name'], 'count': row['count']}
+        for row in filter_reviews(filters, skip='faculty')
+        .order_by()
+        .values('faculty_id', 'faculty__name')
+        .annotate(count=Count('id'))
+        .order_by('faculty__name')
+    ]
+    tag_counts = filter_reviews(filters, skip='tag').aggregate(**{
+        f'tag_{i}': Count('id', filter=tag_q(tag)) for i, (tag, _) in enumerate(Review.TAG_CHOICES)
+    })
+    rating_counts = filter_reviews(filters, skip='rating').aggregate(**{
+        f'rating_{i}': Count('id', filter=rating_q(label)) for i, (label, _, _) in enumerate(RATING_BUCKETS)
+    })
+    return {
+        'departments': departments,
+        'faculty': faculty,
+        'tags': [
+            {'id': tag, 'name': tag, 'count': tag_counts[f'tag_{i}']}
+            for i, (tag, _) in enumerate(Review.TAG_CHOICES)
+        ],
+        'ratings': [
+            {'id': label, 'name': label, 'count': rating_counts[f'rating_{i}']}
+            for i, (label, _, _) in enumerate(RATING_BUCKETS)
+        ],
+    }
+
+
+def get_facets(filters):
+    """Facet counts for the current filters, cached until review data changes"""
+    raw = '|'.join(f'{name}={filters[name]}' for name in FILTERS)
+    key = 'search-facets:{}:{}'.format(
+        _facets_version(), hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    )
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        _keep_selected(facets, filters)
+        cache.set(key, facets, getattr(settings, 'SEARCH_FACET_CACHE_TIMEOUT', 300))
+    return facets
+
+
+def _keep_selected(facets, filters):
+    """A selected value with no matches still needs an option to stay selected"""
+    selected = filters['department']
+    if selected and not any(str(item['id']) == selected for item in facets['departments']):
+        department = refdata.get('department', selected)
+        if department is not None:
+            facets['departments'].append({'id': department.id, 'name': department.name, 'count': 0})
+    selected = filters['faculty']
+    if selected and not any(str(item['id']) == selected for item in facets['faculty']):
+        label = Faculty.objects.filter(id=selected).values_list('name', flat=True).first()
+        if label is not None:
+            facets['faculty'].append({'id': int(selected), 'name': label, 'count': 0})
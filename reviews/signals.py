@@ -0,0 +1,173 @@
+"""
+Signal handlers keeping precomputed review data in sync with review writes.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import archive, freshness, keywords, live, metrics, prerender, purge, refdata, scores, similar, terms
+from .models import (
+    ArchivedCourseReview, ArchivedReview, Course, CourseReview, Department, DepartmentChangeStamp, Faculty,
+    Question, Review,
+)
+
+
+def pages_changed(faculty_ids=(), course_ids=(), department_ids=()):
+    """Invalidate every cached page showing these faculty, courses or departments"""
+    department_ids = {d for d in department_ids if d}
+    freshness.bump_departments(department_ids)
+    purge.schedule_purge(
+        [purge.faculty_key(f) for f in faculty_ids if f]
+        + [purge.course_key(c) for c in course_ids if c]
+        + [purge.department_key(d) for d in department_ids]
+        + [purge.ALL_DEPARTMENTS_KEY]
+    )
+    prerender.pages_changed(faculty_ids, course_ids, department_ids)
+
+
+def review_pages_changed(instance):
+    """Pages showing a faculty or course review (or its averages)"""
+    if isinstance(instance, CourseReview):
+        department_ids = Course.objects.filter(id=instance.course_id).values_list('department_id', flat=True)
+        pages_changed(course_ids=[instance.course_id], department_ids=department_ids)
+    else:
+        department_ids = Faculty.objects.filter(id=instance.faculty_id).values_list('department_id', flat=True)
+        pages_changed(faculty_ids=[instance.faculty_id], department_ids=department_ids)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=CourseReview)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    """Fold a newly submitted review into the precomputed summaries"""
+    if raw or not created:
+        return
+    metrics.REVIEW_SUBMISSIONS.labels('course' if sender is CourseReview else 'faculty').inc()
+    keywords.apply_review(instance)
+    scores.apply_review(instance)
+    terms.apply_review(instance)
+    if sender is Review:
+        similar.apply_review(instance)
+    review_pages_changed(instance)
+    live.review_added(instance)
+
+
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=CourseReview)
+def review_deleted(sender, instance, **kwargs):
+    """Take a deleted review back out of the precomputed summaries"""
+    if archive.is_archiving():
+        # Moved to the archive: still counted everywhere, and the archiver
+        # invalidates the pages once per batch
+        return
+    keywords.apply_review(instance, sign=-1)
+    scores.apply_review(instance, sign=-1)
+    terms.apply_review(instance, sign=-1)
+    if sender is Review:
+        similar.apply_review(instance, sign=-1)
+    review_pages_changed(instance)
+
+
+@receiver(pre_save, sender=Faculty)
+@receiver(pre_save, sender=Course)
+def remember_previous_department(sender, instance, raw=False, **kwargs):
+    """Keep the old department so a move invalidates both departments' pages"""
+    instance._previous_department_id = None
+    if not raw and instance.pk:
+        instance._previous_department_id = (
+            sender.objects.filter(pk=instance.pk).values_list('department_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Faculty)
+def faculty_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Name and designation are copied into other faculty's similar lists
+        similar.mark_dirty([instance.id])
+        pages_changed(
+            faculty_ids=[instance.id],
+            department_ids=[instance.department_id, instance._previous_department_id],
+        )
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Faculty pages list the courses they teach
+    teachers = list(instance.faculty_members.values_list('id', 'department_id'))
+    pages_changed(
+        faculty_ids=[faculty_id for faculty_id, _ in teachers],
+        course_ids=[instance.id],
+        department_ids=[instance.department_id, instance._previous_department_id]
+        + [department_id for _, department_id in teachers],
+    )
+
+
+@receiver(post_delete, sender=Faculty)
+def faculty_deleted(sender, instance, **kwargs):
+    # Archived reviews have no database-level cascade
+    ArchivedReview.objects.filter(faculty_id=instance.id).delete()
+    pages_changed(faculty_ids=[instance.id], department_ids=[instance.department_id])
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    ArchivedCourseReview.objects.filter(course_id=instance.id).delete()
+    pages_changed(course_ids=[instance.id], department_ids=[instance.department_id])
+
+
+@receiver(m2m_changed, sender=Faculty.courses.through)
+def faculty_courses_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # instance is a Course; pk_set holds faculty ids (None on clear)
+        faculty = Faculty.objects.filter(pk__in=pk_set) if pk_set else instance.faculty_members.all()
+        teachers = list(faculty.values_list('id', 'department_id'))
+        similar.mark_dirty([faculty_id for faculty_id, _ in teachers])
+        pages_changed(
+            faculty_ids=[faculty_id for faculty_id, _ in teachers],
+            department_ids=[department_id for _, department_id in teachers],
+        )
+    else:
+        similar.mark_dirty([instance.id])
+        pages_changed(faculty_ids=[instance.id], department_ids=[instance.department_id])
+
+
+@receiver(post_save, sender=Department)
+def department_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        freshness.ensure_stamp(instance)
+        pages_changed(department_ids=[instance.id])
+        # Department names appear on every faculty and course page
+        prerender.invalidate_all()
+
+
+@receiver(post_delete, sender=Department)
+def department_deleted(sender, instance, **kwargs):
+    pages_changed(department_ids=[instance.id])
+    prerender.invalidate_all()
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, raw=False, **kwargs):
+    # Question text is shown next to reviews in every department
+    if not raw:
+        freshness.bump_all_departments()
+        department_ids = DepartmentChangeStamp.objects.values_list('department_id', flat=True)
+        purge.schedule_purge(
+            [purge.department_key(d) for d in department_ids] + [purge.ALL_DEPARTMENTS_KEY]
+        )
+        prerender.invalidate_all()
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def reference_data_changed(sender, raw=False, **kwargs):
+    # Every worker process reloads its in-memory reference data
+    if not raw:
+        refdata.bump()
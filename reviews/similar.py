@@ -0,0 +1,256 @@
+"""
+"Similar faculty" recommendations.
+
+Each faculty member has a review profile kept up to date as reviews arrive
+(tag counts and a histogram of review points, in FacultyNeighbors). A batch
+job, ``manage.py refresh_similar_faculty``, compares the profiles and the
+courses faculty share with numpy and stores the SIMILAR_FACULTY_COUNT best
+matches of everyone, so the faculty page reads one precomputed list.
+
+Only pairs with a tag or a course in common score above zero, so the
+similarity matrix stays sparse and only its top-k per row is kept. Review
+writes, course changes and faculty edits mark rows dirty; a refresh
+recomputes the dirty rows plus the rows whose lists a dirty faculty member
+could enter or leave, which is exact because the similarity is symmetric.
+"""
+from collections import defaultdict
+from itertools import groupby
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import archive, refdata, tenants
+from .models import Faculty, FacultyNeighbors, Review
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+MAX_POINTS = 10
+
+# Share of each signal in the similarity score (they add up to 1)
+TAG_WEIGHT = 0.4
+RATING_WEIGHT = 0.3
+COURSE_WEIGHT = 0.3
+
+# Rows scored at once; bounds the (rows x faculty x 11) rating comparison
+CHUNK_SIZE = 64
+
+# Scores are stored rounded to 4 places
+SCORE_TOLERANCE = 1e-4
+
+
+def neighbor_count():
+    return getattr(settings, 'SIMILAR_FACULTY_COUNT', 5)
+
+
+def _padded(rating_counts):
+    counts = list(rating_counts or [])[:MAX_POINTS + 1]
+    return counts + [0] * (MAX_POINTS + 1 - len(counts))
+
+
+def apply_review(review, sign=1):
+    """Add (sign=1) or remove (sign=-1) a review from its faculty's profile"""
+    with tenants.atomic():
+        rows = FacultyNeighbors.objects.select_for_update()
+        if sign > 0:
+            profile, _ = rows.get_or_create(faculty_id=review.faculty_id)
+        else:
+            profile = rows.filter(faculty_id=review.faculty_id).first()
+            if profile is None:
+                return
+        tags = profile.tag_counts or {}
+        for tag in set(review.tags or ()):
+            count = tags.get(tag, 0) + sign
+            if count > 0:
+                tags[tag] = count
+            else:
+                tags.pop(tag, None)
+        ratings = _padded(profile.rating_counts)
+        if 0 <= review.points <= MAX_POINTS:
+            ratings[review.points] = max(ratings[review.points] + sign, 0)
+        profile.tag_counts = tags
+        profile.rating_counts = ratings
+        profile.dirty = True
+        profile.save()
+
+
+def mark_dirty(faculty_ids):
+    """Have the next refresh recompute these faculty members' neighbors"""
+    FacultyNeighbors.objects.filter(faculty_id__in=[f for f in faculty_ids if f]).update(dirty=True)
+
+
+def get_neighbors(faculty_id):
+    """Read only the precomputed neighbor list of one faculty member"""
+    return FacultyNeighbors.objects.filter(faculty_id=faculty_id).values_list('neighbors', flat=True).first() or []
+
+
+def rebuild_profiles(chunk_size=5000):
+    """Recount every profile from the reviews, archived ones included (e.g. after importing data)"""
+    tag_names = set(refdata.tag_names(Review))
+    profiles = {}
+    rows = archive.owner_rows(Review, 'faculty_id', 'points', 'tags', chunk_size=chunk_size)
+    for faculty_id, group in groupby(rows, key=lambda row: row[0]):
+        tags, ratings = defaultdict(int), [0] * (MAX_POINTS + 1)
+        for _, points, review_tags in group:
+            for tag in set(review_tags or ()) & tag_names:
+                tags[tag] += 1
+            if 0 <= points <= MAX_POINTS:
+                ratings[points] += 1
+        profiles[faculty_id] = (dict(tags), ratings)
+
+    with tenants.atomic():
+        _ensure_rows()
+        rows = list(FacultyNeighbors.objects.all())
+        for row in rows:
+            row.tag_counts, row.rating_counts = profiles.get(row.faculty_id, ({}, [0] * (MAX_POINTS + 1)))
+            row.dirty = True
+        FacultyNeighbors.objects.bulk_update(rows, ['tag_counts', 'rating_counts', 'dirty'], batch_size=500)
+    return len(profiles)
+
+
+def _ensure_rows():
+    missing = Faculty.objects.filter(similar__isnull=True).values_list('id', flat=True)
+    FacultyNeighbors.objects.bulk_create([FacultyNeighbors(faculty_id=f) for f in missing], ignore_conflicts=True)
+
+
+class Profiles:
+    """Feature matrices of every faculty member; row i describes ids[i]"""
+
+    def __init__(self):
+        rows = list(FacultyNeighbors.objects.order_by('faculty_id')
+                    .values_list('faculty_id', 'tag_counts', 'rating_counts', 'neighbors'))
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.position = {faculty_id: i for i, faculty_id in enumerate(self.ids.tolist())}
+        self.current = [row[3] or [] for row in rows]
+
+        tag_names = refdata.tag_names(Review)
+        tags = np.array([[(row[1] or {}).get(tag, 0) for tag in tag_names] for row in rows], dtype=np.float64)
+        tags = tags.reshape(len(rows), len(tag_names))
+        norms = np.linalg.norm(tags, axis=1)
+        self.tags = tags / np.where(norms > 0, norms, 1)[:, None]
+
+        ratings = np.array([_padded(row[2]) for row in rows], dtype=np.float64).reshape(len(rows), MAX_POINTS + 1)
+        totals = ratings.sum(axis=1)
+        self.reviewed = totals > 0
+        self.cdf = ratings.cumsum(axis=1) / np.maximum(totals, 1)[:, None]
+
+        self.members = defaultdict(list)
+        self.courses = defaultdict(list)
+        for faculty_id, course_id in Faculty.courses.through.objects.values_list('faculty_id', 'course_id'):
+            if faculty_id in self.position:
+                self.members[course_id].append(self.position[faculty_id])
+                self.courses[self.position[faculty_id]].append(course_id)
+        self.members = {course_id: np.array(positions) for course_id, positions in self.members.items()}
+        self.course_counts = np.array([len(self.courses[i]) for i in range(len(rows))], dtype=np.float64)
+
+    def scores(self, positions):
+        """Similarity of the faculty at ``positions`` to everyone (len(positions) x n)"""
+        positions = np.asarray(positions)
+        tag = self.tags[positions] @ self.tags.T
+
+        # Rating profiles: 1 - earth mover's distance between point distributions
+        distance = np.abs(self.cdf[positions, None, :] - self.cdf[None, :, :]).sum(axis=2)
+        rating = 1 - distance / MAX_POINTS
+        rating[:, ~self.reviewed] = 0
+        rating[~self.reviewed[positions]] = 0
+
+        shared = np.zeros((len(positions), len(self.ids)), dtype=np.float64)
+        for row, position in enumerate(positions.tolist()):
+            for course_id in self.courses[position]:
+                shared[row, self.members[course_id]] += 1
+        union = self.course_counts[positions][:, None] + self.course_counts[None, :] - shared
+        overlap = shared / np.maximum(union, 1)
+
+        scores = TAG_WEIGHT * tag + RATING_WEIGHT * rating + COURSE_WEIGHT * overlap
+        scores[(tag <= 0) & (shared == 0)] = 0
+        scores[np.arange(len(positions)), positions] = 0
+        return scores
+
+    def chunks(self, positions):
+        positions = sorted(positions)
+        for start in range(0, len(positions), CHUNK_SIZE):
+            chunk = positions[start:start + CHUNK_SIZE]
+            yield chunk, self.scores(chunk)
+
+
+def _top(scores, k):
+    """Positions and scores of the k best positive entries of a score row, ties by id"""
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        # Everything tied with the k-th best, so the order below is deterministic
+        kth = np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+        candidates = candidates[scores[candidates] >= kth]
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return candidates[order], scores[candidates[order]]
+
+
+def _affected(profiles, dirty, k):
+    """Dirty rows plus every row a dirty faculty member could enter or leave"""
+    affected = set(dirty)
+    dirty_ids = set(profiles.ids[sorted(dirty)].tolist())
+    # Rows with fewer than k entries take any positive score
+    thresholds = np.full(len(profiles.ids), np.finfo(np.float64).tiny)
+    for i, current in enumerate(profiles.current):
+        listed = {entry['id'] for entry in current}
+        if listed & dirty_ids or any(faculty_id not in profiles.position for faculty_id in listed):
+            affected.add(i)
+        elif len(current) >= k:
+            # Stored scores are rounded; a tie with the last entry may still enter
+            thresholds[i] = current[-1]['score'] - SCORE_TOLERANCE
+    for _, scores in profiles.chunks(dirty):
+        # Similarity is symmetric: column j scores j against each dirty row
+        affected.update(np.flatnonzero(scores.max(axis=0) >= thresholds).tolist())
+    return affected
+
+
+def refresh(full=False):
+    """Recompute stale neighbor lists; returns the ids of faculty whose list changed"""
+    if np is None:
+        raise RuntimeError('numpy is required for similar faculty recommendations')
+    _ensure_rows()
+    rows = FacultyNeighbors.objects.all() if full else FacultyNeighbors.objects.filter(dirty=True)
+    dirty_ids = list(rows.values_list('faculty_id', flat=True))
+    if not dirty_ids:
+        return []
+    # Clear the flags before reading the profiles, so a review arriving
+    # during the refresh marks its row dirty again for the next run
+    FacultyNeighbors.objects.filter(faculty_id__in=dirty_ids).update(dirty=False)
+    try:
+        return _refresh(dirty_ids, full)
+    except Exception:
+        mark_dirty(dirty_ids)
+        raise
+
+
+def _refresh(dirty_ids, full):
+    k = neighbor_count()
+    profiles = Profiles()
+    dirty = [profiles.position[f] for f in dirty_ids if f in profiles.position]
+    affected = set(range(len(profiles.ids))) if full else _affected(profiles, dirty, k)
+
+    names = {
+        faculty_id: (name, designation)
+        for faculty_id, name, designation in Faculty.objects.values_list('id', 'name', 'designation')
+    }
+    now = timezone.now()
+    changed = []
+    for chunk, scores in profiles.chunks(affected):
+        with tenants.atomic():
+            for row, position in enumerate(chunk):
+                neighbors = []
+                for neighbor, score in zip(*_top(scores[row], k)):
+                    faculty_id = int(profiles.ids[neighbor])
+                    name, designation = names.get(faculty_id, ('', None))
+                    neighbors.append({
+                        'id': faculty_id,
+                        'name': name,
+                        'designation': designation,
+                        'score': round(float(score), 4),
+                    })
+                if neighbors != profiles.current[position]:
+                    faculty_id = int(profiles.ids[position])
+                    FacultyNeighbors.objects.filter(faculty_id=faculty_id).update(neighbors=neighbors, updated_at=now)
+                    changed.append(faculty_id)
+    return changed
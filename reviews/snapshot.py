@@ -0,0 +1,306 @@
+"""
+Columnar analytics snapshots (Parquet or Arrow IPC) of the review data.
+
+``export`` writes the small dimension tables (departments, faculty,
+courses) whole and streams ``Review``/``CourseReview`` rows, archived ones
+included, in chunks of record batches, so memory stays bounded by the chunk
+size. Tags, question
+texts, designations and names are dictionary-encoded against dictionaries
+built up front, so every batch shares them. Student identities are never
+exported.
+
+Review tables are incremental: each run appends a part file holding the
+reviews created after the previous run's watermark (kept in
+``manifest.json``) and up to ``settle`` seconds ago, so rows whose
+transaction commits a little after their ``created_at`` are not skipped.
+Reviews deleted after they were exported stay in the snapshot until the
+next ``full`` export. Archived reviews keep their ``created_at``, so each is
+exported once, from whichever table holds it; one archived while an export
+runs may be left out until the next ``full`` export. Requires pyarrow.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import ArchivedCourseReview, ArchivedReview, Course, CourseReview, Department, Faculty, Question, Review
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from pyarrow import ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+MANIFEST = 'manifest.json'
+DIMENSIONS = ('departments', 'faculty', 'courses')
+FACTS = ('reviews', 'course_reviews')
+
+
+def _dictionary(indices, values):
+    """DictionaryArray with int32 indices (None for missing values)"""
+    return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), values)
+
+
+class Encoder:
+    """Maps values to positions in a fixed dictionary shared by every batch"""
+
+    def __init__(self, values):
+        self.values = list(dict.fromkeys(values))
+        self.index = {value: i for i, value in enumerate(self.values)}
+        self.dictionary = pa.array(self.values, pa.string())
+
+    def encode(self, values):
+        return _dictionary([self.index.get(value) for value in values], self.dictionary)
+
+    def encode_lists(self, lists):
+        offsets, flat = [0], []
+        for items in lists:
+            flat.extend(self.index[item] for item in items or () if item in self.index)
+            offsets.append(len(flat))
+        return pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), _dictionary(flat, self.dictionary))
+
+
+class Writer:
+    """One output file, Parquet or Arrow IPC, written batch by batch"""
+
+    def __init__(self, path, schema, fmt):
+        self.path = path
+        self.rows = 0
+        if fmt == 'parquet':
+            self._writer = pq.ParquetWriter(path, schema, compression='zstd', use_dictionary=True)
+            self._write = self._writer.write_batch
+        else:
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = ipc.new_file(self._sink, schema, options=ipc.IpcWriteOptions(compression='zstd'))
+            self._write = self._writer.write_batch
+
+    def write(self, batch):
+        if batch.num_rows:
+            self._write(batch)
+            self.rows += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+        if hasattr(self, '_sink'):
+            self._sink.close()
+
+
+def _string_dictionary():
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def _dimension_tables():
+    departments = list(Department.objects.order_by('id').values_list('id', 'name'))
+    faculty = list(Faculty.objects.order_by('id').values_list('id', 'name', 'designation', 'department_id'))
+    courses = list(Course.objects.order_by('id').values_list('id', 'code', 'name', 'department_id'))
+
+    def encoded(values):
+        return pa.array(values, pa.string()).dictionary_encode()
+
+    return {
+        'departments': pa.table({
+            'id': pa.array([row[0] for row in departments], pa.int64()),
+            'name': encoded([row[1] for row in departments]),
+        }),
+        'faculty': pa.table({
+            'id': pa.array([row[0] for row in faculty], pa.int64()),
+            'name': encoded([row[1] for row in faculty]),
+            'designation': encoded([row[2] for row in faculty]),
+            'department_id': pa.array([row[3] for row in faculty], pa.int64()),
+        }),
+        'courses': pa.table({
+            'id': pa.array([row[0] for row in courses], pa.int64()),
+            'code': pa.array([row[1] for row in courses], pa.string()),
+            'name': encoded([row[2] for row in courses]),
+            'department_id': pa.array([row[3] for row in courses], pa.int64()),
+        }),
+    }
+
+
+def _fact_sources():
+    """(table name, models read (archive first), owner column, owner model) of the review tables"""
+    return [
+        ('reviews', (ArchivedReview, Review), 'faculty_id', Faculty),
+        ('course_reviews', (ArchivedCourseReview, CourseReview), 'course_id', Course),
+    ]
+
+
+def _owners(owner_model):
+    """{faculty or course id: (department id, designation)}"""
+    if owner_model is Faculty:
+        return {row[0]: row[1:] for row in Faculty.objects.values_list('id', 'department_id', 'designation')}
+    return {row[0]: (row[1], None) for row in owner_model.objects.values_list('id', 'department_id')}
+
+
+def fact_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('owner_id', pa.int64()),
+        ('department_id', pa.int64()),
+        ('designation', _string_dictionary()),
+        ('question', _string_dictionary()),
+        ('points', pa.int8()),
+        ('tags', pa.list_(_string_dictionary())),
+        ('is_anonymous', pa.bool_()),
+        ('created_at', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def _fact_batches(models, owner_field, owners, since, until, chunk_size, encoders):
+    # Department and designation come from the owner, not a join: the
+    # archive may be in another database
+    columns = ['id', owner_field, 'question_id', 'points', 'tags', 'is_anonymous', 'created_at']
+    schema = fact_schema()
+    chunk = []
+    for model in models:
+        rows = model.objects.filter(created_at__lte=until)
+        if since is not None:
+            rows = rows.filter(created_at__gt=since)
+        for row in rows.order_by('created_at', 'id').values_list(*columns).iterator(chunk_size=chunk_size):
+            # Archived reviews of a deleted faculty member or course are left out, like their hot reviews
+            if row[1] in owners:
+                chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield _fact_batch(chunk, owners, schema, encoders)
+                chunk = []
+    if chunk:
+        yield _fact_batch(chunk, owners, schema, encoders)
+
+
+def _fact_batch(chunk, owners, schema, encoders):
+    columns = list(zip(*chunk))
+    departments, designations = zip(*(owners[owner_id] for owner_id in columns[1]))
+    return pa.RecordBatch.from_arrays([
+        pa.array(columns[0], pa.int64()),
+        pa.array(columns[1], pa.int64()),
+        pa.array(departments, pa.int64()),
+        encoders['designation'].encode(designations),
+        encoders['question'].encode(columns[2]),
+        pa.array(columns[3], pa.int8()),
+        encoders['tags'].encode_lists(columns[4]),
+        pa.array(columns[5], pa.bool_()),
+        pa.array(columns[6], pa.timestamp('us', tz='UTC')),
+    ], schema=schema)
+
+
+def _encoders():
+    question_ids = list(Question.objects.order_by('id').values_list('id', 'text'))
+    question = Encoder([text for _, text in question_ids])
+    # Questions are looked up by id in the rows, encoded by their text
+    question.index = {qid: question.index[text] for qid, text in question_ids}
+    return {
+        'question': question,
+        'designation': Encoder(
+            d for d in Faculty.objects.order_by('designation').values_list('designation', flat=True).distinct() if d
+        ),
+        'tags': Encoder([tag for tag, _ in Review.TAG_CHOICES] + [tag for tag, _ in CourseReview.TAG_CHOICES]),
+    }
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def export(directory, fmt='parquet', full=False, chunk_size=50000, settle=60, log=None):
+    """Write or extend the snapshot in ``directory``; returns the new manifest"""
+    if pa is None:
+        raise RuntimeError('pyarrow is required for snapshots (pip install pyarrow)')
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {", ".join(FORMATS)}')
+    log = log or (lambda message: None)
+    extension = FORMATS[fmt]
+
+    manifest = None if full else read_manifest(directory)
+    if manifest is not None and manifest['format'] != fmt:
+        raise ValueError(f"Snapshot in {directory} is {manifest['format']}; use --full to switch format")
+    if manifest is None and os.path.isdir(directory):
+        for name in FACTS:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+    since = datetime.fromisoformat(manifest['watermark']) if manifest else None
+    until = timezone.now() - timedelta(seconds=settle)
+    if since is not None and until <= since:
+        log('Nothing new to export yet')
+        return manifest
+    manifest = manifest or {'format': fmt, 'parts': {name: [] for name in FACTS}}
+
+    for name, table in _dimension_tables().items():
+        # Small, and edited in place, so always rewritten whole
+        path = os.path.join(directory, name + extension)
+        writer = Writer(path + '.tmp', table.schema, fmt)
+        for batch in table.to_batches():
+            writer.write(batch)
+        writer.close()
+        os.replace(path + '.tmp', path)
+        log(f'{name}: {table.num_rows} rows')
+
+    encoders = _encoders()
+    part = until.strftime('%Y%m%dT%H%M%S%fZ')
+    for name, models, owner_field, owner_model in _fact_sources():
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+        relative = os.path.join(name, f'part-{part}{extension}')
+        writer = Writer(os.path.join(directory, relative + '.tmp'), fact_schema(), fmt)
+        for batch in _fact_batches(models, owner_field, _owners(owner_model),
+                                   since, until, chunk_size, encoders):
+            writer.write(batch)
+        writer.close()
+        if writer.rows:
+            os.replace(os.path.join(directory, relative + '.tmp'), os.path.join(directory, relative))
+            manifest['parts'][name].append({'file': relative, 'rows': writer.rows})
+        else:
+            os.remove(os.path.join(directory, relative + '.tmp'))
+        log(f'{name}: {writer.rows} new rows')
+
+    manifest['watermark'] = until.isoformat()
+    manifest['exported_at'] = timezone.now().isoformat()
+    with open(os.path.join(directory, MANIFEST + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(directory, MANIFEST + '.tmp'), os.path.join(directory, MANIFEST))
+    return manifest
+
+
+def live_table(name, chunk_size=50000):
+    """A review table (archived reviews included) read straight from the database, in the snapshot schema"""
+    if pa is None:
+        raise RuntimeError('pyarrow is required for snapshots (pip install pyarrow)')
+    encoders = _encoders()
+    for table_name, models, owner_field, owner_model in _fact_sources():
+        if table_name == name:
+            batches = _fact_batches(models, owner_field, _owners(owner_model),
+                                    None, timezone.now(), chunk_size, encoders)
+            return pa.Table.from_batches(list(batches), schema=fact_schema())
+    raise ValueError(f'Unknown review table {name!r}')
+
+
+def read_table(directory, name, columns=None):
+    """A snapshot table as one pyarrow Table (all parts of a review table)"""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f'No snapshot in {directory}')
+    extension = FORMATS[manifest['format']]
+    if name in FACTS:
+        paths = [os.path.join(directory, part['file']) for part in manifest['parts'][name]]
+    else:
+        paths = [os.path.join(directory, name + extension)]
+    if not paths:
+        return fact_schema().empty_table().select(columns) if columns else fact_schema().empty_table()
+
+    tables = []
+    for path in paths:
+        if manifest['format'] == 'parquet':
+            tables.append(pq.read_table(path, columns=columns))
+        else:
+            with pa.memory_map(path) as source:
+                table = ipc.open_file(source).read_all()
+            tables.append(table.select(columns) if columns else table)
+    # Parts have their own dictionaries; unify them so the table is one schema
+    return pa.concat_tables(tables, promote_options='permissive').unify_dictionaries()
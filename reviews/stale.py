@@ -0,0 +1,210 @@
+"""
+Serve the last good copy of a page while the database is overloaded.
+
+Every database query feeds ``health``: an exponentially weighted moving
+average of query latency, plus the time of the last "database is locked"
+error. While latency is above STALE_DB_LATENCY_THRESHOLD, or for
+STALE_LOCK_COOLDOWN seconds after a lock error, pages decorated with
+``serve_stale_on_overload`` are answered from the last successful render
+kept in the cache, marked stale, without touching the database. One
+background refresh per page (coalesced through ``cache.add``) renders a new
+copy that later readers get.
+
+Normal renders replace the kept copy at most every STALE_PAGE_REFRESH_INTERVAL
+seconds, so a healthy site is not writing every page it serves to the cache.
+Copies and refreshes are shared by the workers only when the cache is (e.g.
+Redis or Memcached); with the default LocMemCache each worker process keeps
+and refreshes its own.
+"""
+import contextvars
+import copy
+import hashlib
+import re
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.utils.cache import add_never_cache_headers, patch_vary_headers
+
+from . import metrics
+
+# The staleness banner goes right below the navigation bar (or atop the body)
+NAV_END_RE = re.compile(rb'</nav>', re.I)
+BODY_START_RE = re.compile(rb'<body[^>]*>', re.I)
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message or 'timeout' in message
+
+
+class DatabaseHealth:
+    """Query latency EWMA and recent lock errors, shared by all threads of the process"""
+
+    alpha = 0.2
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = 0.0
+        self.observed_at = 0.0
+        self.locked_at = 0.0
+
+    def observe(self, seconds):
+        with self.lock:
+            self.latency += self.alpha * (seconds - self.latency)
+            self.observed_at = time.monotonic()
+
+    def lock_error(self):
+        self.locked_at = time.monotonic()
+
+    def degraded(self):
+        cooldown = getattr(settings, 'STALE_LOCK_COOLDOWN', 15)
+        now = time.monotonic()
+        if now - self.locked_at < cooldown:
+            return True
+        # An old latency reading says nothing about the database now
+        return (
+            self.latency > getattr(settings, 'STALE_DB_LATENCY_THRESHOLD', 0.25)
+            and now - self.observed_at < cooldown
+        )
+
+    def reset(self):
+        with self.lock:
+            self.latency = self.observed_at = self.locked_at = 0.0
+
+
+health = DatabaseHealth()
+
+
+def _health_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as e:
+        if is_lock_error(e):
+            health.lock_error()
+        raise
+    finally:
+        health.observe(time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def _watch_connection(sender, connection, **kwargs):
+    if _health_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _health_wrapper)
+
+
+def page_key(name, request):
+    """Cache key of a page as seen by this visitor (anonymous, or one session)"""
+    session_cookie = request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+    raw = f'{request.get_full_path()}|{session_cookie}'
+    return f'stale:{name}:' + hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+
+def remember(key, request, response, force=False):
+    """Keep a successful render as the page's last good copy, unless the kept one is recent (or force)"""
+    if response.status_code != 200 or response.streaming:
+        return
+    if getattr(getattr(request, '_messages', None), 'used', False):
+        # The page shows one-off flash messages
+        return
+    interval = getattr(settings, 'STALE_PAGE_REFRESH_INTERVAL', 60)
+    # A small marker says the copy is recent, without reading the page back
+    if not cache.add(key + ':recent', 1, interval) and not force:
+        return
+    cache.set(key, {
+        'content': response.content,
+        'content_type': response.get('Content-Type'),
+        'etag': response.get('ETag'),
+        'rendered_at': time.time(),
+    }, getattr(settings, 'STALE_PAGE_MAX_AGE', 3600))
+
+
+def stale_response(request, entry):
+    age = max(0, int(time.time() - entry['rendered_at']))
+    if entry['etag'] and request.META.get('HTTP_IF_NONE_MATCH') == entry['etag']:
+        response = HttpResponseNotModified()
+    else:
+        banner = render_to_string('reviews/stale_banner.html', {'age_minutes': age // 60}).encode()
+        content = entry['content']
+        match = NAV_END_RE.search(content) or BODY_START_RE.search(content)
+        position = match.end() if match else 0
+        response = HttpResponse(content[:position] + banner + content[position:], content_type=entry['content_type'])
+    if entry['etag']:
+        response['ETag'] = entry['etag']
+    response['Age'] = str(age)
+    response['Warning'] = '110 - "Response is Stale"'
+    response['X-Stale'] = '1'
+    add_never_cache_headers(response)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def schedule_refresh(key, view, request, args, kwargs):
+    """Re-render the page in the background unless another worker already is"""
+    lock_key = key + ':refreshing'
+    if not cache.add(lock_key, 1, getattr(settings, 'STALE_REFRESH_TIMEOUT', 30)):
+        return
+    clone = copy.copy(request)
+    clone.META = {
+        name: value for name, value in request.META.items()
+        if name not in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+    }
+    # Leave flash messages for the visitor's next real page view
+    clone._messages = []
+    clone.__dict__.pop('_freshness', None)
+
+    def refresh():
+        try:
+            remember(key, clone, view(clone, *args, **kwargs), force=True)
+        except Exception:
+            pass  # the page stays stale; the next reader schedules another try
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    # Run in a copy of the request's context so the refresh sees its tenant
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(refresh,), name='stale-refresh', daemon=True).start()
+
+
+def serve_stale_on_overload(name):
+    """
+    View decorator: under database overload answer GETs from the last good copy.
+
+    Apply outermost so conditional-GET checks are skipped too while degraded.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = page_key(name, request)
+
+            if health.degraded():
+                entry = cache.get(key)
+                if entry is not None:
+                    schedule_refresh(key, view, request, args, kwargs)
+                    metrics.STALE_PAGES_SERVED.labels(name).inc()
+                    return stale_response(request, entry)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except OperationalError as e:
+                entry = cache.get(key) if is_lock_error(e) else None
+                if entry is None:
+                    raise
+                health.lock_error()
+                metrics.STALE_PAGES_SERVED.labels(name).inc()
+                return stale_response(request, entry)
+            remember(key, request, response)
+            return response
+        return wrapped
+    return decorator
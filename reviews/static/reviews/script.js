@@ -51,6 +51,35 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Live review updates (Server-Sent Events) on faculty and course pages
+    const reviewList = document.querySelector('.review-list[data-live-url]');
+    if (reviewList && window.EventSource) {
+        const source = new EventSource(reviewList.dataset.liveUrl);
+        source.addEventListener('review', function(event) {
+            const update = JSON.parse(event.data);
+            const rating = document.querySelector('[data-live-rating]');
+            const count = document.querySelector('[data-live-count]');
+            if (rating) {
+                rating.textContent = update.avg_rating;
+            }
+            if (count) {
+                count.textContent = `${update.total_reviews} review${update.total_reviews === 1 ? '' : 's'}`;
+            }
+            
+            // Skip reviews already shown (replayed after a reconnect) or hidden by the tag filter
+            const tagFilter = reviewList.dataset.tagFilter;
+            if (reviewList.querySelector(`[data-review-id="${update.review}"]`)
+                    || (tagFilter && !update.tags.includes(tagFilter))) {
+                return;
+            }
+            const empty = reviewList.querySelector('.review-empty');
+            if (empty) {
+                empty.remove();
+            }
+            reviewList.insertAdjacentHTML('afterbegin', update.html);
+        });
+    }
+    
     // Auto-dismiss messages after 5 seconds
     setTimeout(function() {
         const messages = document.querySelectorAll('.alert');
@@ -0,0 +1,119 @@
+"""
+Static file storage that fingerprints, minifies and precompresses assets.
+
+Runs as part of ``collectstatic``: every file gets a content-hashed name (via
+Django's manifest storage), CSS/JS are minified, and gzip/brotli variants are
+written next to each text asset so they can be served without compressing
+on every request (see ``reviews.middleware.StaticFilesMiddleware``).
+"""
+import gzip
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always written
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map')
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+CSS_STRING_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+CSS_SPACE_RE = re.compile(r'\s+')
+CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,>])\s*')
+# A colon followed by ';' or '}' before any '{' is a declaration's; in selectors
+# the space matters ("div :first-child" is not "div:first-child")
+CSS_DECLARATION_COLON_RE = re.compile(r'\s*:\s*(?=[^{};]*[;}])')
+CSS_PLACEHOLDER_RE = re.compile(r'\x00(\d+)\x00')
+JS_LINE_COMMENT_RE = re.compile(r'^\s*//.*$', re.M)
+
+
+def minify_css(source):
+    """Strip comments and redundant whitespace from a stylesheet, leaving strings intact"""
+    strings = []
+
+    def keep(match):
+        strings.append(match.group(0))
+        return f'\x00{len(strings) - 1}\x00'
+
+    code = CSS_STRING_RE.sub(keep, CSS_COMMENT_RE.sub('', source))
+    code = CSS_PUNCTUATION_RE.sub(r'\1', CSS_SPACE_RE.sub(' ', code))
+    code = CSS_DECLARATION_COLON_RE.sub(':', code).replace(';}', '}')
+    return CSS_PLACEHOLDER_RE.sub(lambda match: strings[int(match.group(1))], code).strip()
+
+
+def minify_js(source):
+    """Conservative JS minification: drop whole-line comments, indentation and blank lines"""
+    source = JS_LINE_COMMENT_RE.sub('', source)
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also minifies CSS/JS and writes .gz/.br variants"""
+
+    # Fall back to the plain file name instead of failing the request when
+    # an asset is missing from the manifest (e.g. collectstatic not run yet).
+    manifest_strict = False
+
+    # Variants are only kept when they save at least this fraction of bytes
+    min_compression_ratio = 0.95
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        for name in list(paths):
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            for target in {name, hashed_name} - {None}:
+                self._minify(target)
+                self._compress(target)
+
+    def _minify(self, name):
+        minifier = MINIFIERS.get(_extension(name))
+        if minifier is None or not self.exists(name):
+            return
+        with self.open(name) as f:
+            source = f.read().decode('utf-8')
+        self._replace(name, minifier(source).encode('utf-8'))
+
+    def _compress(self, name):
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return
+        with self.open(name) as f:
+            content = f.read()
+
+        variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content, quality=11)
+
+        for suffix, compressed in variants.items():
+            if len(compressed) < len(content) * self.min_compression_ratio:
+                self._replace(name + suffix, compressed)
+            elif self.exists(name + suffix):
+                self.delete(name + suffix)
+
+    def _replace(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content))
+
+
+def _extension(name):
+    dot = name.rfind('.')
+    return name[dot:].lower() if dot != -1 else ''
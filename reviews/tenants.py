@@ -0,0 +1,147 @@
+"""
+Universities hosted by the site (tenants).
+
+TENANTS (built in settings from the TENANTS environment variable) gives each
+tenant its host names, the email domains its students register with and its
+own database. TenantMiddleware activates the tenant matching the request's
+host name and TenantRouter sends every query to that tenant's database, so
+each university's data size, load and write locks stay its own.
+
+Outside a request (management commands, the shell) the TENANT setting is
+active, the first tenant unless set; ``manage.py tenant_command`` runs a
+command once per tenant. Code that starts threads must copy the context
+(``contextvars.copy_context().run``) for them to see the active tenant.
+
+The first tenant keeps the unprefixed database, files and surrogate keys,
+so a single-university deployment is unchanged.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.http.request import split_domain_port
+
+_active = ContextVar('tenant', default=None)
+
+
+class Tenant:
+    """One university: host names, student email domains and database alias"""
+
+    def __init__(self, name, hosts, email_domains, database, primary=False):
+        self.name = name
+        self.hosts = [host.lower() for host in hosts]
+        self.email_domains = [domain.lower().lstrip('@') for domain in email_domains]
+        self.database = database
+        self.primary = primary
+
+    def __repr__(self):
+        return f'<Tenant {self.name}>'
+
+    @property
+    def archive_database(self):
+        # A separate archive database (ARCHIVE_DATABASE) is set up for the first tenant only
+        return getattr(settings, 'ARCHIVE_DATABASE', 'default') if self.primary else self.database
+
+    @property
+    def email_hint(self):
+        """'@a.edu' or '@a.edu or @b.edu', for forms and templates"""
+        return ' or '.join(f'@{domain}' for domain in self.email_domains)
+
+    def allows_email(self, email):
+        return email.lower().rpartition('@')[2] in self.email_domains
+
+
+@lru_cache(maxsize=None)
+def registry():
+    """{name: Tenant} in TENANTS order"""
+    configured = getattr(settings, 'TENANTS', None) or {
+        'ewu': {'HOSTS': ['*'], 'EMAIL_DOMAINS': ['std.ewubd.edu'], 'DATABASE': 'default'},
+    }
+    return {
+        name: Tenant(name, entry['HOSTS'], entry['EMAIL_DOMAINS'], entry.get('DATABASE', 'default'), primary=i == 0)
+        for i, (name, entry) in enumerate(configured.items())
+    }
+
+
+@receiver(setting_changed)
+def _reset_registry(setting, **kwargs):
+    if setting in ('TENANTS', 'TENANT'):
+        registry.cache_clear()
+
+
+def get(name):
+    try:
+        return registry()[name]
+    except KeyError:
+        raise LookupError(f'Unknown tenant {name!r}; TENANTS has {", ".join(registry())}') from None
+
+
+def all_tenants():
+    return list(registry().values())
+
+
+def default():
+    """The tenant active outside requests (TENANT, or the first tenant)"""
+    name = getattr(settings, 'TENANT', '')
+    return get(name) if name else next(iter(registry().values()))
+
+
+def for_host(host):
+    """The tenant serving a host name (port ignored), or None"""
+    host = split_domain_port(host)[0] or host.lower()
+    wildcard = None
+    for tenant in registry().values():
+        if host in tenant.hosts:
+            return tenant
+        if wildcard is None and '*' in tenant.hosts:
+            wildcard = tenant
+    return wildcard
+
+
+def current():
+    return _active.get() or default()
+
+
+@contextmanager
+def activate(tenant):
+    """Route queries, cache keys and files to ``tenant`` (a Tenant or name) inside the block"""
+    token = _active.set(get(tenant) if isinstance(tenant, str) else tenant)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def database():
+    """Database alias of the active tenant"""
+    return current().database
+
+
+def atomic(**kwargs):
+    """transaction.atomic() on the active tenant's database"""
+    return transaction.atomic(using=database(), **kwargs)
+
+
+def on_commit(func):
+    """transaction.on_commit() on the active tenant's database"""
+    transaction.on_commit(func, using=database())
+
+
+def scoped(name):
+    """Per-tenant form of a shared name (surrogate key, file path); unchanged for the first tenant"""
+    tenant = current()
+    return name if tenant.primary else f'{name}-{tenant.name}'
+
+
+def make_key(key, key_prefix, version):
+    """Cache KEY_FUNCTION: Django's default key with the tenant's name added"""
+    return f'{key_prefix}:{current().name}:{version}:{key}'
+
+
+def context(request):
+    """Template context processor: the active tenant"""
+    return {'tenant': current()}
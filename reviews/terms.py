@@ -0,0 +1,190 @@
+"""
+Academic-term rollups of review points.
+
+ACADEMIC_TERMS lists the terms of a year in order as ``Name:MM-DD`` start
+dates (e.g. ``Spring:01-01,Summer:05-01,Fall:09-01``); a review belongs to
+the term whose start most recently precedes its local creation date.
+FacultyTermScore and CourseTermScore keep a count and sum of points per
+term, updated as reviews are written, so trend charts never scan reviews.
+After changing the calendar, rebuild them with ``manage.py backfill_term_scores``.
+"""
+from datetime import date
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import archive, tenants
+from .models import CourseReview, CourseTermScore, FacultyTermScore, Review
+
+DEFAULT_TERMS = 'Spring:01-01,Summer:05-01,Fall:09-01'
+
+CHART_WIDTH = 600
+CHART_HEIGHT = 140
+CHART_PADDING = 24
+# Term labels printed under the chart; the rest are in the point tooltips
+CHART_LABELS = 8
+
+
+@lru_cache(maxsize=None)
+def _parse_calendar(value):
+    terms = []
+    for entry in value.split(','):
+        name, _, start = entry.strip().rpartition(':')
+        month, _, day = start.partition('-')
+        terms.append(((int(month), int(day)), name.strip()))
+    terms.sort()
+    if not terms or any(not name for _, name in terms):
+        raise ValueError(f'ACADEMIC_TERMS must look like "{DEFAULT_TERMS}", got {value!r}')
+    return tuple(terms)
+
+
+def calendar():
+    """((month, day), name) of each term start, in calendar order"""
+    return _parse_calendar(getattr(settings, 'ACADEMIC_TERMS', DEFAULT_TERMS))
+
+
+def term_of(moment):
+    """(start date, label) of the term containing a datetime or date"""
+    day = timezone.localtime(moment).date() if hasattr(moment, 'hour') else moment
+    terms = calendar()
+    year, current = day.year, None
+    for (month, start_day), name in terms:
+        if (day.month, day.day) >= (month, start_day):
+            current = ((month, start_day), name)
+    if current is None:
+        # Before the first term start of the year: the last term of the previous year
+        year -= 1
+        current = terms[-1]
+    (month, start_day), name = current
+    return date(year, month, start_day), f'{name} {year}'
+
+
+def _target(review):
+    if isinstance(review, CourseReview):
+        return CourseTermScore, 'course_id', review.course_id
+    return FacultyTermScore, 'faculty_id', review.faculty_id
+
+
+def apply_review(review, sign=1):
+    """Add (sign=1) or remove (sign=-1) a review's points from its term's rollup"""
+    model, owner_field, owner_id = _target(review)
+    term_start, label = term_of(review.created_at)
+    rows = model.objects.filter(**{owner_field: owner_id}, term_start=term_start)
+    if sign < 0:
+        rows = rows.filter(count__gt=0)
+    change = {'count': F('count') + sign, 'total': F('total') + sign * review.points}
+    if rows.update(**change) or sign < 0:
+        return
+    try:
+        with tenants.atomic():
+            model.objects.create(**{owner_field: owner_id}, term_start=term_start, term=label,
+                                 count=1, total=review.points)
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(**change)
+
+
+def backfill(chunk_size=5000, log=None):
+    """
+    Rebuild both rollups from the reviews, archived ones included, one
+    transaction per chunk.
+
+    Rows are cleared and the highest review id noted in one transaction;
+    reviews created afterwards are counted by the signals and skipped here,
+    so the site can keep taking reviews during a backfill. The archive is
+    read first: a review deleted (or archived) before its chunk is reached
+    may leave its term one short.
+    """
+    log = log or (lambda message: None)
+    for review_model, model, owner_field in (
+        (Review, FacultyTermScore, 'faculty_id'),
+        (CourseReview, CourseTermScore, 'course_id'),
+    ):
+        sources = (archive.archive_of(review_model), review_model)
+        with tenants.atomic():
+            model.objects.all().delete()
+            last_ids = [source.objects.aggregate(last=Max('id'))['last'] or 0 for source in sources]
+        done = 0
+        for source, last_id in zip(sources, last_ids):
+            after = 0
+            while after < last_id:
+                chunk = list(source.objects.filter(id__gt=after, id__lte=last_id)
+                             .order_by('id').values_list('id', owner_field, 'points', 'created_at')[:chunk_size])
+                if not chunk:
+                    break
+                _apply_chunk(model, owner_field, chunk)
+                after = chunk[-1][0]
+                done += len(chunk)
+                log(f'{model._meta.verbose_name_plural}: {done} reviews')
+
+
+def _apply_chunk(model, owner_field, chunk):
+    sums = {}
+    for _, owner_id, points, created_at in chunk:
+        term_start, label = term_of(created_at)
+        entry = sums.setdefault((owner_id, term_start), [label, 0, 0])
+        entry[1] += 1
+        entry[2] += points
+
+    with tenants.atomic():
+        owners = {owner_id for owner_id, _ in sums}
+        existing = {
+            (getattr(row, owner_field), row.term_start): row
+            for row in model.objects.select_for_update().filter(**{f'{owner_field}__in': owners})
+        }
+        updated, created = [], []
+        for (owner_id, term_start), (label, count, total) in sums.items():
+            row = existing.get((owner_id, term_start))
+            if row is None:
+                created.append(model(**{owner_field: owner_id}, term_start=term_start, term=label,
+                                     count=count, total=total))
+            else:
+                row.count += count
+                row.total += total
+                updated.append(row)
+        model.objects.bulk_update(updated, ['count', 'total'], batch_size=500)
+        model.objects.bulk_create(created, batch_size=500)
+
+
+def _trend(model, **owner):
+    """Per-term mean points with SVG coordinates for the detail page chart"""
+    rows = list(model.objects.filter(**owner, count__gt=0).order_by('term_start').values_list('term', 'count', 'total'))
+    if not rows:
+        return None
+    inner_width = CHART_WIDTH - 2 * CHART_PADDING
+    inner_height = CHART_HEIGHT - 2 * CHART_PADDING
+    step = inner_width / max(len(rows) - 1, 1)
+    label_every = -(-len(rows) // CHART_LABELS)
+    points = []
+    for i, (term, count, total) in enumerate(rows):
+        mean = round(total / count, 2)
+        points.append({
+            'term': term,
+            'count': count,
+            'mean': mean,
+            'labelled': i % label_every == 0,
+            'x': round(CHART_PADDING + (i * step if len(rows) > 1 else inner_width / 2), 1),
+            'y': round(CHART_PADDING + inner_height * (1 - mean / 10), 1),
+        })
+    return {
+        'points': points,
+        'polyline': ' '.join(f"{p['x']},{p['y']}" for p in points),
+        'width': CHART_WIDTH,
+        'height': CHART_HEIGHT,
+        'top': CHART_PADDING,
+        'bottom': CHART_HEIGHT - CHART_PADDING,
+        'middle': CHART_PADDING + inner_height / 2,
+        'left': CHART_PADDING,
+        'right': CHART_WIDTH - CHART_PADDING,
+    }
+
+
+def faculty_trend(faculty_id):
+    return _trend(FacultyTermScore, faculty_id=faculty_id)
+
+
+def course_trend(course_id):
+    return _trend(CourseTermScore, course_id=course_id)
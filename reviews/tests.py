@@ -1,3 +1,855 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, router
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.test import LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics, archive, compare, keywords, live, loadtest, lookup, metrics, prerender, profiling, purge, refdata, scores,
+    search, similar, snapshot, stale, tenants, terms, tracing, writebehind,
+)
+from .models import (
+    ArchivedCourseReview, ArchivedReview, Course, CourseKeywordSummary, CourseQuestionScore, CourseReview,
+    CourseTermScore, Department, Faculty, FacultyKeywordSummary, FacultyNeighbors, FacultyQuestionScore,
+    FacultyTermScore, PrerenderQueue, Question, Review, Student,
+)
+from .log import RateLimitFilter
+from .middleware import CompressionMiddleware, StaticFilesMiddleware, TenantMiddleware
+from .storage import minify_css
+
+
+class MinifyCSSTests(SimpleTestCase):
+    def test_collapses_declaration_whitespace(self):
+        self.assertEqual(minify_css('a { color : red ; margin: 0 ; }'), 'a{color:red;margin:0}')
+
+    def test_keeps_descendant_pseudo_class_selector(self):
+        # "div :first-child" selects any first child inside a div, unlike "div:first-child"
+        self.assertEqual(minify_css('div :first-child { color: red }'), 'div :first-child{color:red}')
+        self.assertEqual(minify_css('@media print { ul :hover { top: 0 } }'), '@media print{ul :hover{top:0}}')
+
+    def test_leaves_strings_intact(self):
+        self.assertEqual(minify_css('a { content: "x : {  y" }'), 'a{content:"x : {  y"}')
+
+
+class CollectStaticTests(SimpleTestCase):
+    def test_assets_are_fingerprinted_minified_and_precompressed(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(source, 'site.css'), 'w') as f:
+                f.write('/* layout */\nbody {\n    margin : 0 ;\n    padding: 0;\n}\n' * 20)
+            with override_settings(STATICFILES_DIRS=[source], STATIC_ROOT=root,
+                                   STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder']):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                with open(os.path.join(root, 'staticfiles.json')) as f:
+                    hashed = json.load(f)['paths']['site.css']
+                self.assertNotEqual(hashed, 'site.css')
+                with open(os.path.join(root, hashed)) as f:
+                    self.assertEqual(f.read(), 'body{margin:0;padding:0}' * 20)
+
+                middleware = StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+                request = RequestFactory().get('/static/' + hashed, HTTP_ACCEPT_ENCODING='gzip, deflate')
+                response = middleware(request)
+                response.close()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+
+class CompressionTests(SimpleTestCase):
+    html = '<html>\n  <!-- nav -->\n  <body>\n' + '    <p>A   review</p>\n' * 30 + '<pre>  kept\n  as is</pre>\n</body></html>'
+
+    def compress(self, response, accept='gzip'):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept))
+
+    @override_settings(HTML_MINIFY=True)
+    def test_minifies_and_compresses_html(self):
+        response = HttpResponse(self.html)
+        response['ETag'] = '"v1"'
+        response = self.compress(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        html = gzip.decompress(response.content).decode()
+        self.assertNotIn('nav', html)
+        self.assertIn('<p>A review</p>\n<p>A review</p>', html)
+        self.assertIn('<pre>  kept\n  as is</pre>', html)
+
+    def test_compresses_streaming_responses(self):
+        response = self.compress(StreamingHttpResponse(chunk.encode() for chunk in self.html.splitlines(True)))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.html)
+
+    def test_leaves_small_or_unaccepted_responses_alone(self):
+        self.assertFalse(self.compress(HttpResponse('<p>short</p>')).has_header('Content-Encoding'))
+        self.assertFalse(self.compress(HttpResponse(self.html), accept='identity').has_header('Content-Encoding'))
+
+
+class KeywordSummaryTests(TestCase):
+    def test_summary_follows_review_writes(self):
+        department = Department.objects.create(name='MATH')
+        faculty = Faculty.objects.create(name='T. Islam', email='islam@ewubd.edu', department=department)
+        Review.objects.create(faculty=faculty, points=8, description='Clear lectures and fair grading')
+        review = Review.objects.create(faculty=faculty, points=6, description='Clear lectures, tough exams')
+        summary = FacultyKeywordSummary.objects.get(faculty=faculty)
+        self.assertEqual(summary.review_count, 2)
+        self.assertEqual(summary.top_terms[:3], [['clear', 2], ['clear lectures', 2], ['lectures', 2]])
+        self.assertEqual(keywords.get_top_terms(FacultyKeywordSummary, faculty_id=faculty.id), summary.top_terms)
+
+        review.delete()
+        summary.refresh_from_db()
+        self.assertEqual(summary.review_count, 1)
+        self.assertNotIn('tough exams', summary.term_counts)
+        self.assertEqual(summary.term_counts['clear lectures'], 1)
+
+
+class FreshnessTests(TestCase):
+    def test_faculty_etag_changes_when_reviewed(self):
+        department = Department.objects.create(name='EEE')
+        faculty = Faculty.objects.create(name='S. Karim', email='karim@ewubd.edu', department=department)
+        url = reverse('faculty_detail', args=[faculty.id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Review.objects.create(faculty=faculty, points=7, description='Helpful in office hours')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Helpful in office hours')
+
+
+@override_settings(CACHE_PURGE={'BACKEND': 'reviews.purge.RecordingPurgeBackend'})
+class PurgeTests(TestCase):
+    def setUp(self):
+        purge.RecordingPurgeBackend.reset()
+        self.department = Department.objects.create(name='PHY')
+        self.faculty = Faculty.objects.create(name='R. Sultana', email='sultana@ewubd.edu', department=self.department)
+
+    def test_page_is_tagged_with_what_it_shows(self):
+        response = self.client.get(reverse('faculty_detail', args=[self.faculty.id]))
+        self.assertEqual(set(response['Surrogate-Key'].split()),
+                         {f'faculty-{self.faculty.id}', f'department-{self.department.id}'})
+
+    def test_review_purges_the_pages_showing_it(self):
+        other = Faculty.objects.create(name='J. Ahmed', email='ahmed@ewubd.edu', department=self.department)
+        purge.RecordingPurgeBackend.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(faculty=self.faculty, points=9, description='Great labs')
+            self.assertEqual(purge.RecordingPurgeBackend.purged, [])
+        self.assertEqual(purge.RecordingPurgeBackend.purged_keys(), {
+            f'faculty-{self.faculty.id}', f'department-{self.department.id}', purge.ALL_DEPARTMENTS_KEY,
+        })
+        self.assertNotIn(f'faculty-{other.id}', purge.RecordingPurgeBackend.purged_keys())
+
+
+class LoadTestTests(LiveServerTestCase):
+    def setUp(self):
+        mail = tempfile.TemporaryDirectory()
+        self.addCleanup(mail.cleanup)
+        self.mail = mail.name
+        # Writes commit here, bumping the reference data stamp
+        self.enterContext(override_settings(REFDATA_VERSION_FILE=os.path.join(self.mail, 'refdata-version')))
+        department = Department.objects.create(name='CSE')
+        Faculty.objects.create(name='F. Hasan', email='hasan@ewubd.edu', department=department)
+
+    def test_student_journey_runs_without_errors(self):
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend',
+                               EMAIL_FILE_PATH=self.mail):
+            runner = loadtest.LoadTestRunner(self.live_server_url, '1:2', self.mail, think_time=0, review_ratio=1)
+            summary = runner.run(tick=0.1)
+        self.assertEqual(summary['total']['errors'], 0, summary)
+        self.assertEqual(summary['endpoints']['verify_otp']['requests'], 2)
+        self.assertGreater(summary['endpoints']['submit_review']['requests'], 0)
+        self.assertTrue(Review.objects.filter(student__student_id__startswith='loadtest-').exists())
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profile_settings = override_settings(PROFILE_DIR=directory.name, PROFILE_RING_SIZE=2)
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+
+    def test_staff_request_is_captured(self):
+        self.client.force_login(User.objects.create_user('staff', password='unused', is_staff=True))
+        capture_ids = [self.client.get('/', {'__profile': mode})['X-Profile-Id'] for mode in ('cprofile', 'sample')]
+        capture_ids.append(self.client.get('/', HTTP_X_PROFILE='')['X-Profile-Id'])
+        # Only the newest PROFILE_RING_SIZE captures are kept
+        self.assertEqual([capture['id'] for capture in profiling.list_captures()], capture_ids[:0:-1])
+
+        capture = profiling.load_capture(capture_ids[2])
+        self.assertEqual((capture['mode'], capture['path'], capture['status']), ('cprofile', '/', 200))
+        self.assertContains(self.client.get(reverse('profile_detail', args=[capture['id']])), capture['id'])
+        download = self.client.get(reverse('profile_download', args=[capture['id'], 'prof']))
+        self.assertEqual(download.status_code, 200)
+        download.close()
+
+    def test_other_requests_are_not_profiled(self):
+        self.assertFalse(self.client.get('/', {'__profile': 'cprofile'}).has_header('X-Profile-Id'))
+        self.assertEqual(profiling.list_captures(), [])
+
+
+class MetricsTests(TestCase):
+    def sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_timed_and_exposed(self):
+        faculty = Faculty.objects.create(name='L. Noor', email='noor@ewubd.edu',
+                                         department=Department.objects.create(name='ECO'))
+        labels = {'view': 'faculty_detail', 'method': 'GET', 'status': '200'}
+        requests = self.sample('classcritic_request_duration_seconds_count', **labels)
+        queries = self.sample('classcritic_db_queries_total', view='faculty_detail')
+        self.client.get(reverse('faculty_detail', args=[faculty.id]))
+        self.assertEqual(self.sample('classcritic_request_duration_seconds_count', **labels), requests + 1)
+        self.assertGreater(self.sample('classcritic_db_queries_total', view='faculty_detail'), queries)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertIn(b'classcritic_request_duration_seconds_count{method="GET",status="200",view="faculty_detail"}',
+                      response.content)
+
+    def test_cache_hits_and_misses_are_counted(self):
+        hits = self.sample('classcritic_cache_requests_total', cache='default', result='hit')
+        misses = self.sample('classcritic_cache_requests_total', cache='default', result='miss')
+        cache.set('metrics-test', 1)
+        self.addCleanup(cache.delete, 'metrics-test')
+        cache.get('metrics-test')
+        cache.get_many(['metrics-test', 'metrics-test-missing'])
+        self.assertEqual(self.sample('classcritic_cache_requests_total', cache='default', result='hit'), hits + 2)
+        self.assertEqual(self.sample('classcritic_cache_requests_total', cache='default', result='miss'), misses + 1)
+
+
+class TracingTests(TestCase):
+    trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'spans.jsonl')
+        self.faculty = Faculty.objects.create(name='P. Roy', email='roy@ewubd.edu',
+                                              department=Department.objects.create(name='CHE'))
+
+    def get(self, flags):
+        with override_settings(TRACING={'SAMPLE_RATE': 0.0, 'OPTIONS': {'path': self.path}}):
+            response = self.client.get(reverse('faculty_detail', args=[self.faculty.id]),
+                                       HTTP_TRACEPARENT=f'00-{self.trace_id}-00f067aa0ba902b7-{flags}')
+            tracing.get_processor().shutdown()
+        return response
+
+    def test_sampled_request_is_exported_as_one_trace(self):
+        self.assertEqual(self.get('01')['X-Trace-Id'], self.trace_id)
+        spans = {s['span_id']: s for s in tracing.read_spans(self.path, self.trace_id)}
+        root = next(s for s in spans.values() if s['kind'] == 'server')
+        self.assertEqual(root['parent_id'], '00f067aa0ba902b7')
+        self.assertEqual(root['attributes']['http.route'], 'faculty_detail')
+        names = {s['name'] for s in spans.values()}
+        self.assertTrue({'view', 'db.query', 'template.render'} <= names, names)
+        for s in spans.values():
+            if s is not root:
+                self.assertIn(s['parent_id'], spans)
+
+    def test_unsampled_request_is_not_traced(self):
+        self.assertFalse(self.get('00').has_header('X-Trace-Id'))
+        self.assertFalse(os.path.exists(self.path))
+
+
+class SearchFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cse = Department.objects.create(name='CSE')
+        self.eee = Department.objects.create(name='EEE')
+        self.rahman = Faculty.objects.create(name='A. Rahman', email='rahman@ewubd.edu', department=self.cse)
+        self.karim = Faculty.objects.create(name='S. Karim', email='karim@ewubd.edu', department=self.eee)
+        for faculty, points, tags in [(self.rahman, 9, ['Good']), (self.rahman, 2, ['Worst']),
+                                      (self.karim, 8, ['Good', 'Nice'])]:
+            Review.objects.create(faculty=faculty, points=points, tags=tags, description='Lab sessions')
+
+    @staticmethod
+    def counts(items):
+        return {item['name']: item['count'] for item in items}
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = search.get_facets(search.read_filters({'tag': 'Good', 'department': str(self.cse.id)}))
+        self.assertEqual(self.counts(facets['departments']), {'CSE': 1, 'EEE': 1})
+        self.assertEqual(self.counts(facets['faculty']), {'A. Rahman': 1})
+        self.assertEqual({tag: count for tag, count in self.counts(facets['tags']).items() if count},
+                         {'Good': 1, 'Worst': 1})
+        self.assertEqual(self.counts(facets['ratings']), {'0-3': 0, '4-6': 0, '7-8': 0, '9-10': 1})
+
+    def test_cached_counts_follow_new_reviews(self):
+        filters = search.read_filters({'search': 'lab'})
+        self.assertEqual(self.counts(search.get_facets(filters)['faculty']), {'A. Rahman': 2, 'S. Karim': 1})
+        Review.objects.create(faculty=self.karim, points=5, description='Lab reports')
+        self.assertEqual(self.counts(search.get_facets(filters)['faculty']), {'A. Rahman': 2, 'S. Karim': 2})
+
+
+class ReferenceDataTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.stamp = os.path.join(directory.name, 'refdata-version')
+        refdata_settings = override_settings(REFDATA_VERSION_FILE=self.stamp, REFDATA_CHECK_INTERVAL=3600)
+        refdata_settings.enable()
+        self.addCleanup(refdata_settings.disable)
+        refdata._snapshots.clear()
+        self.addCleanup(refdata._snapshots.clear)
+
+    def names(self):
+        return [department.name for department in refdata.departments()]
+
+    def test_snapshot_is_reloaded_when_the_stamp_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cse = Department.objects.create(name='CSE')
+        with self.assertNumQueries(3):
+            self.assertEqual(self.names(), ['CSE'])
+        with self.assertNumQueries(0):
+            self.assertEqual(refdata.get('department', str(cse.id)), cse)
+
+        # Saved by another process, which bumps the shared stamp file
+        Department.objects.create(name='EEE')
+        self.assertEqual(self.names(), ['CSE'])
+        with open(self.stamp, 'w') as f:
+            f.write('bumped elsewhere')
+        os.utime(self.stamp, ns=(0, 0))
+        with override_settings(REFDATA_CHECK_INTERVAL=0):
+            self.assertEqual(sorted(self.names()), ['CSE', 'EEE'])
+
+
+class SnapshotExportTests(TestCase):
+    def test_later_exports_append_only_new_reviews(self):
+        faculty = Faculty.objects.create(name='K. Akter', email='akter@ewubd.edu',
+                                         department=Department.objects.create(name='PHR'))
+        hour_ago = timezone.now() - timedelta(hours=1)
+        for points in (4, 9):
+            Review.objects.create(faculty=faculty, points=points, tags=['Good'], description='Old',
+                                  created_at=hour_ago)
+        with tempfile.TemporaryDirectory() as directory:
+            first = snapshot.export(directory, settle=0)
+            Review.objects.create(faculty=faculty, points=7, description='New')
+            second = snapshot.export(directory, settle=0)
+            table = snapshot.read_table(directory, 'reviews')
+        self.assertEqual([part['rows'] for part in first['parts']['reviews']], [2])
+        self.assertEqual([part['rows'] for part in second['parts']['reviews']], [2, 1])
+        self.assertEqual(sorted(table.column('points').to_pylist()), [4, 7, 9])
+        self.assertEqual(set(table.column('department_id').to_pylist()), {faculty.department_id})
+
+
+class SimilarFacultyTests(TestCase):
+    def test_incremental_refresh_matches_a_full_one(self):
+        department = Department.objects.create(name='CSE')
+        faculty = [Faculty.objects.create(name=f'Faculty {i}', email=f'f{i}@ewubd.edu', department=department)
+                   for i in range(5)]
+        for member, points, tags in [(0, 9, ['Good', 'Nice']), (1, 8, ['Good']), (2, 9, ['Nice']),
+                                     (3, 2, ['Worst']), (4, 1, ['Worst'])]:
+            Review.objects.create(faculty=faculty[member], points=points, tags=tags, description='Review')
+        similar.refresh()
+        neighbors = [[entry['id'] for entry in similar.get_neighbors(member.id)] for member in faculty]
+        self.assertEqual(set(neighbors[0]), {faculty[1].id, faculty[2].id})
+        self.assertEqual(neighbors[3], [faculty[4].id])
+
+        Review.objects.create(faculty=faculty[3], points=9, tags=['Good', 'Nice'], description='Review')
+        self.assertIn(faculty[3].id, similar.refresh())
+        self.assertIn(faculty[3].id, [entry['id'] for entry in similar.get_neighbors(faculty[0].id)])
+        self.assertEqual(similar.refresh(full=True), [])
+
+
+class QuestionScoreTests(TestCase):
+    def test_rollups_and_heatmap_follow_review_writes(self):
+        refdata._snapshots.clear()
+        self.addCleanup(refdata._snapshots.clear)
+        department = Department.objects.create(name='CSE')
+        alam = Faculty.objects.create(name='M. Alam', email='alam@ewubd.edu', department=department)
+        bari = Faculty.objects.create(name='R. Bari', email='bari@ewubd.edu', department=department)
+        clarity = Question.objects.create(text='How clear are the lectures?')
+        fairness = Question.objects.create(text='Is the grading fair?')
+        for faculty, question, points in [(alam, clarity, 8), (alam, clarity, 5), (alam, fairness, 9),
+                                          (bari, clarity, 4)]:
+            review = Review.objects.create(faculty=faculty, question=question, points=points, description='Review')
+        self.assertEqual(scores.faculty_scores(alam.id), [
+            {'question': clarity.text, 'count': 2, 'mean': 6.5},
+            {'question': fairness.text, 'count': 1, 'mean': 9.0},
+        ])
+
+        review.delete()
+        matrix = scores.department_matrix(department.id)
+        self.assertEqual([question['overall']['mean'] for question in matrix['questions']], [6.5, 9.0])
+        self.assertEqual([(row['name'], [cell and cell['count'] for cell in row['cells']]) for row in matrix['rows']],
+                         [('M. Alam', [2, 1]), ('R. Bari', [None, None])])
+
+
+class TermTests(TestCase):
+    def test_term_of(self):
+        self.assertEqual(terms.term_of(date(2024, 4, 30)), (date(2024, 1, 1), 'Spring 2024'))
+        self.assertEqual(terms.term_of(date(2024, 9, 1)), (date(2024, 9, 1), 'Fall 2024'))
+        with override_settings(ACADEMIC_TERMS='Fall:09-15,Spring:02-01'):
+            # Before the first start of the year: last year's final term
+            self.assertEqual(terms.term_of(date(2024, 1, 20)), (date(2023, 9, 15), 'Fall 2023'))
+
+    def test_trend_follows_review_writes(self):
+        faculty = Faculty.objects.create(name='H. Kabir', email='kabir@ewubd.edu',
+                                         department=Department.objects.create(name='ENV'))
+        for points, month in [(6, 2), (8, 3), (9, 10)]:
+            Review.objects.create(faculty=faculty, points=points, description='Review',
+                                  created_at=datetime(2024, month, 10, 12, tzinfo=dt_timezone.utc))
+        trend = terms.faculty_trend(faculty.id)
+        self.assertEqual([(point['term'], point['count'], point['mean']) for point in trend['points']],
+                         [('Spring 2024', 2, 7.0), ('Fall 2024', 1, 9.0)])
+        self.assertEqual(trend['polyline'], '24.0,51.6 576.0,33.2')
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(name='CSE')
+        faculty = Faculty.objects.create(name='A. Rahman', email='rahman@ewubd.edu', department=department)
+        course = Course.objects.create(name='Algorithms', code='CSE 246', department=department)
+        student = Student.objects.create(name='Student', student_id='student@std.ewubd.edu')
+        question = Question.objects.create(text='How clear are the lectures?')
+        now = timezone.now()
+        for i, (points, days, tags) in enumerate([(8, 800, ['Good']), (3, 400, ['Worst']), (10, 10, ['Best', 'Nice'])]):
+            Review.objects.create(faculty=faculty, student=student, question=question if i else None, points=points,
+                                  tags=tags, description=f'Clear lectures, review {i}',
+                                  created_at=now - timedelta(days=days))
+            CourseReview.objects.create(course=course, student=student, question=question, points=points,
+                                        tags=tags, description=f'Heavy workload, review {i}',
+                                        created_at=now - timedelta(days=days))
+
+    def rebuild(self):
+        """Every rollup after rebuilding it from scratch"""
+        scores.rebuild()
+        terms.backfill()
+        call_command('rebuild_keyword_summaries', workers=1, stdout=StringIO())
+        similar.rebuild_profiles()
+        return {
+            model.__name__: sorted(model.objects.values_list(*fields))
+            for model, fields in [
+                (FacultyQuestionScore, ('faculty_id', 'question_id', 'count', 'total')),
+                (CourseQuestionScore, ('course_id', 'question_id', 'count', 'total')),
+                (FacultyTermScore, ('faculty_id', 'term', 'count', 'total')),
+                (CourseTermScore, ('course_id', 'term', 'count', 'total')),
+                (FacultyKeywordSummary, ('faculty_id', 'top_terms', 'review_count')),
+                (CourseKeywordSummary, ('course_id', 'top_terms', 'review_count')),
+                (FacultyNeighbors, ('faculty_id', 'tag_counts', 'rating_counts')),
+            ]
+        }
+
+    def archive_all(self):
+        for _, review_model, archive_model, owner_field, owner_model in archive.sources():
+            while archive.archive_batch(review_model, archive_model, owner_field, owner_model, timezone.now()):
+                pass
+        self.assertFalse(Review.objects.exists() or CourseReview.objects.exists())
+        self.assertEqual(ArchivedReview.objects.count() + ArchivedCourseReview.objects.count(), 6)
+
+    def test_archived_reviews_stay_in_counts_and_averages(self):
+        faculty, course = Faculty.objects.get(), Course.objects.get()
+        call_command('archive_reviews', older_than_days=365, batch_size=1, stdout=StringIO())
+        self.assertEqual(list(Review.objects.values_list('points', flat=True)), [10])
+        self.assertEqual(sorted(ArchivedReview.objects.values_list('points', flat=True)), [3, 8])
+        faculty.refresh_from_db()
+        course.refresh_from_db()
+        self.assertEqual((faculty.archived_review_count, faculty.archived_points), (2, 11))
+        self.assertEqual((course.archived_review_count, course.archived_points), (2, 11))
+        for owner in (faculty, course):
+            self.assertEqual((owner.total_reviews(), owner.average_rating()), (3, 7.0))
+
+        # Running again finds nothing left to move
+        call_command('archive_reviews', older_than_days=365, stdout=StringIO())
+        faculty.refresh_from_db()
+        self.assertEqual((faculty.archived_review_count, faculty.total_reviews()), (2, 3))
+        page = archive.archived_page(ArchivedReview, 1, faculty_id=faculty.id)
+        self.assertEqual([(review.points, review.author) for review in page], [(3, 'Student'), (8, 'Student')])
+
+    def test_rebuilds_count_archived_reviews(self):
+        before = self.rebuild()
+        self.archive_all()
+        self.assertEqual(self.rebuild(), before)
+
+    def test_comparison_counts_archived_reviews(self):
+        def columns():
+            return [{key: value for key, value in column.items() if key != 'recent'}
+                    for column in compare.compute(list(Faculty.objects.values_list('id', flat=True)))]
+
+        before = columns()
+        self.assertEqual(sum(bar['count'] for bar in before[0]['distribution']), before[0]['count'])
+        self.archive_all()
+        self.assertEqual(columns(), before)
+
+    def test_ratings_lookup_counts_archived_reviews(self):
+        before = lookup.lookup(['A. Rahman'], ['cse246'])
+        self.assertEqual(before['faculty']['A. Rahman'][0]['top_tags'][0], ['Best', 1])
+        self.archive_all()
+        self.assertEqual(lookup.lookup(['A. Rahman'], ['cse246']), before)
+
+    def test_analytics_count_archived_reviews(self):
+        names = {department.id: department.name for department in Department.objects.all()}
+        before = {name: analytics.compute(snapshot.live_table(name), names) for name in snapshot.FACTS}
+        self.assertEqual(before['reviews']['total'], 3)
+        self.archive_all()
+        self.assertEqual({name: analytics.compute(snapshot.live_table(name), names) for name in snapshot.FACTS}, before)
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot.export(directory, fmt='arrow', full=True, settle=0)
+            exported = {name: analytics.compute(snapshot.read_table(directory, name), names) for name in snapshot.FACTS}
+        self.assertEqual(exported, before)
+
+
+@override_settings(TENANTS={
+    'ewu': {'HOSTS': ['*'], 'EMAIL_DOMAINS': ['std.ewubd.edu'], 'DATABASE': 'default'},
+    'nsu': {'HOSTS': ['nsu.example.com'], 'EMAIL_DOMAINS': ['northsouth.edu'], 'DATABASE': 'default'},
+}, ANALYTICS_SOURCE='auto')
+class TenantAnalyticsDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        snapshots = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshots.cleanup)
+        self.enterContext(override_settings(SNAPSHOT_DIR=f'{snapshots.name}/snapshots'))
+        department = Department.objects.create(name='EEE')
+        faculty = Faculty.objects.create(name='S. Karim', email='karim@northsouth.edu', department=department)
+        Review.objects.create(faculty=faculty, points=7, tags=['Good'], description='Patient with questions',
+                              created_at=timezone.now() - timedelta(days=1))
+        self.client.force_login(User.objects.create_user('staff', password='unused', is_staff=True))
+
+    def dashboard(self):
+        response = self.client.get(reverse('analytics_dashboard'), HTTP_HOST='nsu.example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['error'])
+        self.assertEqual(response.context['stats']['total'], 1)
+        return response.context['stats']
+
+    def test_live_database(self):
+        self.assertEqual(self.dashboard()['source'], 'live database')
+
+    def test_reads_the_tenants_snapshot(self):
+        with tenants.activate('nsu'):
+            call_command('export_snapshot', format='arrow', settle=0, stdout=StringIO())
+        self.assertTrue(self.dashboard()['source'].startswith('snapshot as of'))
+
+
+@override_settings(TENANTS={
+    'ewu': {'HOSTS': ['ewu.example.com'], 'EMAIL_DOMAINS': ['std.ewubd.edu'], 'DATABASE': 'default'},
+    'nsu': {'HOSTS': ['nsu.example.com'], 'EMAIL_DOMAINS': ['northsouth.edu'], 'DATABASE': 'tenant_nsu'},
+}, ARCHIVE_DATABASE='archive')
+class TenantRoutingTests(SimpleTestCase):
+    def serve(self, host):
+        """Where a request to host would send its queries, cache keys and surrogate keys"""
+        def view(request):
+            return HttpResponse(json.dumps({
+                'tenant': request.tenant.name,
+                'database': router.db_for_write(Review),
+                'archive': router.db_for_write(ArchivedReview),
+                'cache_key': tenants.make_key('page', 'cc', 1),
+                'surrogate_key': tenants.scoped('faculty-1'),
+            }))
+
+        return json.loads(TenantMiddleware(view)(RequestFactory().get('/', HTTP_HOST=host)).content)
+
+    def test_each_host_is_routed_to_its_own_tenant(self):
+        self.assertEqual(self.serve('EWU.example.com:8000'), {
+            'tenant': 'ewu', 'database': 'default', 'archive': 'archive',
+            'cache_key': 'cc:ewu:1:page', 'surrogate_key': 'faculty-1',
+        })
+        self.assertEqual(self.serve('nsu.example.com'), {
+            'tenant': 'nsu', 'database': 'tenant_nsu', 'archive': 'tenant_nsu',
+            'cache_key': 'cc:nsu:1:page', 'surrogate_key': 'faculty-1-nsu',
+        })
+        # Nothing leaks out of the request
+        self.assertEqual(tenants.current().name, 'ewu')
+        self.assertEqual(router.db_for_write(Review), 'default')
+
+    def test_unknown_host_is_not_served(self):
+        with self.assertRaises(Http404):
+            self.serve('other.example.com')
+
+
+@override_settings(LIVE_UPDATES=True)
+class LiveUpdateTests(TestCase):
+    def setUp(self):
+        hub = mock.patch.object(live, 'HUB', live.Hub())
+        hub.start()
+        self.addCleanup(hub.stop)
+        self.faculty = Faculty.objects.create(name='T. Islam', email='islam@ewubd.edu',
+                                              department=Department.objects.create(name='MATH'))
+        self.channel = f'faculty-{self.faculty.id}'
+
+    def review(self, points):
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(faculty=self.faculty, points=points, description=f'Rated {points}')
+
+    def test_reconnecting_stream_replays_missed_events(self):
+        # Streams are served by an event loop; reviews are published from other threads
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        self.addCleanup(loop.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(loop.call_soon_threadsafe, loop.stop)
+
+        def in_loop(coroutine):
+            return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout=5)
+
+        async def subscribe(last_event_id=None):
+            return live.HUB.subscribe(self.channel, last_event_id)
+
+        async def next_event(subscription):
+            message = await asyncio.wait_for(subscription.queue.get(), 5)
+            return json.loads(message.decode().split('data: ', 1)[1])
+
+        self.review(4)
+        last_seen = live.HUB.history[self.channel][-1][0]
+        self.review(8)
+        reconnected = in_loop(subscribe(last_seen))
+        event = in_loop(next_event(reconnected))
+        self.assertIn('Rated 8', event['html'])
+        self.assertEqual((event['avg_rating'], event['total_reviews']), (6.0, 2))
+        self.assertTrue(reconnected.queue.empty())
+
+        fresh = in_loop(subscribe())
+        self.review(9)
+        for subscription in (reconnected, fresh):
+            self.assertEqual(in_loop(next_event(subscription))['total_reviews'], 3)
+
+
+class WriteBehindRecoveryTests(TestCase):
+    def setUp(self):
+        department = Department.objects.create(name='BBA')
+        self.faculty = Faculty.objects.create(name='N. Huda', email='huda@ewubd.edu', department=department)
+        journal = tempfile.TemporaryDirectory()
+        self.addCleanup(journal.cleanup)
+        self.journal = journal.name
+
+    def entries(self, *descriptions, faculty_ids=()):
+        faculty_ids = list(faculty_ids) or [self.faculty.id] * len(descriptions)
+        return [
+            writebehind.entry_for(Review(faculty_id=faculty_id, points=6, description=description))
+            for description, faculty_id in zip(descriptions, faculty_ids)
+        ]
+
+    def saved(self):
+        return sorted(Review.objects.values_list('description', flat=True))
+
+    def test_orphaned_entry_is_dropped(self):
+        entries = self.entries('Buffered review 0', 'Buffered review 1', 'Buffered review 2',
+                               faculty_ids=[self.faculty.id, 999999, self.faculty.id])
+        segment = os.path.join(self.journal, 'journal-1-1-1.jsonl')
+        with open(segment, 'w') as f:
+            f.writelines(json.dumps(entry) + '\n' for entry in entries)
+
+        with self.assertLogs('reviews.writebehind', 'ERROR') as logs:
+            buffer = writebehind.WriteBehindBuffer(self.journal, fsync=False)
+        buffer.close()
+        self.assertIn(entries[1]['id'], logs.output[0])
+        self.assertEqual(self.saved(), ['Buffered review 0', 'Buffered review 2'])
+        self.assertFalse(os.path.exists(segment))
+
+    def test_crashed_segments_are_replayed_once(self):
+        entries = self.entries('Saved before the crash', 'Buffered 1', 'Buffered 2')
+        writebehind.save_entries(entries[:1])
+        crashed = os.path.join(self.journal, 'journal-1-1-1.jsonl')
+        with open(crashed, 'w') as f:
+            f.writelines(json.dumps(entry) + '\n' for entry in entries)
+            f.write('{"id": "torn')
+        # A segment still locked by a live process is left to that process
+        live = os.path.join(self.journal, 'journal-2-1-1.jsonl')
+        with open(live, 'w') as f:
+            f.write(json.dumps(self.entries('Live process')[0]) + '\n')
+        fd = os.open(live, os.O_RDWR)
+        self.addCleanup(os.close, fd)
+        self.assertTrue(writebehind._lock(fd))
+
+        with self.assertLogs('reviews.writebehind', 'WARNING'):
+            self.assertEqual(writebehind.recover(self.journal), 2)
+        self.assertEqual(self.saved(), ['Buffered 1', 'Buffered 2', 'Saved before the crash'])
+        self.assertFalse(os.path.exists(crashed))
+        self.assertTrue(os.path.exists(live))
+        # Replaying the same entries again saves nothing twice
+        self.assertEqual(writebehind.save_entries(entries), 0)
+        self.assertEqual(Review.objects.count(), 3)
+
+    def test_failing_entry_is_dead_lettered_after_max_attempts(self):
+        apply_review = keywords.apply_review
+
+        def broken(review, sign=1):
+            if 'broken' in review.description:
+                raise TypeError('a bug in a signal handler')
+            apply_review(review, sign)
+
+        entries = self.entries('Before', 'broken', 'After')
+        attempts = {}
+        with mock.patch('reviews.keywords.apply_review', broken), self.assertLogs('reviews.writebehind', 'ERROR'):
+            self.assertEqual(writebehind.save_or_isolate(entries, self.journal, attempts, max_attempts=2), (2, 1))
+            self.assertEqual(writebehind.save_or_isolate(entries, self.journal, attempts, max_attempts=2), (0, 0))
+        # Skipped from then on
+        self.assertEqual(writebehind.save_or_isolate(entries, self.journal, attempts, max_attempts=2), (0, 0))
+        self.assertEqual(self.saved(), ['After', 'Before'])
+        with open(os.path.join(self.journal, writebehind.DEAD_LETTER)) as f:
+            self.assertEqual([json.loads(line)['id'] for line in f], [entries[1]['id']])
+
+        # Once the bug is fixed
+        self.assertEqual(writebehind.replay_dead_letters(self.journal), (1, 0))
+        self.assertEqual(self.saved(), ['After', 'Before', 'broken'])
+        self.assertFalse(os.path.exists(os.path.join(self.journal, writebehind.DEAD_LETTER)))
+
+
+class RatingsLookupTests(TestCase):
+    def test_email_matches_ignore_case(self):
+        department = Department.objects.create(name='ENG')
+        faculty = Faculty.objects.create(name='Dr. M. Alam', email='M.Alam@EWUBD.edu', department=department)
+        Review.objects.create(faculty=faculty, points=9, tags=['Good'], description='Engaging classes')
+        found = lookup.lookup(['m.alam@ewubd.EDU'], [])['faculty']['m.alam@ewubd.EDU']
+        self.assertEqual([match['id'] for match in found], [faculty.id])
+        self.assertEqual(found[0]['rating'], 9)
+        self.assertEqual(lookup.lookup(['Mr m alam'], [])['faculty']['Mr m alam'], found)
+
+
+class CompareTests(SimpleTestCase):
+    @override_settings(COMPARE_MAX_FACULTY=2)
+    def test_parse_ids_keeps_the_first_ids_given(self):
+        self.assertEqual(compare.parse_ids('9, 3,9,x,1'), [3, 9])
+
+
+class StaticPagesTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PRERENDER=True, PRERENDER_DIR=directory.name))
+        prerender.write('/faculty/7/', b'<p>pre-rendered</p>')
+
+    def test_wsgi(self):
+        def django(environ, start_response):
+            start_response('200 OK', [])
+            return [b'django']
+
+        def get(path, **headers):
+            started = []
+            environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'HTTP_HOST': 'localhost',
+                       **headers}
+            body = b''.join(prerender.StaticPages(django)(environ, lambda status, headers: started.append(status)))
+            return started[0], body
+
+        self.assertEqual(get('/faculty/7/'), ('200 OK', b'<p>pre-rendered</p>'))
+        self.assertEqual(get('/faculty/7/', HTTP_COOKIE='sessionid=abc'), ('200 OK', b'django'))
+        self.assertEqual(get('/faculty/8/'), ('200 OK', b'django'))
+
+    def test_asgi(self):
+        async def django(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'django'})
+
+        def get(path, *headers):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                     'headers': [(b'host', b'localhost'), *headers]}
+            asyncio.run(prerender.AsyncStaticPages(django)(scope, None, send))
+            return dict(sent[0]['headers']).get(b'content-encoding'), sent[1]['body']
+
+        self.assertEqual(get('/faculty/7/'), (None, b'<p>pre-rendered</p>'))
+        self.assertEqual(get('/faculty/7/', (b'accept-encoding', b'gzip'))[0], b'gzip')
+        self.assertEqual(get('/faculty/7/', (b'cookie', b'theme=dark'), (b'cookie', b'sessionid=abc')),
+                         (None, b'django'))
+        self.assertEqual(get('/faculty/8/'), (None, b'django'))
+
+
+class PrerenderTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PRERENDER=True, PRERENDER_DIR=directory.name))
+        self.faculty = Faculty.objects.create(name='Z. Haque', email='haque@ewubd.edu',
+                                              department=Department.objects.create(name='GEB'))
+        self.page = f'/faculty/{self.faculty.id}/'
+
+    def read(self):
+        with open(prerender.page_file(self.page), 'rb') as f:
+            return f.read()
+
+    def test_changed_pages_are_regenerated(self):
+        PrerenderQueue.objects.all().delete()
+        self.assertTrue(prerender.render_page(self.page))
+        self.assertIn(b'Z. Haque', self.read())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(faculty=self.faculty, points=9, description='Brilliant field trips')
+        self.assertFalse(os.path.exists(prerender.page_file(self.page)))
+        queued = set(PrerenderQueue.objects.values_list('page', flat=True))
+        self.assertIn(self.page, queued)
+        self.assertIn(f'/?department={self.faculty.department_id}', queued)
+
+        self.assertEqual(prerender.drain(), len(queued))
+        self.assertIn(b'Brilliant field trips', self.read())
+        self.assertTrue(os.path.exists(prerender.page_file(self.page) + '.gz'))
+        self.assertFalse(PrerenderQueue.objects.exists())
+
+
+class RateLimitFilterTests(SimpleTestCase):
+    def record(self, *args, exc_info=None):
+        return logging.LogRecord('reviews.views', logging.ERROR, __file__, 1, 'Failed to send OTP email to %s: %s',
+                                 args, exc_info)
+
+    def test_limits_repeats_of_one_failure_only(self):
+        limit = RateLimitFilter(burst=2)
+        passed = [limit.filter(self.record('a@std.ewubd.edu', 'timed out')) for _ in range(4)]
+        self.assertEqual(passed, [True, True, False, False])
+        self.assertTrue(limit.filter(self.record('b@std.ewubd.edu', 'timed out')))
+        self.assertTrue(limit.filter(self.record('a@std.ewubd.edu', 'refused')))
+        try:
+            raise OSError('refused')
+        except OSError:
+            self.assertTrue(limit.filter(self.record('a@std.ewubd.edu', 'timed out', exc_info=sys.exc_info())))
+
+
+class StalePageTests(SimpleTestCase):
+    def test_kept_copy_is_updated_at_most_once_per_interval(self):
+        cache.clear()
+        request = RequestFactory().get('/')
+        key = stale.page_key('home', request)
+        stale.remember(key, request, HttpResponse(b'first'))
+        stale.remember(key, request, HttpResponse(b'second'))
+        self.assertEqual(cache.get(key)['content'], b'first')
+        # Background refreshes always replace it
+        stale.remember(key, request, HttpResponse(b'refreshed'), force=True)
+        self.assertEqual(cache.get(key)['content'], b'refreshed')
+
+    def test_last_good_copy_is_served_while_degraded(self):
+        cache.clear()
+        self.addCleanup(stale.health.reset)
+        renders = []
+
+        @stale.serve_stale_on_overload('home')
+        def view(request):
+            if len(renders) == 2:
+                raise OperationalError('database is locked')
+            renders.append(request)
+            return HttpResponse(f'<body><nav></nav>render {len(renders)}</body>')
+
+        self.assertEqual(view(RequestFactory().get('/')).content, b'<body><nav></nav>render 1</body>')
+        stale.health.lock_error()
+        response = view(RequestFactory().get('/'))
+        self.assertEqual(response['X-Stale'], '1')
+        self.assertRegex(response.content, rb'(?s)^<body><nav></nav>.*data-stale.*render 1</body>$')
+        for thread in threading.enumerate():
+            if thread.name == 'stale-refresh':
+                thread.join()
+        self.assertEqual(len(renders), 2)
+
+        # A lock error while healthy is answered from the refreshed copy
+        stale.health.reset()
+        response = view(RequestFactory().get('/'))
+        self.assertEqual(response['X-Stale'], '1')
+        self.assertIn(b'render 2', response.content)
@@ -0,0 +1,359 @@
+"""
+Lightweight request tracing.
+
+``TracingMiddleware`` starts a trace for a sampled request (TRACING
+SAMPLE_RATE, or an incoming W3C ``traceparent`` header with the sampled
+flag) and every ``span()`` opened while handling it is recorded with its
+parent: database queries, template renders, email sends and the steps
+instrumented in views and models. Unsampled requests only pay for a
+context variable lookup per ``span()``.
+
+Finished traces are handed to a background thread that exports them with
+the configured exporter: ``JSONLExporter`` appends one span per line to a
+local file, ``OTLPExporter`` posts OTLP/JSON to a collector (see
+``manage.py trace_collector`` for a local stand-in). ``manage.py
+show_trace`` prints the timeline of one trace.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """One timed operation; use as a context manager"""
+
+    def __init__(self, trace, name, parent_id=None, kind='internal', attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.start_ns = None
+        self.end_ns = None
+
+    @property
+    def trace_id(self):
+        return self.trace.trace_id
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.status = 'error'
+            self.attributes.setdefault('error', f'{exc_type.__name__}: {exc}')
+        self.trace.finished(self)
+        return False
+
+    def as_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Returned by ``span()`` when the current request is not being traced"""
+
+    trace_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Spans of one request; exported together when the root span ends"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans = []
+        self.root = None
+
+    def start(self, name, parent_id=None, **kwargs):
+        span = Span(self, name, parent_id=parent_id, **kwargs)
+        if self.root is None:
+            self.root = span
+        return span
+
+    def finished(self, span):
+        self.spans.append(span)
+        if span is self.root:
+            get_processor().submit([s.as_dict() for s in self.spans])
+
+
+def span(name, **attributes):
+    """Child span of the current span, or a no-op outside a sampled trace"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return parent.trace.start(name, parent_id=parent.span_id, attributes=attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def traceparent():
+    """W3C traceparent header value for outgoing requests, or None"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f'00-{current.trace_id}-{current.span_id}-01'
+
+
+def inject(headers):
+    """Add the traceparent header to an outgoing request's headers"""
+    value = traceparent()
+    if value:
+        headers['traceparent'] = value
+    return headers
+
+
+def start_request_trace(request):
+    """Root span for a request if it is sampled, else None"""
+    incoming = TRACEPARENT_RE.match(request.META.get('HTTP_TRACEPARENT', '').strip().lower())
+    if incoming:
+        trace_id, parent_id, flags = incoming.groups()
+        if not int(flags, 16) & 1:
+            return None
+        trace = Trace(trace_id)
+    else:
+        rate = getattr(settings, 'TRACING', {}).get('SAMPLE_RATE', 0.0)
+        if not rate or random.random() >= rate:
+            return None
+        trace, parent_id = Trace(), None
+    return trace.start(
+        f'{request.method} {request.path}',
+        parent_id=parent_id,
+        kind='server',
+        attributes={'http.method': request.method, 'http.target': request.get_full_path()},
+    )
+
+
+def db_span_wrapper(execute, sql, params, many, context):
+    """Execute wrapper recording each query as a span"""
+    with span('db.query', **{'db.statement': sql[:500], 'db.executemany': many}):
+        return execute(sql, params, many, context)
+
+
+def trace_request(request, get_response):
+    """Call the rest of the stack inside a root span when the request is sampled"""
+    root = start_request_trace(request)
+    if root is None:
+        return get_response(request)
+    with root, ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(db_span_wrapper))
+        response = get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if match:
+            root.set_attribute('http.route', match.url_name or match.view_name)
+        root.set_attribute('http.status_code', response.status_code)
+        if response.status_code >= 500:
+            root.status = 'error'
+    response['X-Trace-Id'] = root.trace_id
+    return response
+
+
+# Templates
+
+class TracingTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates render inside a span"""
+
+    def from_string(self, template_code):
+        return TracedTemplate(super().from_string(template_code), '<string>')
+
+    def get_template(self, template_name):
+        return TracedTemplate(super().get_template(template_name), template_name)
+
+
+class TracedTemplate:
+    def __init__(self, template, name):
+        self.template = template
+        self.name = name
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        with span('template.render', **{'template.name': self.name}):
+            return self.template.render(context, request)
+
+
+# Export
+
+class JSONLExporter:
+    """Append one JSON span per line to ``path``"""
+
+    def __init__(self, path='', **options):
+        self.path = str(path or os.path.join(settings.BASE_DIR, 'traces', 'spans.jsonl'))
+
+    def export(self, spans):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a') as f:
+            for s in spans:
+                f.write(json.dumps(s, default=str) + '\n')
+
+
+class OTLPExporter:
+    """POST spans as OTLP/JSON (``/v1/traces``) to a collector"""
+
+    def __init__(self, url='http://127.0.0.1:4318/v1/traces', service_name='classcritic', timeout=2, **options):
+        self.url = url
+        self.service_name = service_name
+        self.timeout = timeout
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, bool):
+            return {'boolValue': value}
+        if isinstance(value, int):
+            return {'intValue': str(value)}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        return {'stringValue': str(value)}
+
+    def payload(self, spans):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': self.service_name}},
+            ]},
+            'scopeSpans': [{
+                'scope': {'name': 'reviews.tracing'},
+                'spans': [{
+                    'traceId': s['trace_id'],
+                    'spanId': s['span_id'],
+                    'parentSpanId': s['parent_id'] or '',
+                    'name': s['name'],
+                    # SPAN_KIND_INTERNAL = 1, SPAN_KIND_SERVER = 2
+                    'kind': 2 if s['kind'] == 'server' else 1,
+                    'startTimeUnixNano': str(s['start_ns']),
+                    'endTimeUnixNano': str(s['end_ns']),
+                    'attributes': [
+                        {'key': key, 'value': self._value(value)} for key, value in s['attributes'].items()
+                    ],
+                    # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+                    'status': {'code': 2 if s['status'] == 'error' else 1},
+                } for s in spans],
+            }],
+        }]}
+
+    def export(self, spans):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(self.payload(spans)).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class SpanProcessor:
+    """Exports finished traces from a background thread through a bounded queue"""
+
+    def __init__(self, exporter, maxsize=1000):
+        self.exporter = exporter
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    def submit(self, spans):
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            spans = self.queue.get()
+            if spans is None:
+                return
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                logger.warning('Span export failed: %s', e)
+
+    def shutdown(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+
+@lru_cache(maxsize=None)
+def get_processor():
+    config = getattr(settings, 'TRACING', {})
+    exporter_class = import_string(config.get('EXPORTER', 'reviews.tracing.JSONLExporter'))
+    return SpanProcessor(exporter_class(**config.get('OPTIONS', {})), config.get('QUEUE_SIZE', 1000))
+
+
+@receiver(setting_changed)
+def _reset_processor(setting, **kwargs):
+    if setting == 'TRACING':
+        get_processor.cache_clear()
+
+
+def read_spans(path, trace_id=None):
+    """Spans from a JSONL file, optionally only those of one trace"""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            s = json.loads(line)
+            if trace_id is None or s['trace_id'] == trace_id:
+                spans.append(s)
+    return spans
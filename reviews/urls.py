@@ -6,11 +6,25 @@ urlpatterns = [
     path('register/', views.student_register, name='register'),
     path('verify-otp/', views.verify_otp, name='verify_otp'),
     path('faculty/<int:faculty_id>/', views.faculty_detail, name='faculty_detail'),
+    path('faculty/<int:faculty_id>/archive/', views.faculty_archive, name='faculty_archive'),
+    path('faculty/<int:faculty_id>/events/', views.faculty_events, name='faculty_events'),
     path('submit-review/', views.submit_review, name='submit_review'),
     path('search/', views.search_reviews, name='search_reviews'),
+    path('compare/', views.compare_faculty, name='compare_faculty'),
+    path('api/ratings/', views.ratings_lookup, name='ratings_lookup'),
+    path('department/<int:department_id>/questions/', views.department_questions, name='department_questions'),
     path('logout/', views.logout_view, name='logout'),
     # Course-related URLs
     path('courses/', views.course_list, name='course_list'),
     path('course/<int:course_id>/', views.course_detail, name='course_detail'),
+    path('course/<int:course_id>/archive/', views.course_archive, name='course_archive'),
+    path('course/<int:course_id>/events/', views.course_events, name='course_events'),
     path('submit-course-review/', views.submit_course_review, name='submit_course_review'),
+    # Monitoring
+    path('metrics', views.metrics_view, name='metrics'),
+    # Staff tools
+    path('staff/profiles/', views.profile_list, name='profile_list'),
+    path('staff/profiles/<str:capture_id>/', views.profile_detail, name='profile_detail'),
+    path('staff/profiles/<str:capture_id>/<str:kind>/', views.profile_download, name='profile_download'),
+    path('staff/analytics/', views.analytics_dashboard, name='analytics_dashboard'),
 ]
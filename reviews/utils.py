@@ -1,11 +1,14 @@
 import random
 import string
 import logging
+import time
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 
+from . import metrics, tracing
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,9 +25,10 @@ def send_otp_email(student_email, otp):
     # Warn if using console backend (emails won't actually be sent)
     if 'console' in email_backend.lower():
         logger.warning(
-            f"Email backend is set to console. OTP email for {student_email} "
-            f"will be printed to console instead of being sent. "
-            f"Set EMAIL_BACKEND=smtp in .env file to enable real email sending."
+            "Email backend is set to console. OTP email for %s will be printed to "
+            "console instead of being sent. Set EMAIL_BACKEND=smtp in .env file to "
+            "enable real email sending.",
+            student_email,
         )
     
     # Check if SMTP is configured but credentials are missing
@@ -33,11 +37,11 @@ def send_otp_email(student_email, otp):
         email_host_password = getattr(settings, 'EMAIL_HOST_PASSWORD', '')
         
         if not email_host_user or not email_host_password:
-            error_msg = (
-                f"SMTP email backend is configured but EMAIL_HOST_USER or "
-                f"EMAIL_HOST_PASSWORD is missing. Please check your .env file."
+            logger.error(
+                "SMTP email backend is configured but EMAIL_HOST_USER or "
+                "EMAIL_HOST_PASSWORD is missing. Please check your .env file."
             )
-            logger.error(error_msg)
+            metrics.OTP_EMAILS.labels('failed').inc()
             return False
     
     subject = 'ClassCritic - Your OTP for Verification'
@@ -54,31 +58,37 @@ def send_otp_email(student_email, otp):
     ClassCritic Team
     """
     
+    started = time.perf_counter()
     try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [student_email],
-            fail_silently=False,
-        )
-        logger.info(f"OTP email sent successfully to {student_email}")
+        with tracing.span('email.send', backend=email_backend):
+            send_mail(
+                subject,
+                message,
+                settings.DEFAULT_FROM_EMAIL,
+                [student_email],
+                fail_silently=False,
+            )
+        metrics.SMTP_SEND_LATENCY.observe(time.perf_counter() - started)
+        metrics.OTP_EMAILS.labels('sent').inc()
+        logger.info("OTP email sent successfully to %s", student_email)
         return True
     except Exception as e:
-        error_msg = f"Failed to send OTP email to {student_email}: {str(e)}"
-        logger.error(error_msg, exc_info=True)
-        
-        # Log helpful troubleshooting information
+        metrics.SMTP_SEND_LATENCY.observe(time.perf_counter() - started)
+        metrics.OTP_EMAILS.labels('failed').inc()
+        # One record carrying the SMTP settings (never the password) for troubleshooting
+        extra = {}
         if 'smtp' in email_backend.lower():
-            logger.error(
-                "SMTP Configuration Check:\n"
-                f"  EMAIL_HOST: {getattr(settings, 'EMAIL_HOST', 'NOT SET')}\n"
-                f"  EMAIL_PORT: {getattr(settings, 'EMAIL_PORT', 'NOT SET')}\n"
-                f"  EMAIL_USE_TLS: {getattr(settings, 'EMAIL_USE_TLS', 'NOT SET')}\n"
-                f"  EMAIL_HOST_USER: {getattr(settings, 'EMAIL_HOST_USER', 'NOT SET')}\n"
-                f"  EMAIL_HOST_PASSWORD: {'SET' if getattr(settings, 'EMAIL_HOST_PASSWORD', '') else 'NOT SET'}\n"
-                f"  DEFAULT_FROM_EMAIL: {getattr(settings, 'DEFAULT_FROM_EMAIL', 'NOT SET')}"
-            )
+            extra['smtp'] = {
+                'host': getattr(settings, 'EMAIL_HOST', None),
+                'port': getattr(settings, 'EMAIL_PORT', None),
+                'use_tls': getattr(settings, 'EMAIL_USE_TLS', None),
+                'user': getattr(settings, 'EMAIL_HOST_USER', None),
+                'password_set': bool(getattr(settings, 'EMAIL_HOST_PASSWORD', '')),
+                'from_email': getattr(settings, 'DEFAULT_FROM_EMAIL', None),
+            }
+        logger.error(
+            "Failed to send OTP email to %s: %s", student_email, e, exc_info=True, extra=extra
+        )
         
         return False
 
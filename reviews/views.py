@@ -1,12 +1,37 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.db.models import Q, Avg
 from django.utils import timezone
-from .models import Faculty, Student, Review, Department, Course, Question, CourseReview
+from django.views.decorators.http import condition, require_safe
+from django.views.decorators.vary import vary_on_cookie
+from . import (
+    analytics, archive, compare, freshness, live, lookup, metrics, profiling, purge, refdata, scores, search,
+    similar, stale, terms, tracing, writebehind,
+)
+from .models import (
+    Faculty, Student, Review, Course, CourseReview,
+    FacultyKeywordSummary, CourseKeywordSummary, ArchivedReview, ArchivedCourseReview,
+)
 from .forms import StudentRegistrationForm, OTPVerificationForm, ReviewForm, CourseReviewForm
+from .keywords import get_top_terms
 from .utils import generate_otp, send_otp_email
 
 
+def _listing_key(department_filter):
+    """Surrogate key for a listing page, filtered to one department or not"""
+    if department_filter.isdigit():
+        return purge.department_key(department_filter)
+    return purge.ALL_DEPARTMENTS_KEY
+
+
+@stale.serve_stale_on_overload('home')
+@vary_on_cookie
+@condition(etag_func=freshness.home_etag, last_modified_func=freshness.home_last_modified)
 def home(request):
     """Home page with faculty listing and search"""
     search_query = request.GET.get('search', '')
@@ -25,7 +50,7 @@ def home(request):
     if department_filter:
         faculties = faculties.filter(department_id=department_filter)
     
-    departments = Department.objects.all()
+    departments = refdata.departments()
     
     # Add average rating to each faculty
     faculty_list = []
@@ -42,7 +67,8 @@ def home(request):
         'search_query': search_query,
         'department_filter': department_filter,
     }
-    return render(request, 'reviews/home.html', context)
+    response = render(request, 'reviews/home.html', context)
+    return purge.tag_response(response, _listing_key(department_filter))
 
 
 def student_register(request):
@@ -140,6 +166,9 @@ def verify_otp(request):
     })
 
 
+@stale.serve_stale_on_overload('faculty_detail')
+@vary_on_cookie
+@condition(etag_func=freshness.faculty_etag, last_modified_func=freshness.faculty_last_modified)
 def faculty_detail(request, faculty_id):
     """Faculty detail page with reviews"""
     faculty = get_object_or_404(Faculty, id=faculty_id)
@@ -155,23 +184,50 @@ def faculty_detail(request, faculty_id):
         'reviews': reviews,
         'avg_rating': faculty.average_rating(),
         'total_reviews': faculty.total_reviews(),
+        'top_terms': get_top_terms(FacultyKeywordSummary, faculty_id=faculty.id),
+        'similar_faculty': similar.get_neighbors(faculty.id),
+        'question_scores': scores.faculty_scores(faculty.id),
+        'trend': terms.faculty_trend(faculty.id),
         'tag_filter': tag_filter,
-        'available_tags': [tag[0] for tag in Review.TAG_CHOICES],
+        'available_tags': refdata.tag_names(Review),
+        'live_since': live.since() if live.enabled() else None,
     }
-    return render(request, 'reviews/faculty_detail.html', context)
+    response = render(request, 'reviews/faculty_detail.html', context)
+    return purge.tag_response(
+        response, purge.faculty_key(faculty.id), purge.department_key(faculty.department_id)
+    )
+
+
+def faculty_events(request, faculty_id):
+    """Server-Sent Events stream of new reviews of a faculty member (served over ASGI)"""
+    # No lookup: thousands of streams reconnect periodically, and an unknown id simply gets no events
+    return live.event_stream(request, purge.faculty_key(faculty_id))
+
+
+def faculty_archive(request, faculty_id):
+    """Older reviews of a faculty member, read from the archive"""
+    faculty = get_object_or_404(Faculty, id=faculty_id)
+    page = archive.archived_page(ArchivedReview, request.GET.get('page'), faculty_id=faculty.id)
+    return render(request, 'reviews/archived_reviews.html', {
+        'owner_name': faculty.name,
+        'back_url': reverse('faculty_detail', args=[faculty.id]),
+        'page': page,
+    })
 
 
 def submit_review(request):
     """Submit a review (requires OTP verification)"""
     # Check if student is verified
-    verified_student_id = request.session.get('verified_student_id')
+    with tracing.span('session.lookup'):
+        verified_student_id = request.session.get('verified_student_id')
     
     if not verified_student_id:
         messages.error(request, 'Please verify your email first to submit a review.')
         return redirect('register')
     
     try:
-        student = Student.objects.get(id=verified_student_id)
+        with tracing.span('student.get'):
+            student = Student.objects.get(id=verified_student_id)
     except Student.DoesNotExist:
         messages.error(request, 'Student not found.')
         return redirect('register')
@@ -194,7 +250,10 @@ def submit_review(request):
         if selected_faculty:
             form.fields['faculty'].required = False
         
-        if form.is_valid():
+        with tracing.span('form.validate', form='ReviewForm'):
+            is_valid = form.is_valid()
+        
+        if is_valid:
             review = form.save(commit=False)
             
             # If faculty was pre-selected, use it (override form data)
@@ -210,9 +269,12 @@ def submit_review(request):
             review.tags = tags
             
             try:
-                review.save()
-                messages.success(request, 'Review submitted successfully!')
-                return redirect('faculty_detail', faculty_id=review.faculty.id)
+                with tracing.span('review.save'):
+                    saved = writebehind.save_review(review)
+                messages.success(request, 'Review submitted successfully!' if saved
+                                 else 'Review submitted! It will appear on the page in a moment.')
+                with tracing.span('redirect'):
+                    return redirect('faculty_detail', faculty_id=review.faculty.id)
             except Exception as e:
                 messages.error(request, f'Error saving review: {str(e)}')
         else:
@@ -237,48 +299,64 @@ def submit_review(request):
 
 
 def search_reviews(request):
-    """Search and filter reviews"""
-    search_query = request.GET.get('search', '')
-    faculty_filter = request.GET.get('faculty', '')
-    course_filter = request.GET.get('course', '')
-    department_filter = request.GET.get('department', '')
-    tag_filter = request.GET.get('tag', '')
-    
-    reviews = Review.objects.all()
-    
-    if search_query:
-        reviews = reviews.filter(
-            Q(description__icontains=search_query) |
-            Q(faculty__name__icontains=search_query)
-        )
+    """Search and filter reviews, with match counts for each filter option"""
+    filters = search.read_filters(request.GET)
     
-    if faculty_filter:
-        reviews = reviews.filter(faculty_id=faculty_filter)
-    
-    if course_filter:
-        reviews = reviews.filter(faculty__courses__id=course_filter)
-    
-    if department_filter:
-        reviews = reviews.filter(faculty__department_id=department_filter)
+    reviews = (search.filter_reviews(filters)
+               .select_related('faculty', 'student', 'question'))
+    page = Paginator(reviews, settings.SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
     
-    if tag_filter:
-        reviews = [r for r in reviews if tag_filter in r.tags]
+    # Keep the filters when moving between result pages
+    query = request.GET.copy()
+    query.pop('page', None)
     
     context = {
-        'reviews': reviews,
-        'faculties': Faculty.objects.all(),
-        'courses': Course.objects.all(),
-        'departments': Department.objects.all(),
-        'available_tags': [tag[0] for tag in Review.TAG_CHOICES],
-        'search_query': search_query,
-        'faculty_filter': faculty_filter,
-        'course_filter': course_filter,
-        'department_filter': department_filter,
-        'tag_filter': tag_filter,
+        'reviews': page,
+        'page': page,
+        'page_query': query.urlencode(),
+        'facets': search.get_facets(filters),
+        'search_query': filters['search'],
+        'faculty_filter': filters['faculty'],
+        'course_filter': filters['course'],
+        'department_filter': filters['department'],
+        'tag_filter': filters['tag'],
+        'rating_filter': filters['rating'],
     }
     return render(request, 'reviews/search_results.html', context)
 
 
+@vary_on_cookie
+def compare_faculty(request):
+    """Side-by-side comparison of up to COMPARE_MAX_FACULTY faculty members"""
+    ids = compare.parse_ids(request.GET.get('faculty', ''))
+    columns = compare.get_comparison(ids) if ids else []
+    for column in columns:
+        # Link that drops this faculty member from the comparison
+        column['without'] = ','.join(str(c['id']) for c in columns if c is not column)
+    response = render(request, 'reviews/compare.html', {
+        'columns': columns,
+        'max_faculty': compare.max_faculty(),
+    })
+    keys = [purge.faculty_key(c['id']) for c in columns] + [purge.department_key(c['department_id']) for c in columns]
+    return purge.tag_response(response, *dict.fromkeys(keys))
+
+
+@require_safe
+@condition(etag_func=freshness.ratings_lookup_etag, last_modified_func=freshness.ratings_lookup_last_modified)
+def ratings_lookup(request):
+    """JSON ratings of many faculty (?faculty=name or email) and courses (?course=code) at once"""
+    try:
+        result = lookup.lookup(request.GET.getlist('faculty'), request.GET.getlist('course'),
+                               build_url=request.build_absolute_uri)
+    except lookup.TooManyItems as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    response = JsonResponse(result, json_dumps_params={'ensure_ascii': False})
+    # Read-only public data, fetched by a browser extension from the registration portal's pages
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    # Every review write and admin edit purges this key
+    return purge.tag_response(response, purge.ALL_DEPARTMENTS_KEY)
+
+
 def logout_view(request):
     """Logout and clear session"""
     request.session.flush()
@@ -286,6 +364,8 @@ def logout_view(request):
     return redirect('home')
 
 
+@vary_on_cookie
+@condition(etag_func=freshness.course_list_etag, last_modified_func=freshness.course_list_last_modified)
 def course_list(request):
     """Course listing page with search and filter"""
     search_query = request.GET.get('search', '')
@@ -302,7 +382,7 @@ def course_list(request):
     if department_filter:
         courses = courses.filter(department_id=department_filter)
     
-    departments = Department.objects.all()
+    departments = refdata.departments()
     
     # Add average rating to each course
     course_list_data = []
@@ -319,9 +399,12 @@ def course_list(request):
         'search_query': search_query,
         'department_filter': department_filter,
     }
-    return render(request, 'reviews/course_list.html', context)
+    response = render(request, 'reviews/course_list.html', context)
+    return purge.tag_response(response, _listing_key(department_filter))
 
 
+@vary_on_cookie
+@condition(etag_func=freshness.course_etag, last_modified_func=freshness.course_last_modified)
 def course_detail(request, course_id):
     """Course detail page with reviews"""
     course = get_object_or_404(Course, id=course_id)
@@ -337,10 +420,52 @@ def course_detail(request, course_id):
         'reviews': reviews,
         'avg_rating': course.average_rating(),
         'total_reviews': course.total_reviews(),
+        'top_terms': get_top_terms(CourseKeywordSummary, course_id=course.id),
+        'question_scores': scores.course_scores(course.id),
+        'trend': terms.course_trend(course.id),
+        'teacher_ids': ','.join(map(str, course.faculty_members.order_by('id').values_list('id', flat=True))),
         'tag_filter': tag_filter,
-        'available_tags': [tag[0] for tag in CourseReview.TAG_CHOICES],
+        'available_tags': refdata.tag_names(CourseReview),
+        'live_since': live.since() if live.enabled() else None,
     }
-    return render(request, 'reviews/course_detail.html', context)
+    response = render(request, 'reviews/course_detail.html', context)
+    return purge.tag_response(
+        response, purge.course_key(course.id), purge.department_key(course.department_id)
+    )
+
+
+@vary_on_cookie
+@condition(etag_func=freshness.department_etag, last_modified_func=freshness.department_last_modified)
+def department_questions(request, department_id):
+    """Heatmap of mean points per question for a department's faculty or courses"""
+    department = refdata.get('department', department_id)
+    if department is None:
+        raise Http404('Department not found')
+    kind = request.GET.get('kind', 'faculty')
+    if kind not in scores.KINDS:
+        kind = 'faculty'
+    response = render(request, 'reviews/department_questions.html', {
+        'department': department,
+        'kind': kind,
+        'matrix': scores.department_matrix(department.id, kind),
+    })
+    return purge.tag_response(response, purge.department_key(department.id))
+
+
+def course_events(request, course_id):
+    """Server-Sent Events stream of new reviews of a course (served over ASGI)"""
+    return live.event_stream(request, purge.course_key(course_id))
+
+
+def course_archive(request, course_id):
+    """Older reviews of a course, read from the archive"""
+    course = get_object_or_404(Course, id=course_id)
+    page = archive.archived_page(ArchivedCourseReview, request.GET.get('page'), course_id=course.id)
+    return render(request, 'reviews/archived_reviews.html', {
+        'owner_name': f'{course.code} - {course.name}',
+        'back_url': reverse('course_detail', args=[course.id]),
+        'page': page,
+    })
 
 
 def submit_course_review(request):
@@ -363,9 +488,8 @@ def submit_course_review(request):
     selected_course = None
     
     if course_id:
-        try:
-            selected_course = Course.objects.get(id=course_id)
-        except Course.DoesNotExist:
+        selected_course = refdata.get('course', course_id)
+        if selected_course is None:
             messages.error(request, 'Course not found.')
             return redirect('course_list')
     
@@ -392,8 +516,9 @@ def submit_course_review(request):
             review.tags = tags
             
             try:
-                review.save()
-                messages.success(request, 'Course review submitted successfully!')
+                saved = writebehind.save_review(review)
+                messages.success(request, 'Course review submitted successfully!' if saved
+                                 else 'Course review submitted! It will appear on the page in a moment.')
                 return redirect('course_detail', course_id=review.course.id)
             except Exception as e:
                 messages.error(request, f'Error saving review: {str(e)}')
@@ -415,4 +540,58 @@ def submit_course_review(request):
         'student': student,
         'selected_course': selected_course,  # Pass to template to hide course field
     }
-    return render(request, 'reviews/submit_course_review.html', context)
\ No newline at end of file
+    return render(request, 'reviews/submit_course_review.html', context)
+
+
+@staff_member_required
+def profile_list(request):
+    """Staff page listing stored request profiles, newest first"""
+    return render(request, 'reviews/profile_list.html', {
+        'captures': profiling.list_captures(),
+        'query_param': profiling.QUERY_PARAM,
+    })
+
+
+@staff_member_required
+def profile_detail(request, capture_id):
+    """Summary and allocation snapshot of one stored request profile"""
+    capture = profiling.load_capture(capture_id)
+    if capture is None:
+        raise Http404('Profile not found')
+    return render(request, 'reviews/profile_detail.html', {'capture': capture})
+
+
+@staff_member_required
+def profile_download(request, capture_id, kind):
+    """Download the raw .prof (pstats) or .folded (flamegraph) file of a profile"""
+    path = profiling.capture_file_path(capture_id, kind)
+    if path is None:
+        raise Http404('Profile file not found')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{capture_id}.{kind}')
+
+
+@staff_member_required
+def analytics_dashboard(request):
+    """Staff page of rating distributions and trends per department and designation"""
+    kind = request.GET.get('kind', 'faculty')
+    if kind not in analytics.KINDS:
+        kind = 'faculty'
+    try:
+        stats, error = analytics.dashboard(kind), None
+    except (RuntimeError, FileNotFoundError) as exc:
+        stats, error = None, str(exc)
+    return render(request, 'reviews/analytics_dashboard.html', {
+        'stats': stats,
+        'error': error,
+        'kind': kind,
+        'percentiles': [f'p{q}' for q in analytics.PERCENTILES],
+    })
+
+
+def metrics_view(request):
+    """Prometheus exposition endpoint"""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if allowed_ips and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden('Forbidden')
+    body, content_type = metrics.exposition()
+    return HttpResponse(body, content_type=content_type)
@@ -0,0 +1,383 @@
+"""
+Write-behind buffering of review submissions.
+
+With WRITE_BEHIND on, a validated review is appended (and fsynced) to a
+journal file in WRITE_BEHIND_DIR and the student is answered at once; a
+background thread in each worker process saves the buffered reviews every
+WRITE_BEHIND_INTERVAL seconds, up to WRITE_BEHIND_BATCH_SIZE per
+transaction, so a burst costs one SQLite commit per batch instead of one
+per submission. Reviews are saved with ``save()``, so the usual signals
+(rollups, page invalidation) run as for a direct write.
+
+Each process writes its own journal segment and holds an exclusive lock on
+it. A segment whose lock can be taken belongs to a process that died; it is
+replayed when the next buffer starts, or with ``manage.py
+replay_review_journal``. Every entry carries a submission_id stored on the
+review (unique), so replaying entries that were already saved is harmless.
+
+A batch failing with anything but OperationalError (a locked or unreachable
+database, retried until it recovers) is saved entry by entry; an entry that
+fails WRITE_BEHIND_MAX_ATTEMPTS times (once, when replaying a journal) is
+moved to ``dead-letter.jsonl`` and logged, so it cannot hold up the entries
+behind it. ``replay_review_journal --dead-letter`` retries them once fixed.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import IntegrityError, OperationalError, connections
+
+from . import tenants
+from .models import CourseReview, Review
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MODELS = {'faculty': Review, 'course': CourseReview}
+FIELDS = ('student_id', 'question_id', 'description', 'points', 'tags', 'is_anonymous')
+OWNER_FIELDS = {'faculty': 'faculty_id', 'course': 'course_id'}
+
+# Start a new segment once the current one is fully saved and this large
+SEGMENT_BYTES = 4 * 1024 * 1024
+# Wait after a failed flush (e.g. "database is locked") before retrying
+RETRY_DELAY = 0.5
+# Raised by an entry that will never save, e.g. its faculty was deleted: full_clean()
+# rejects the missing relation, a foreign key constraint or a signal handler fails
+UNSAVEABLE = (IntegrityError, ValidationError, ObjectDoesNotExist)
+# Entries that kept failing, in journal format with the last error added
+DEAD_LETTER = 'dead-letter.jsonl'
+
+
+def enabled():
+    return getattr(settings, 'WRITE_BEHIND', False)
+
+
+def directory():
+    return str(getattr(settings, 'WRITE_BEHIND_DIR', os.path.join(settings.BASE_DIR, 'journal')))
+
+
+def entry_for(review):
+    """Journal entry of an unsaved Review or CourseReview"""
+    kind = 'course' if isinstance(review, CourseReview) else 'faculty'
+    fields = {name: getattr(review, name) for name in FIELDS + (OWNER_FIELDS[kind],)}
+    fields['created_at'] = review.created_at.isoformat()
+    return {'id': uuid.uuid4().hex, 'tenant': tenants.current().name, 'kind': kind, 'fields': fields}
+
+
+def _lock(fd):
+    """Take the segment's lock without waiting; False if a live process holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _build(entry):
+    fields = dict(entry['fields'])
+    fields['created_at'] = datetime.fromisoformat(fields['created_at'])
+    return MODELS[entry['kind']](submission_id=uuid.UUID(entry['id']), **fields)
+
+
+def save_entries(entries):
+    """
+    Save journal entries not saved yet, one transaction per tenant.
+
+    Entries that can no longer be saved (their faculty, course, student or
+    question was deleted meanwhile) are logged and dropped, the rest of the
+    batch is saved; database errors such as a lock timeout propagate so the
+    caller can retry. Returns the number saved.
+    """
+    by_tenant = {}
+    for entry in entries:
+        by_tenant.setdefault(entry['tenant'], []).append(entry)
+    saved = 0
+    for tenant_name, batch in by_tenant.items():
+        with tenants.activate(tenant_name):
+            try:
+                with tenants.atomic():
+                    saved += _save_batch(batch)
+            except UNSAVEABLE:
+                # Find the bad entries: save the rest one by one
+                for entry in batch:
+                    try:
+                        with tenants.atomic():
+                            saved += _save_batch([entry])
+                    except UNSAVEABLE as e:
+                        logger.error('Dropping buffered review %s: %s', entry['id'], e)
+    return saved
+
+
+def _save_batch(batch):
+    done = set()
+    for kind, model in MODELS.items():
+        ids = [uuid.UUID(entry['id']) for entry in batch if entry['kind'] == kind]
+        if ids:
+            done.update(model.objects.filter(submission_id__in=ids).values_list('submission_id', flat=True))
+    saved = 0
+    for entry in batch:
+        if uuid.UUID(entry['id']) not in done:
+            _build(entry).save()
+            saved += 1
+    return saved
+
+
+def dead_letter(folder, entry, error):
+    line = json.dumps(dict(entry, error=repr(error))) + '\n'
+    fd = os.open(os.path.join(folder, DEAD_LETTER), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    try:
+        os.write(fd, line.encode())
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    logger.error('Moved buffered review %s to %s: %r', entry['id'], os.path.join(folder, DEAD_LETTER), error)
+
+
+def save_or_isolate(entries, folder, attempts=None, max_attempts=1):
+    """
+    Save entries, one by one if the batch fails; returns (number saved, number to retry).
+
+    OperationalError propagates so the caller retries the batch later. Any
+    other failure counts as an attempt of the entry that raised it (in
+    ``attempts``, by entry id); an entry failing max_attempts times is moved
+    to the dead-letter file and skipped from then on.
+    """
+    attempts = {} if attempts is None else attempts
+    entries = [entry for entry in entries if attempts.get(entry['id'], 0) < max_attempts]
+    try:
+        return save_entries(entries), 0
+    except OperationalError:
+        raise
+    except Exception:
+        logger.exception('Saving %d buffered reviews failed; saving them one by one', len(entries))
+    saved = retry = 0
+    for entry in entries:
+        try:
+            saved += save_entries([entry])
+        except OperationalError:
+            raise
+        except Exception as e:
+            attempts[entry['id']] = attempts.get(entry['id'], 0) + 1
+            if attempts[entry['id']] >= max_attempts:
+                dead_letter(folder, entry, e)
+            else:
+                retry += 1
+    return saved, retry
+
+
+def read_segment(path):
+    """Entries of a journal segment; a torn last line (crash mid-write) is skipped"""
+    entries = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning('Skipping unreadable journal line in %s', path)
+    return entries
+
+
+def recover(path=None, batch_size=500):
+    """Replay journal segments left by dead processes; returns the number of reviews saved"""
+    folder = path or directory()
+    if not os.path.isdir(folder):
+        return 0
+    saved = 0
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith('.jsonl') or name == DEAD_LETTER:
+            continue
+        segment = os.path.join(folder, name)
+        fd = os.open(segment, os.O_RDWR)
+        try:
+            if not _lock(fd):
+                continue  # its process is alive and flushes it itself
+            entries = read_segment(segment)
+            for start in range(0, len(entries), batch_size):
+                # Its process retried these already: an entry still failing is dead-lettered at once
+                saved += save_or_isolate(entries[start:start + batch_size], folder)[0]
+            os.remove(segment)
+        finally:
+            os.close(fd)
+    if saved:
+        logger.info('Replayed %d buffered reviews from the journal', saved)
+    return saved
+
+
+def replay_dead_letters(path=None):
+    """Retry the dead-lettered entries once; returns (saved, still failing and dead-lettered again)"""
+    folder = path or directory()
+    dead = os.path.join(folder, DEAD_LETTER)
+    replaying = dead + '.replaying'
+    if not os.path.exists(replaying):
+        try:
+            os.rename(dead, replaying)
+        except FileNotFoundError:
+            return 0, 0
+    entries = read_segment(replaying)
+    for entry in entries:
+        entry.pop('error', None)
+    saved, failed = 0, {}
+    for start in range(0, len(entries), 100):
+        saved += save_or_isolate(entries[start:start + 100], folder, failed)[0]
+    os.remove(replaying)
+    return saved, len(failed)
+
+
+class WriteBehindBuffer:
+    """A process's journal segment plus the thread saving its entries in batches"""
+
+    def __init__(self, folder, interval=0.005, batch_size=500, fsync=True, max_attempts=5):
+        self.folder = folder
+        self.interval = interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        # Failed saves of each pending entry id (see save_or_isolate)
+        self.attempts = {}
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.stopping = False
+        os.makedirs(folder, exist_ok=True)
+        try:
+            recover(folder, batch_size)
+        except Exception:
+            # Start anyway; the segments left are replayed by the next buffer or replay_review_journal
+            logger.exception('Replaying the review journal failed')
+        self.sequence = 0
+        self.fd, self.path = self._open_segment()
+        self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def _open_segment(self):
+        self.sequence += 1
+        path = os.path.join(self.folder, f'journal-{os.getpid()}-{time.time_ns()}-{self.sequence}.jsonl')
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        _lock(fd)
+        return fd, path
+
+    def submit(self, review):
+        """Journal a validated, unsaved review; it is saved within a few milliseconds"""
+        if review.created_at is None:
+            review.created_at = review._meta.get_field('created_at').get_default()
+        entry = entry_for(review)
+        line = (json.dumps(entry) + '\n').encode()
+        with self.lock:
+            os.write(self.fd, line)
+            fd = self.fd
+            self.pending.append(entry)
+            self.wakeup.notify()
+        if self.fsync:
+            # Outside the lock, so concurrent submissions share the disk flushes
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass  # the segment was rotated away, so the entry is saved already
+        return entry['id']
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.stopping:
+                    self.wakeup.wait()
+                if self.stopping and not self.pending:
+                    break
+            # Let a burst accumulate into one batch
+            time.sleep(self.interval)
+            with self.lock:
+                batch = [self.pending[i] for i in range(min(self.batch_size, len(self.pending)))]
+            try:
+                retry = save_or_isolate(batch, self.folder, self.attempts, self.max_attempts)[1]
+            except Exception:
+                # The database is locked or unreachable: retry the whole batch, however long it takes
+                logger.exception('Saving %d buffered reviews failed; retrying', len(batch))
+                retry = len(batch)
+            if retry:
+                connections.close_all()
+                if self.stopping:
+                    break
+                time.sleep(RETRY_DELAY)
+                continue
+            with self.lock:
+                for entry in batch:
+                    self.pending.popleft()
+                    self.attempts.pop(entry['id'], None)
+                self._maybe_rotate()
+        connections.close_all()
+
+    def _maybe_rotate(self):
+        # Everything in the segment is saved once nothing is pending (lock held)
+        if self.pending or os.fstat(self.fd).st_size < SEGMENT_BYTES:
+            return
+        old_fd, old_path = self.fd, self.path
+        self.fd, self.path = self._open_segment()
+        os.remove(old_path)
+        os.close(old_fd)
+
+    def drain(self, timeout=None):
+        """Wait until everything submitted so far is saved; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(self.interval)
+        return True
+
+    def close(self, timeout=10):
+        """Save what is pending, stop the thread and remove the segment if it is fully saved"""
+        with self.lock:
+            self.stopping = True
+            self.wakeup.notify()
+        self.thread.join(timeout)
+        with self.lock:
+            if not self.pending:
+                os.remove(self.path)
+            os.close(self.fd)
+
+
+_buffer = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """This process's buffer, started on first use (and again after a fork)"""
+    global _buffer, _buffer_pid
+    if _buffer is None or _buffer_pid != os.getpid():
+        with _buffer_lock:
+            if _buffer is None or _buffer_pid != os.getpid():
+                _buffer = WriteBehindBuffer(
+                    directory(),
+                    interval=getattr(settings, 'WRITE_BEHIND_INTERVAL', 0.005),
+                    batch_size=getattr(settings, 'WRITE_BEHIND_BATCH_SIZE', 500),
+                    fsync=getattr(settings, 'WRITE_BEHIND_FSYNC', True),
+                    max_attempts=getattr(settings, 'WRITE_BEHIND_MAX_ATTEMPTS', 5),
+                )
+                _buffer_pid = os.getpid()
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def save_review(review):
+    """Save a submitted review now, or journal it when WRITE_BEHIND is on; True if it is saved already"""
+    if not enabled():
+        # One transaction with the summary updates, like a write-behind batch
+        with tenants.atomic():
+            review.save()
+        return True
+    get_buffer().submit(review)
+    return False